@@ -0,0 +1,63 @@
+"""
+Compare runtime, peak memory and table sizes of the default and compact schemas, each in a fresh subprocess.
+Usage: python3 benchmarks/compact_schema.py
+"""
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+
+from core.utils.config import SCHEMA
+from core.utils.storage import table_path
+
+SCHEMAS = ['compact', 'default']
+
+def _disk_bytes(key: str) -> int:
+    """Return the bytes on disk of the stage output FILEPATHS[key], a file or a partitioned dataset directory."""
+    path = table_path(key)
+    if path.is_file():
+        return path.stat().st_size
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names)
+
+def run_schema(schema: str) -> dict:
+    """Rebuild both stages with the given schema and return runtime, peak RSS and readings table sizes."""
+    SCHEMA['compact'] = schema == 'compact'
+
+    from core.pipeline.data_preprocessing import preprocess
+    from core.pipeline.feature_engineering import build_feature_dataset
+
+    start = time.perf_counter()
+    installations_preprocessed, readings_preprocessed = preprocess(preprocessed_current=False)
+    _, readings_feature_engineered = build_feature_dataset(
+        installations_preprocessed=installations_preprocessed,
+        readings_preprocessed=readings_preprocessed,
+        feature_engineered_current=False,
+    )
+
+    return {
+        'schema': schema,
+        'seconds': round(time.perf_counter() - start, 3),
+        'peak_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        'bytes_per_row': round(readings_feature_engineered.memory_usage(deep=True, index=False).sum() / len(readings_feature_engineered), 1),
+        'parquet_mb': round(_disk_bytes('readings_feature_engineered') / 2**20, 1),
+    }
+
+def main() -> None:
+    print(f'{"schema":<10}{"seconds":>10}{"peak_rss_mb":>14}{"bytes_per_row":>16}{"parquet_mb":>13}')
+    for schema in SCHEMAS:
+        output = subprocess.run(
+            [sys.executable, __file__, '--schema', schema],
+            check=True,
+            capture_output=True,
+            text=True,
+        ).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        print(f"{result['schema']:<10}{result['seconds']:>10}{result['peak_rss_mb']:>14}{result['bytes_per_row']:>16}{result['parquet_mb']:>13}")
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] == '--schema':
+        print(json.dumps(run_schema(sys.argv[2])))
+    else:
+        main()
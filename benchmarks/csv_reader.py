@@ -0,0 +1,62 @@
+"""
+Compare wall-clock time and peak memory of the raw csv readers, each in a fresh subprocess.
+Usage: python3 benchmarks/csv_reader.py [path/to/raw.csv]
+"""
+import json
+import resource
+import subprocess
+import sys
+import time
+
+import pandas as pd
+
+from core.utils.config import FILEPATHS, PREPROCESSING
+from core.utils.paths import from_root
+
+READERS = ['untyped', 'typed_c', 'typed_pyarrow', 'typed_pyarrow_chunked']
+
+def run_reader(reader: str, csv_path: str) -> dict:
+    """Read csv_path with the given reader and return its wall-clock time, peak RSS and row count."""
+    import core.pipeline.data_preprocessing as dp
+
+    FILEPATHS['raw_csv'] = csv_path
+    start = time.perf_counter()
+
+    if reader == 'untyped':
+        rows = len(pd.read_csv(csv_path).drop(columns=PREPROCESSING['drop_columns']))
+    elif reader == 'typed_c':
+        PREPROCESSING['csv_engine'] = 'c'
+        rows = len(dp.read_raw_csv())
+    elif reader == 'typed_pyarrow':
+        PREPROCESSING['csv_engine'] = 'pyarrow'
+        rows = len(dp.read_raw_csv())
+    elif reader == 'typed_pyarrow_chunked':
+        PREPROCESSING['csv_engine'] = 'pyarrow'
+        rows = sum(len(chunk) for chunk in dp.read_raw_csv_chunks(PREPROCESSING['chunk_size']))
+    else:
+        raise ValueError(f'Unknown reader: {reader}')
+
+    return {
+        'reader': reader,
+        'rows': rows,
+        'seconds': round(time.perf_counter() - start, 3),
+        'peak_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+
+def main(csv_path: str) -> None:
+    print(f'{"reader":<24}{"rows":>12}{"seconds":>10}{"peak_rss_mb":>14}')
+    for reader in READERS:
+        output = subprocess.run(
+            [sys.executable, __file__, '--reader', reader, csv_path],
+            check=True,
+            capture_output=True,
+            text=True,
+        ).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        print(f"{result['reader']:<24}{result['rows']:>12}{result['seconds']:>10}{result['peak_rss_mb']:>14}")
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] == '--reader':
+        print(json.dumps(run_reader(sys.argv[2], sys.argv[3])))
+    else:
+        main(sys.argv[1] if len(sys.argv) > 1 else str(from_root(FILEPATHS['raw_csv'])))
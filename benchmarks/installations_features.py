@@ -0,0 +1,61 @@
+"""
+Compare build_installations_features against the previous lambda-based aggregation.
+Usage: python3 benchmarks/installations_features.py
+"""
+import time
+
+import pandas as pd
+
+from core.pipeline.feature_engineering import build_installations_features
+from core.utils.storage import load_table
+from core.utils.validation import validate_installations_feature_engineered
+
+def build_installations_features_lambda(installations_preprocessed: pd.DataFrame) -> pd.DataFrame:
+    """Previous implementation, evaluating Python lambdas once per installation."""
+    cat_dtype = installations_preprocessed['community'].dtype
+
+    installations_feature_engineered = (
+        installations_preprocessed
+        .groupby('installation_id', as_index=False)
+        .agg(
+            community=('community', lambda x: x.mode()[0] if not x.mode().empty else None),
+            panels_reporting_max=('panels_reporting', 'max'),
+            panels_reporting_efficiency=('panels_reporting',
+                lambda x: (x == x.max()).sum() / len(x)
+            ),
+            panels_reporting_avg=('panels_reporting', 'mean'),
+        )
+    )
+
+    installations_feature_engineered['community'] = installations_feature_engineered['community'].astype(cat_dtype)
+
+    return installations_feature_engineered
+
+def time_call(func, *args) -> tuple[pd.DataFrame, float]:
+    """Return the result of func(*args) and its wall-clock time in seconds."""
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+def main() -> None:
+    installations_preprocessed = load_table('installations_preprocessed')
+    readings_preprocessed = load_table('readings_preprocessed')
+    installations_readings = readings_preprocessed[['installation_id', 'panels_reporting']].merge(
+        installations_preprocessed,
+        on='installation_id',
+        how='left',
+    )
+
+    expected, lambda_seconds = time_call(build_installations_features_lambda, installations_readings)
+    actual, vectorized_seconds = time_call(build_installations_features, installations_preprocessed, readings_preprocessed)
+
+    pd.testing.assert_frame_equal(actual, expected)
+    validate_installations_feature_engineered(actual)
+
+    print(f'rows: {len(readings_preprocessed)}, installations: {len(actual)}')
+    print(f'lambda:     {lambda_seconds:.3f}s')
+    print(f'vectorized: {vectorized_seconds:.3f}s')
+    print(f'speedup:    {lambda_seconds / vectorized_seconds:.1f}x')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,134 @@
+"""
+Measure how each pipeline function scales with the size of the raw csv, and report throughput regressions against a baseline.
+Usage: python3 benchmarks/pipeline_scaling.py [--scales 1 10 100] [--installations 10] [--days 30] [--output results.json] [--baseline results.json]
+"""
+import argparse
+import json
+import math
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from synthetic_data import generate_csv
+
+def run_scale(workdir: str, csv_path: str) -> dict:
+    """Run the pipeline and EDA plots on csv_path with stage outputs under workdir, and return per-function metrics."""
+    from core.utils.config import FILEPATHS, INSTRUMENTATION
+
+    # Redirect every stage output before the pipeline modules resolve any path
+    FILEPATHS.update({key: str(Path(workdir) / path) for key, path in FILEPATHS.items()})
+    FILEPATHS['raw_csv'] = csv_path
+    INSTRUMENTATION['enabled'] = True
+
+    from core.main import main
+    from core.utils.instrumentation import load_report, report_path
+
+    # Every stage, including the EDA plots
+    main()
+
+    report = load_report(report_path())
+    # Functions taking no dataframes are measured by the rows they return
+    report['rows'] = report['rows_in'].where(report['rows_in'].notna(), report['rows_out']).fillna(0)
+    functions = report.groupby('name').agg(
+        calls=('name', 'size'),
+        wall_seconds=('wall_seconds', 'sum'),
+        rows=('rows', 'sum'),
+        peak_rss_delta_bytes=('peak_rss_delta_bytes', 'max'),
+    )
+    functions['rows_per_second'] = functions['rows'] / functions['wall_seconds']
+
+    return {
+        'peak_rss_mb': round(report['peak_rss_bytes'].max() / 2**20, 1),
+        'functions': json.loads(functions.to_json(orient='index')),
+    }
+
+def benchmark_scale(scale: int, installations: int, days: int) -> dict:
+    """Generate the synthetic csv of scale and run the pipeline on it in a subprocess."""
+    with tempfile.TemporaryDirectory(prefix=f'pipeline-scaling-{scale}x-') as workdir:
+        csv_path = os.path.join(workdir, 'Solar_City_Micro_Inverters.csv')
+        rows = generate_csv(csv_path, installations * scale, days)
+
+        start = time.perf_counter()
+        output = subprocess.run(
+            [sys.executable, __file__, '--run', workdir, csv_path],
+            check=True,
+            capture_output=True,
+            text=True,
+            env={**os.environ, 'SOLAR_HRM_RUN_ID': f'pipeline-scaling-{scale}x'},
+        ).stdout
+        seconds = time.perf_counter() - start
+
+    return {'scale': scale, 'csv_rows': rows, 'seconds': round(seconds, 3), **json.loads(output.strip().splitlines()[-1])}
+
+def _scaling_exponent(smallest: dict, largest: dict) -> float | None:
+    """Return how wall time grows with rows between two scales: 1 is linear, 2 quadratic."""
+    if not (smallest['rows'] and largest['rows'] and smallest['wall_seconds'] and largest['wall_seconds']) or largest['rows'] == smallest['rows']:
+        return None
+    return math.log(largest['wall_seconds'] / smallest['wall_seconds']) / math.log(largest['rows'] / smallest['rows'])
+
+def print_results(results: list[dict]) -> None:
+    """Print the totals of each scale, then the throughput of each function at each scale and its scaling exponent."""
+    print(f'{"scale":>6}{"csv_rows":>12}{"seconds":>10}{"peak_rss_mb":>14}')
+    for result in results:
+        print(f"{str(result['scale']) + 'x':>6}{result['csv_rows']:>12}{result['seconds']:>10}{result['peak_rss_mb']:>14}")
+
+    largest = results[-1]['functions']
+    names = sorted(largest, key=lambda name: largest[name]['wall_seconds'], reverse=True)
+    print()
+    print(f'{"function":<60}' + ''.join(f"{'rows/s ' + str(result['scale']) + 'x':>16}" for result in results) + f'{"peak_mb":>10}{"exponent":>10}')
+    for name in names:
+        throughputs = ''.join(f"{result['functions'].get(name, {}).get('rows_per_second') or 0:>16,.0f}" for result in results)
+        exponent = _scaling_exponent(results[0]['functions'].get(name, largest[name]), largest[name]) if len(results) > 1 else None
+        print(
+            f"{name.removeprefix('core.'):<60}{throughputs}"
+            f"{largest[name]['peak_rss_delta_bytes'] / 2**20:>10.1f}{'' if exponent is None else f'{exponent:.2f}':>10}"
+        )
+
+def find_regressions(results: list[dict], baseline: list[dict], tolerance: float, min_seconds: float) -> list[str]:
+    """Describe each function whose throughput fell below (1 - tolerance) of the baseline's, skipping those under min_seconds."""
+    baseline_by_scale = {result['scale']: result['functions'] for result in baseline}
+    regressions = []
+    for result in results:
+        for name, metrics in result['functions'].items():
+            previous = baseline_by_scale.get(result['scale'], {}).get(name)
+            if not previous or previous['wall_seconds'] < min_seconds or not previous['rows_per_second'] or not metrics['rows_per_second']:
+                continue
+            ratio = metrics['rows_per_second'] / previous['rows_per_second']
+            if ratio < 1 - tolerance:
+                regressions.append(f"{name} at {result['scale']}x: {metrics['rows_per_second']:,.0f} rows/s, {ratio:.0%} of baseline")
+    return regressions
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Benchmark pipeline functions on synthetic data at several scales.')
+    parser.add_argument('--scales', type=int, nargs='+', default=[1, 10, 100])
+    parser.add_argument('--installations', type=int, default=10, help='installations at scale 1')
+    parser.add_argument('--days', type=int, default=30)
+    parser.add_argument('--output', help='save results to this json file')
+    parser.add_argument('--baseline', help='compare results with this json file saved by --output')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='throughput drop below the baseline reported as a regression')
+    parser.add_argument('--min-seconds', type=float, default=0.1, help='skip functions faster than this in the baseline')
+    args = parser.parse_args()
+
+    results = [benchmark_scale(scale, args.installations, args.days) for scale in sorted(args.scales)]
+    print_results(results)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=4)
+
+    if args.baseline:
+        with open(args.baseline, 'r') as f:
+            regressions = find_regressions(results, json.load(f), args.tolerance, args.min_seconds)
+        print()
+        print('\n'.join(regressions) if regressions else f'No function is more than {args.tolerance:.0%} slower than the baseline')
+        if regressions:
+            sys.exit(1)
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] == '--run':
+        print(json.dumps(run_scale(sys.argv[2], sys.argv[3])))
+    else:
+        main()
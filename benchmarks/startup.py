@@ -0,0 +1,91 @@
+"""
+Measure the startup time of the pipeline's entry points and module imports against their targets.
+Usage: python3 benchmarks/startup.py [--repeat 7]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+SRC_DIR = Path(__file__).resolve().parents[1] / 'src'
+
+# Libraries that modules must import inside the functions that use them
+LAZY_LIBRARIES = ['matplotlib', 'duckdb']
+
+STAGE_MODULES = [
+    'core.pipeline.data_preprocessing',
+    'core.pipeline.feature_engineering',
+    'core.pipeline.reporting_index',
+    'core.pipeline.exploratory_data_analysis',
+]
+
+# Arguments of each measured command, after the python executable
+COMMANDS = {
+    'python': ['-c', 'pass'],
+    'import pandas': ['-c', 'import pandas'],
+    'python -m core.main --help': ['-m', 'core.main', '--help'],
+    'import core.utils.config': ['-c', 'import core.utils.config'],
+    **{f'import {module}': ['-c', f'import {module}'] for module in STAGE_MODULES},
+}
+
+# Most seconds each command may take over its reference command
+TARGETS = {
+    'python -m core.main --help': ('python', 0.15),
+    'import core.utils.config': ('python', 0.1),
+    **{f'import {module}': ('import pandas', 0.3) for module in STAGE_MODULES},
+}
+
+def _run(args: list[str]) -> tuple[float, str]:
+    """Run python with args in a fresh interpreter that can import core, and return its wall time and stdout."""
+    env = {**os.environ, 'PYTHONPATH': os.pathsep.join(filter(None, [str(SRC_DIR), os.environ.get('PYTHONPATH')]))}
+    start = time.perf_counter()
+    output = subprocess.run([sys.executable, *args], check=True, capture_output=True, text=True, env=env).stdout
+    return time.perf_counter() - start, output
+
+def measure_startup(repeat: int) -> dict[str, float]:
+    """Return the median wall time of each command over repeat runs, after one warm-up run to fill the page cache."""
+    medians = {}
+    for name, args in COMMANDS.items():
+        _run(args)
+        medians[name] = statistics.median(_run(args)[0] for _ in range(repeat))
+    return medians
+
+def find_import_side_effects() -> list[str]:
+    """Return a description of each module that prints or loads a lazy library when imported."""
+    side_effects = []
+    for module in ['core.main', 'core.utils.config', *STAGE_MODULES]:
+        _, printed = _run(['-c', f'import {module}'])
+        _, loaded = _run(['-c', f'import sys, json, {module}; print(json.dumps([name for name in {LAZY_LIBRARIES!r} if name in sys.modules]))'])
+        if printed:
+            side_effects.append(f'import {module} prints {printed.strip()!r}')
+        for library in json.loads(loaded):
+            side_effects.append(f'import {module} loads {library}')
+    return side_effects
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Benchmark the startup time of the pipeline entry points.')
+    parser.add_argument('--repeat', type=int, default=7, help='runs of each command to take the median of')
+    args = parser.parse_args()
+
+    medians = measure_startup(args.repeat)
+    misses = find_import_side_effects()
+
+    print(f'{"command":<55}{"seconds":>10}{"overhead":>10}{"target":>10}')
+    for name, seconds in medians.items():
+        reference, target = TARGETS.get(name, (None, None))
+        overhead = seconds - medians[reference] if reference else None
+        print(f"{name:<55}{seconds:>10.3f}{'' if overhead is None else f'{overhead:.3f}':>10}{'' if target is None else f'{target:.3f}':>10}")
+        if target is not None and overhead > target:
+            misses.append(f'{name} takes {overhead:.3f}s over {reference}, target {target:.3f}s')
+
+    print()
+    print('\n'.join(misses) if misses else 'Every entry point meets its startup target')
+    if misses:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
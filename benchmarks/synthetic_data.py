@@ -0,0 +1,120 @@
+"""
+Generate synthetic data shaped like Solar_City_Micro_Inverters.csv, for benchmarks that cannot pull the real git-LFS csv.
+Usage: python3 benchmarks/synthetic_data.py path/to/output.csv [--installations 10] [--days 30] [--seed 0]
+"""
+import argparse
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+
+# Community names as they appear in the raw csv, including the spellings corrected by preprocessing
+COMMUNITIES = ['Halifax', 'Dartmouth', 'dartmouth', 'Bedford', 'Sackville', 'Musquodoboit Harbour', 'Musquodoboit Harb']
+FORWARD_SORTATION_AREAS = ['B3H', 'B3K', 'B2Y', 'B4A', 'B4C', 'B0J']
+
+READING_INTERVAL_MINUTES = 5
+READINGS_PER_DAY = 24 * 60 // READING_INTERVAL_MINUTES
+PANEL_WATTS = 250
+
+def _installation_readings(rng: np.random.Generator, installation_id: int, timestamps: np.ndarray) -> pd.DataFrame:
+    """Return the readings of one installation over the 5-minute grid timestamps, before dropout."""
+    days = len(timestamps) // READINGS_PER_DAY
+    panels = rng.integers(8, 31)
+    day_of_year = pd.DatetimeIndex(timestamps[::READINGS_PER_DAY]).dayofyear.to_numpy()
+
+    # Hours of daylight at 44.6 N, from about 9 in December to 15.5 in June
+    daylight_hours = 12.25 + 3.25 * np.sin(2 * np.pi * (day_of_year - 80) / 365)
+    sunrise = 12.5 - daylight_hours / 2
+    hour_of_day = (np.arange(len(timestamps)) % READINGS_PER_DAY) * READING_INTERVAL_MINUTES / 60
+    sun = (hour_of_day - np.repeat(sunrise, READINGS_PER_DAY)) / np.repeat(daylight_hours, READINGS_PER_DAY)
+    daylight = (sun > 0) & (sun < 1)
+    elevation = np.sin(np.pi * np.clip(sun, 0, 1))
+
+    # Panels come online as the sun rises, and some installations lose panels for good partway through
+    panels_available = np.full(len(timestamps), panels)
+    if rng.random() < 0.2:
+        panels_available[rng.integers(len(timestamps)):] -= rng.integers(1, panels // 2 + 1)
+    panels_reporting = np.minimum(panels_available, np.ceil(panels_available * elevation * 4)).astype(np.int64)
+
+    cloudiness = np.repeat(rng.beta(2, 1.5, size=days), READINGS_PER_DAY)
+    watts = panels_reporting * PANEL_WATTS * elevation ** 1.3 * cloudiness * rng.normal(1, 0.05, size=len(timestamps))
+
+    return pd.DataFrame({
+        'SYSTEM_ID': installation_id,
+        'timestamp': timestamps,
+        'PANELS_REPORTING_MICRO_INVERTER': panels_reporting,
+        'WATTS': np.maximum(watts, 0),
+    })[daylight & (panels_reporting > 0)]
+
+def _dropout_mask(rng: np.random.Generator, timestamps: pd.Series, start: pd.Timestamp, days: int) -> np.ndarray:
+    """Return which readings of an installation survive random dropout, outages and decommissioning."""
+    elapsed_days = ((timestamps - start) / pd.Timedelta('1D')).to_numpy()
+    keep = rng.random(len(timestamps)) > 0.01
+
+    # Outages of 1 to 10 days, about one per installation per 100 days
+    for outage_start in rng.uniform(0, days, size=rng.poisson(days / 100)):
+        keep &= ~((elapsed_days >= outage_start) & (elapsed_days < outage_start + rng.integers(1, 11)))
+
+    # A third of installations are decommissioned in the last fifth of the period
+    if rng.random() < 1 / 3:
+        keep &= elapsed_days < rng.uniform(0.8, 1) * days
+
+    return keep
+
+def generate_readings(installations: int, days: int, start: str = '2021-01-01', seed: int = 0) -> pd.DataFrame:
+    """Generate the synthetic raw readings of installations over days, in the column layout of the raw csv."""
+    rng = np.random.default_rng(seed)
+    start = pd.Timestamp(start)
+    timestamps = pd.date_range(start, periods=days * READINGS_PER_DAY, freq=f'{READING_INTERVAL_MINUTES}min').to_numpy()
+
+    frames = []
+    for installation_id in range(1000, 1000 + installations):
+        readings = _installation_readings(rng, installation_id, timestamps)
+        frames.append(readings[_dropout_mask(rng, readings['timestamp'], start, days)])
+    readings = pd.concat(frames, ignore_index=True)
+
+    communities = rng.integers(len(COMMUNITIES), size=installations)[readings['SYSTEM_ID'].to_numpy() - 1000]
+    readings['COMMUNITY_NAME'] = pd.Categorical.from_codes(communities, COMMUNITIES)
+    readings['FORWARD_SORTATION_AREA'] = pd.Categorical.from_codes(communities % len(FORWARD_SORTATION_AREAS), FORWARD_SORTATION_AREAS)
+    readings['WATT_HOUR'] = readings['WATTS'] * READING_INTERVAL_MINUTES / 60
+    readings['KILOWATT_HOUR'] = readings['WATT_HOUR'] / 1000
+
+    # Shuffle rows, as the raw csv is not ordered by installation or time
+    return readings.sample(frac=1, random_state=seed, ignore_index=True)
+
+def write_readings_csv(readings: pd.DataFrame, path: str) -> None:
+    """Write synthetic readings to path in the column order and date format of the raw csv."""
+    table = pa.Table.from_pandas(readings, preserve_index=False)
+    # Format each distinct grid timestamp once
+    codes, timestamps = pd.factorize(readings['timestamp'])
+    dates = pa.array(timestamps.strftime('%Y.%m.%d %H:%M:%S')).take(pa.array(codes))
+    table = pa.table({
+        'SYSTEM_ID': table['SYSTEM_ID'],
+        'DATE': dates,
+        'PANELS_REPORTING_MICRO_INVERTER': table['PANELS_REPORTING_MICRO_INVERTER'],
+        'WATTS': table['WATTS'],
+        'WATT_HOUR': table['WATT_HOUR'],
+        'KILOWATT_HOUR': table['KILOWATT_HOUR'],
+        'COMMUNITY_NAME': table['COMMUNITY_NAME'].cast(pa.string()),
+        'FORWARD_SORTATION_AREA': table['FORWARD_SORTATION_AREA'].cast(pa.string()),
+    })
+    pa_csv.write_csv(table, path, write_options=pa_csv.WriteOptions(quoting_style='none'))
+
+def generate_csv(path: str, installations: int, days: int, start: str = '2021-01-01', seed: int = 0) -> int:
+    """Generate a synthetic raw csv at path and return its number of rows."""
+    readings = generate_readings(installations, days, start=start, seed=seed)
+    write_readings_csv(readings, path)
+    return len(readings)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Generate a synthetic Solar_City_Micro_Inverters csv.')
+    parser.add_argument('path')
+    parser.add_argument('--installations', type=int, default=10)
+    parser.add_argument('--days', type=int, default=30)
+    parser.add_argument('--start', default='2021-01-01')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    rows = generate_csv(args.path, args.installations, args.days, start=args.start, seed=args.seed)
+    print(f'Wrote {rows} rows to {args.path}')
@@ -1,51 +1,78 @@
-import os
+"""Entry point of the pipeline. Usage: python3 -m core.main [--incremental | --only STAGE ... | --from STAGE]"""
+import argparse
 
-import pandas as pd
-
-from core.pipeline.data_preprocessing import preprocess, check_preprocessed_parquets_exist
-from core.pipeline.feature_engineering import build_feature_dataset, check_feature_engineered_parquets_exist
-from core.utils import pd_config
-from core.utils.config import FILEPATHS
+from core.pipeline.dag import STAGE_NAMES
+from core.utils.instrumentation import instrument, report_path
+from core.utils.logger import info
 from core.utils.paths import from_root
 
-def main():
-    print(f'Initiating pipeline...')
+# Tables summarized after a run, when a stage of the run wrote them
+SUMMARY_TABLES = [
+    'installations_preprocessed',
+    'readings_preprocessed',
+    'installations_feature_engineered',
+    'readings_feature_engineered',
+    'reporting_intervals',
+]
 
-    # Data preprocessing
-    installations_preprocessed, readings_preprocessed = preprocess(
-        preprocessed_exists=check_preprocessed_parquets_exist()
-    )
+@instrument
+def main(only: list[str] | None = None, start: str | None = None):
+    """Run the stages named in only, or stage start and every stage downstream of it, or every stage."""
+    from core.pipeline.dag import run_stages, select_stages
+    from core.utils.profiling import print_profile
+    from core.utils.storage import table_profile
+
+    stages = select_stages(only=only, start=start)
+    print(f"Initiating pipeline stages {', '.join(stage.name for stage in stages)}...")
+
+    run_stages(stages)
+
+    written = {key for stage in stages for key in stage.outputs}
+    for key in SUMMARY_TABLES:
+        if key in written:
+            print_profile(key, table_profile(key))
+
+@instrument
+def update():
+    """Append readings newer than each installation's latest processed reading, or run the full pipeline if the outputs are stale."""
+    from core.pipeline.data_preprocessing import append_new_readings, check_preprocessed_parquets_appendable
+    from core.pipeline.feature_engineering import append_feature_dataset, check_feature_engineered_parquets_appendable
+    from core.pipeline.reporting_index import append_reporting_index, check_reporting_index_appendable
+
+    print(f'Initiating incremental update...')
 
-    print(f'------------------------------------------------')
-    print(f'| installations_preprocessed (count: {len(installations_preprocessed)}) |')
-    print(f'------------------------------------------------')
-    for col in installations_preprocessed.columns:
-        print(f'Column: {col} [{installations_preprocessed[col].dtype}] [num_unique: {installations_preprocessed[col].nunique()}] [num_NA: {installations_preprocessed[col].isna().sum()}]')
-
-    print(f'-------------------------------------------')
-    print(f'| readings_preprocessed (count: {len(readings_preprocessed)}) |')
-    print(f'-------------------------------------------')
-    for col in readings_preprocessed.columns:
-        print(f'Column: {col} [{readings_preprocessed[col].dtype}] [num_unique: {readings_preprocessed[col].nunique()}] [num_NA: {readings_preprocessed[col].isna().sum()}]')
-
-    # Feature engineering
-    installations_feature_engineered, readings_feature_engineered = build_feature_dataset(
-        feature_engineered_exists=check_feature_engineered_parquets_exist(),
+    if not (check_preprocessed_parquets_appendable() and check_feature_engineered_parquets_appendable() and check_reporting_index_appendable()):
+        info(f'Stage outputs cannot be appended to \U00002014 running full pipeline instead...')
+        main()
+        return
+
+    installations_preprocessed, new_readings_preprocessed = append_new_readings()
+    installations_feature_engineered, new_readings_feature_engineered = append_feature_dataset(
         installations_preprocessed=installations_preprocessed,
-        readings_preprocessed=readings_preprocessed,
+        new_readings_preprocessed=new_readings_preprocessed,
     )
+    reporting_intervals = append_reporting_index(new_readings_preprocessed)
 
     print(f'-------------------------------------------------')
     print(f'| installations_feature_engineered (count: {len(installations_feature_engineered)}) |')
+    print(f'| new readings_feature_engineered (count: {len(new_readings_feature_engineered)}) |')
+    print(f'| reporting_intervals (count: {len(reporting_intervals)}) |')
     print(f'-------------------------------------------------')
-    for col in installations_feature_engineered.columns:
-        print(f'Column: {col} [{installations_feature_engineered[col].dtype}] [num_unique: {installations_feature_engineered[col].nunique()}] [num_NA: {installations_feature_engineered[col].isna().sum()}]')
-
-    print(f'-------------------------------------------------')
-    print(f'| readings_feature_engineered (count: {len(readings_feature_engineered)}) |')
-    print(f'-------------------------------------------------')
-    for col in readings_feature_engineered.columns:
-        print(f'Column: {col} [{readings_feature_engineered[col].dtype}] [num_unique: {readings_feature_engineered[col].nunique()}] [num_NA: {readings_feature_engineered[col].isna().sum()}]')
 
 if __name__ == '__main__':
-    main()
+    parser = argparse.ArgumentParser(description='Run the solar readings pipeline.')
+    targets = parser.add_mutually_exclusive_group()
+    targets.add_argument('--incremental', action='store_true', help='append only readings newer than the last run')
+    targets.add_argument('--only', nargs='+', choices=STAGE_NAMES, metavar='STAGE', help=f"run only these stages, of {', '.join(STAGE_NAMES)}")
+    targets.add_argument('--from', dest='start', choices=STAGE_NAMES, metavar='STAGE', help='run this stage and every stage downstream of it')
+    args = parser.parse_args()
+
+    from core.utils.pd_config import set_pandas_display_options
+
+    set_pandas_display_options()
+    if args.incremental:
+        update()
+    else:
+        main(only=args.only, start=args.start)
+
+    info(f'\U00002705 Run report written to {report_path().relative_to(from_root())}', log=True)
@@ -0,0 +1,128 @@
+"""Dependency-aware runner of the pipeline stages, running independent stages concurrently in threads."""
+import contextvars
+import threading
+from collections import Counter
+from collections.abc import Callable
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+class Stage:
+    """A pipeline stage, run with a function loading its input tables by FILEPATHS key and returning the tables it built."""
+
+    def __init__(self, name: str, inputs: list[str], outputs: list[str], run: Callable):
+        self.name = name
+        self.inputs = inputs
+        self.outputs = outputs
+        self.run = run
+
+def _run_preprocessing(table: Callable) -> dict[str, 'pd.DataFrame']:
+    from core.pipeline.data_preprocessing import check_preprocessed_parquets_current, preprocess
+
+    installations_preprocessed, readings_preprocessed = preprocess(preprocessed_current=check_preprocessed_parquets_current())
+    return {'installations_preprocessed': installations_preprocessed, 'readings_preprocessed': readings_preprocessed}
+
+def _run_feature_engineering(table: Callable) -> dict[str, 'pd.DataFrame']:
+    import pandas as pd
+
+    from core.pipeline.feature_engineering import build_feature_dataset, check_feature_engineered_parquets_current
+
+    # Current outputs are read from storage, so their inputs are only needed for a rebuild
+    feature_engineered_current = check_feature_engineered_parquets_current()
+    installations_feature_engineered, readings_feature_engineered = build_feature_dataset(
+        installations_preprocessed=pd.DataFrame() if feature_engineered_current else table('installations_preprocessed'),
+        readings_preprocessed=pd.DataFrame() if feature_engineered_current else table('readings_preprocessed'),
+        feature_engineered_current=feature_engineered_current,
+    )
+    return {'installations_feature_engineered': installations_feature_engineered, 'readings_feature_engineered': readings_feature_engineered}
+
+def _run_reporting_index(table: Callable) -> dict[str, 'pd.DataFrame']:
+    import pandas as pd
+
+    from core.pipeline.reporting_index import REPORTING_INDEX_SOURCE_COLUMNS, build_reporting_index, check_reporting_index_current
+
+    reporting_index_current = check_reporting_index_current()
+    readings_preprocessed = (
+        pd.DataFrame(columns=REPORTING_INDEX_SOURCE_COLUMNS) if reporting_index_current
+        else table('readings_preprocessed', columns=REPORTING_INDEX_SOURCE_COLUMNS)
+    )
+    return {'reporting_intervals': build_reporting_index(readings_preprocessed, reporting_index_current=reporting_index_current)}
+
+def _run_eda(table: Callable) -> dict[str, 'pd.DataFrame']:
+    from core.pipeline.exploratory_data_analysis import plot_eda_figures
+
+    plot_eda_figures(table('community_daily'))
+    return {}
+
+# Stages of the pipeline in an order that runs every stage after the stages writing its inputs
+STAGES = [
+    Stage('preprocessing', ['raw_csv'], ['installations_preprocessed', 'readings_preprocessed'], _run_preprocessing),
+    Stage(
+        'feature_engineering',
+        ['installations_preprocessed', 'readings_preprocessed'],
+        ['installations_feature_engineered', 'readings_feature_engineered', 'community_daily'],
+        _run_feature_engineering,
+    ),
+    Stage('reporting_index', ['readings_preprocessed'], ['reporting_intervals'], _run_reporting_index),
+    Stage('eda', ['community_daily'], ['panels_reporting', 'energy_production'], _run_eda),
+]
+
+STAGE_NAMES = [stage.name for stage in STAGES]
+
+def select_stages(only: list[str] | None = None, start: str | None = None) -> list[Stage]:
+    """Return the stages named in only, or stage start and every stage downstream of it, or every stage, in pipeline order."""
+    unknown = {*(only or []), *([start] if start else [])} - set(STAGE_NAMES)
+    if unknown:
+        raise ValueError(f'Unknown stages {sorted(unknown)}, expected some of {STAGE_NAMES}')
+    if only:
+        return [stage for stage in STAGES if stage.name in only]
+    if start is None:
+        return list(STAGES)
+
+    selected, written = [], set()
+    for stage in STAGES[STAGE_NAMES.index(start):]:
+        if stage.name == start or written.intersection(stage.inputs):
+            selected.append(stage)
+            written.update(stage.outputs)
+    return selected
+
+def run_stages(stages: list[Stage]) -> None:
+    """Run stages in threads, each as soon as the stages among them writing its inputs have finished."""
+    from core.utils.storage import load_table
+
+    writers = {key: stage.name for stage in stages for key in stage.outputs}
+    upstream = {stage.name: {writers[key] for key in stage.inputs if key in writers} - {stage.name} for stage in stages}
+    # Stages yet to read each table, so that its dataframe is released after the last of them
+    readers = Counter(key for stage in stages for key in stage.inputs)
+    frames = {}
+    frames_lock = threading.Lock()
+
+    def table(key: str, columns: list[str] | None = None) -> 'pd.DataFrame':
+        """Return the table key passed on by an upstream stage, or load it from storage."""
+        with frames_lock:
+            frame = frames.get(key)
+        if frame is None:
+            return load_table(key, columns=columns)
+        return frame if columns is None else frame[columns]
+
+    pending, finished, running = list(stages), set(), {}
+    with ThreadPoolExecutor(max_workers=max(len(stages), 1), thread_name_prefix='stage') as pool:
+        while pending or running:
+            for stage in [stage for stage in pending if upstream[stage.name] <= finished]:
+                pending.remove(stage)
+                # Run in a copy of this context, so instrumented calls of the stage are nested in the caller's
+                running[pool.submit(contextvars.copy_context().run, stage.run, table)] = stage
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                stage = running.pop(future)
+                outputs = future.result()
+                finished.add(stage.name)
+                with frames_lock:
+                    frames.update({key: frame for key, frame in outputs.items() if readers[key]})
+                    for key in stage.inputs:
+                        readers[key] -= 1
+                        if not readers[key]:
+                            frames.pop(key, None)
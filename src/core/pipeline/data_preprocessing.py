@@ -1,17 +1,81 @@
-import os
+from collections.abc import Iterator
+from datetime import datetime
+
 import pandas as pd
 
-from core.utils import pd_config
-from core.utils.config import FILEPATHS, PREPROCESSING
+from core.utils.aggregation import most_frequent_category
+from core.utils.cache import invalidate_stage, is_stage_appendable, is_stage_current, record_stage, stage_fingerprint
+from core.utils.communities import correct_community_names, encode_communities, register_communities
+from core.utils.config import BACKEND, FILEPATHS, PREPROCESSING
+from core.utils.instrumentation import instrument
 from core.utils.logger import info
+from core.utils.parallel import map_shards, shard_count, shard_pool, split_installation_shards, worker_count
 from core.utils.paths import from_root
+from core.utils.pd_config import set_pandas_display_options
+from core.utils.profiling import print_profile
+from core.utils.schema import column_dtype
+from core.utils.storage import (
+    ParquetAppender,
+    load_table,
+    partition_columns,
+    read_csv_chunks_pyarrow,
+    read_csv_pyarrow,
+    save_table,
+    storage_format,
+    table_profile,
+)
+from core.utils.timestamps import parse_fixed_width_timestamps
 from core.utils.utils import create_clean_directory, ensure_dataframe
-from core.utils.validation import validate_cleaned_unpartitioned, validate_installations_preprocessed, validate_readings_preprocessed
+from core.utils.validation import (
+    validate_cleaned_unpartitioned,
+    validate_installations_preprocessed,
+    validate_parquet_statistics,
+    validate_readings_preprocessed,
+)
+
+# Stage outputs written by preprocess
+PREPROCESSED_OUTPUTS = [
+    'raw_parquet',
+    'cleaned_unpartitioned',
+    'installations_preprocessed',
+    'readings_preprocessed',
+    'installation_communities',
+    'installation_watermarks',
+    'community_codes',
+]
+
+# Stage outputs that new readings are appended to in incremental mode, and that workers write shards of
+APPENDED_OUTPUTS = SHARDED_OUTPUTS = ['cleaned_unpartitioned', 'readings_preprocessed']
+
+# Configuration and code the preprocessed parquets depend on
+PREPROCESSING_CONFIG_SECTIONS = ['preprocessing', 'storage', 'schema', 'backend']
+PREPROCESSING_MODULES = [
+    'core.pipeline.data_preprocessing',
+    'core.pipeline.duckdb_backend',
+    'core.utils.aggregation',
+    'core.utils.communities',
+    'core.utils.parallel',
+    'core.utils.schema',
+    'core.utils.storage',
+    'core.utils.timestamps',
+    'core.utils.validation',
+]
+
+# Rows read at a time by incremental runs when preprocessing.chunk_size is not configured
+PREPROCESSING_APPEND_CHUNK_SIZE = 1_000_000
+
+# Columns of the readings fact table
+READINGS_COLUMNS = [
+    'installation_id',
+    'timestamp',
+    'panels_reporting',
+    'avg_power_watts_5min',
+]
 
 @ensure_dataframe
 def drop_unused_columns(solar_data: pd.DataFrame) -> pd.DataFrame:
-    """Drop unused columns specified in config.json."""
-    return solar_data.drop(columns=PREPROCESSING['drop_columns'])
+    """Drop unused columns specified in config.json if they were not already skipped at read time."""
+    return solar_data.drop(columns=PREPROCESSING['drop_columns'], errors='ignore')
 
 @ensure_dataframe
 def rename_columns(solar_data: pd.DataFrame) -> pd.DataFrame:
@@ -25,52 +89,251 @@ def drop_null_composite_key_combinations(solar_data: pd.DataFrame) -> pd.DataFra
 
 @ensure_dataframe
 def standardize_column_text(solar_data: pd.DataFrame) -> pd.DataFrame:
-    """Standardize column text strings."""
-    solar_data['community'] = solar_data['community'].replace(PREPROCESSING['community_name_corrections'])
+    """Standardize column text strings, correcting community names on the categories rather than on every row."""
+    solar_data['community'] = correct_community_names(solar_data['community'])
     return solar_data
 
 @ensure_dataframe
 def modify_column_dtypes(solar_data: pd.DataFrame) -> pd.DataFrame:
-    """Convert dtype object columns to proper dtype."""
-    solar_data['timestamp'] = pd.to_datetime(
+    """Convert dtype object columns to proper dtype, or to the compact schema if it is enabled in config.json."""
+    solar_data['timestamp'] = parse_fixed_width_timestamps(
         solar_data['timestamp'],
-        format=PREPROCESSING['date_format'],
-        errors='coerce',
+        date_format=PREPROCESSING['date_format'],
     )
 
-    solar_data['avg_power_watts_5min'] = solar_data['avg_power_watts_5min'].astype('float')
-    solar_data['community'] = solar_data['community'].astype('category')
+    solar_data['installation_id'] = solar_data['installation_id'].astype(column_dtype('installation_id', 'int64'))
+    solar_data['panels_reporting'] = solar_data['panels_reporting'].astype(column_dtype('panels_reporting', 'int64'))
+    solar_data['avg_power_watts_5min'] = solar_data['avg_power_watts_5min'].astype(column_dtype('avg_power_watts_5min', 'float64'))
 
     return solar_data
 
 @ensure_dataframe
-def partition_solar_data(solar_data: pd.DataFrame) -> tuple[pd.DataFrame, pd.DataFrame]:
-    """Decompose dataframe solar_data into two dataframes with a one-to-many relationship."""
-    # Construct dataframe representing solar panel installations
-    installations = (
-        solar_data[[
-            'installation_id',
-            'panels_reporting',
-            'community',
-        ]]
-        .copy()
+def count_installation_communities(solar_data: pd.DataFrame) -> pd.DataFrame:
+    """Count the readings of each combination of installation_id and community."""
+    return (
+        solar_data
+        .groupby(['installation_id', 'community'], observed=True, dropna=False)
+        .size()
+        .reset_index(name='readings_count')
     )
 
-    # Construct dataframe representing meter readings
-    readings = (
-        solar_data[[
-            'installation_id',
-            'timestamp',
-            'avg_power_watts_5min',
-        ]]
-        .copy()
+@ensure_dataframe
+def merge_installation_communities(*installation_communities: pd.DataFrame) -> pd.DataFrame:
+    """Sum readings counts per installation_id and community over several count tables."""
+    return (
+        pd.concat(installation_communities, ignore_index=True)
+        .groupby(['installation_id', 'community'], observed=True, dropna=False)['readings_count']
+        .sum()
+        .reset_index()
+        .astype({'community': 'category'})
+    )
+
+@ensure_dataframe
+def latest_reading_timestamps(readings: pd.DataFrame) -> pd.DataFrame:
+    """Return the timestamp of the latest reading of each installation."""
+    return (
+        readings
+        .groupby('installation_id', as_index=False)['timestamp']
+        .max()
+        .rename(columns={'timestamp': 'last_timestamp'})
     )
 
+@ensure_dataframe
+def merge_installation_watermarks(*installation_watermarks: pd.DataFrame) -> pd.DataFrame:
+    """Take the latest of the latest reading timestamps of each installation over several tables."""
+    return (
+        pd.concat(installation_watermarks, ignore_index=True)
+        .groupby('installation_id', as_index=False)['last_timestamp']
+        .max()
+    )
+
+@ensure_dataframe
+def select_new_readings(solar_data: pd.DataFrame, installation_watermarks: pd.DataFrame) -> pd.DataFrame:
+    """Keep the rows newer than the latest processed reading of their installation, and every row of new installations."""
+    last_timestamps = solar_data['installation_id'].map(
+        installation_watermarks.set_index('installation_id')['last_timestamp']
+    )
+    return solar_data[last_timestamps.isna() | (solar_data['timestamp'] > last_timestamps)]
+
+@ensure_dataframe
+def build_installations_dimension(installation_communities: pd.DataFrame) -> pd.DataFrame:
+    """Build the installations dimension table, with each installation's most frequently reported community."""
+    group_codes, installation_ids = pd.factorize(installation_communities['installation_id'], sort=True)
+
+    return pd.DataFrame({
+        'installation_id': installation_ids,
+        'community': most_frequent_category(
+            group_codes,
+            len(installation_ids),
+            installation_communities['community'],
+            weights=installation_communities['readings_count'].to_numpy(),
+        ),
+    })
+
+@instrument
+@ensure_dataframe
+def partition_solar_data(solar_data: pd.DataFrame) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """Decompose dataframe solar_data into an installations dimension table and a readings fact table."""
+    # Construct dataframe representing solar panel installations, one row per installation
+    installations = build_installations_dimension(count_installation_communities(solar_data))
+
+    # Construct dataframe representing meter readings
+    readings = solar_data[READINGS_COLUMNS].copy()
+
     return installations, readings
 
-def preprocess(preprocessed_exists: bool = False) -> tuple[pd.DataFrame, pd.DataFrame]:
+@instrument
+@ensure_dataframe
+def clean_solar_data(solar_data: pd.DataFrame) -> pd.DataFrame:
+    """Run the preprocessing steps with parameters loaded from config.json."""
+    solar_data = drop_unused_columns(solar_data)
+    solar_data = rename_columns(solar_data)
+    solar_data = drop_null_composite_key_combinations(solar_data)
+    solar_data = standardize_column_text(solar_data)
+    solar_data = modify_column_dtypes(solar_data)
+    return solar_data
+
+def raw_csv_schema() -> tuple[list[str], dict[str, str]]:
+    """Return the raw csv columns to read and their dtypes, skipping columns in preprocessing.drop_columns."""
+    header = pd.read_csv(from_root(FILEPATHS['raw_csv']), nrows=0).columns
+    usecols = [col for col in header if col not in PREPROCESSING['drop_columns']]
+    dtypes = {col: dtype for col, dtype in PREPROCESSING.get('csv_dtypes', {}).items() if col in usecols}
+    return usecols, dtypes
+
+def read_raw_csv() -> pd.DataFrame:
+    """Read the whole raw csv with the schema and parse engine configured in config.json."""
+    usecols, dtypes = raw_csv_schema()
+
+    if PREPROCESSING.get('csv_engine', 'c') == 'pyarrow':
+        return read_csv_pyarrow(
+            from_root(FILEPATHS['raw_csv']),
+            usecols=usecols,
+            dtypes=dtypes,
+        )
+
+    return pd.read_csv(
+        from_root(FILEPATHS['raw_csv']),
+        usecols=usecols,
+        dtype=dtypes,
+    )
+
+def read_raw_csv_chunks(chunk_size: int) -> Iterator[pd.DataFrame]:
+    """Read the raw csv as an iterator of dataframes with at most chunk_size rows each."""
+    usecols, dtypes = raw_csv_schema()
+
+    if PREPROCESSING.get('csv_engine', 'c') == 'pyarrow':
+        return read_csv_chunks_pyarrow(
+            from_root(FILEPATHS['raw_csv']),
+            chunk_size=chunk_size,
+            usecols=usecols,
+            dtypes=dtypes,
+        )
+
+    return pd.read_csv(
+        from_root(FILEPATHS['raw_csv']),
+        usecols=usecols,
+        dtype=dtypes,
+        chunksize=chunk_size,
+    )
+
+@instrument
+def preprocess_in_chunks(chunk_size: int) -> None:
+    """Clean, validate and append the raw csv to the preprocessed parquets chunk by chunk."""
+    installation_communities, installation_watermarks = [], []
+
+    with (
+        ParquetAppender('raw_parquet') as raw_parquet,
+        ParquetAppender('cleaned_unpartitioned') as cleaned_unpartitioned,
+        ParquetAppender('readings_preprocessed') as readings_parquet,
+    ):
+        for i, solar_data in enumerate(read_raw_csv_chunks(chunk_size)):
+            raw_parquet.append(solar_data)
+
+            solar_data = clean_solar_data(solar_data)
+            validate_cleaned_unpartitioned(solar_data)
+            cleaned_unpartitioned.append(solar_data)
+
+            readings = solar_data[READINGS_COLUMNS]
+            validate_readings_preprocessed(readings)
+            readings_parquet.append(readings)
+
+            installation_communities.append(count_installation_communities(solar_data))
+            installation_watermarks.append(latest_reading_timestamps(readings))
+
+            info(f'Preprocessed chunk {i} ({len(solar_data)} rows)')
+
+    save_installation_state(
+        merge_installation_communities(*installation_communities),
+        merge_installation_watermarks(*installation_watermarks),
+    )
+
+@instrument
+def preprocess_shard(solar_data: pd.DataFrame, basename: str) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """Clean, validate and append one installation shard to the preprocessed datasets, returning its community counts and latest timestamps."""
+    solar_data = clean_solar_data(solar_data)
+    validate_cleaned_unpartitioned(solar_data)
+
+    readings = solar_data[READINGS_COLUMNS]
+    validate_readings_preprocessed(readings)
+
+    if not solar_data.empty:
+        with ParquetAppender('cleaned_unpartitioned', basename=basename) as cleaned_unpartitioned:
+            cleaned_unpartitioned.append(solar_data)
+        with ParquetAppender('readings_preprocessed', basename=basename) as readings_parquet:
+            readings_parquet.append(readings)
+
+    return count_installation_communities(solar_data), latest_reading_timestamps(readings)
+
+@instrument
+def preprocess_in_shards(raw_chunks: Iterator[pd.DataFrame], workers: int) -> None:
+    """Run the preprocessing pipeline on installation shards of each raw csv chunk in a process pool of workers."""
+    num_shards = shard_count(workers)
+    installation_communities, installation_watermarks = [], []
+
+    # Raw chunks are sharded before the installation id column is renamed
+    installation_id_column = next(col for col, name in PREPROCESSING['rename_columns'].items() if name == 'installation_id')
+
+    with ParquetAppender('raw_parquet') as raw_parquet, shard_pool(workers) as pool:
+        for i, solar_data in enumerate(raw_chunks):
+            raw_parquet.append(solar_data)
+
+            results = map_shards(
+                pool,
+                preprocess_shard,
+                split_installation_shards(solar_data, num_shards, column=installation_id_column),
+                [f'part-{i}-shard-{shard}' for shard in range(num_shards)],
+            )
+            for communities, watermarks in results:
+                installation_communities.append(communities)
+                installation_watermarks.append(watermarks)
+
+            info(f'Preprocessed chunk {i} ({len(solar_data)} rows) in {num_shards} shards')
+
+    save_installation_state(
+        merge_installation_communities(*installation_communities),
+        merge_installation_watermarks(*installation_watermarks),
+    )
+
+@ensure_dataframe
+def save_installation_state(installation_communities: pd.DataFrame, installation_watermarks: pd.DataFrame) -> pd.DataFrame:
+    """Save the community counts and latest reading timestamps incremental runs resume from, and rebuild the installations dimension table."""
+    register_communities(installation_communities['community'].unique())
+    installation_communities = installation_communities.assign(community=encode_communities(installation_communities['community']))
+
+    save_table(installation_communities, 'installation_communities')
+    save_table(installation_watermarks, 'installation_watermarks')
+
+    installations = build_installations_dimension(installation_communities)
+    validate_installations_preprocessed(installations)
+    save_table(installations, 'installations_preprocessed')
+
+    return installations
+
+@instrument
+def preprocess(preprocessed_current: bool = False) -> tuple[pd.DataFrame, pd.DataFrame]:
     """
     If preprocessing has not occurred:
+        - Read the raw csv, in chunks of preprocessing.chunk_size rows if configured
         - Save a parquet of the unprocessed data
         - Drop unused columns
         - Rename columns
@@ -79,101 +342,171 @@ def preprocess(preprocessed_exists: bool = False) -> tuple[pd.DataFrame, pd.Data
         - Modify column data types
         - Partition data
         - Perform preliminary validation on partitioned data
-        - Save parquets of partitioned data
-    Otherwise: read the preprocessed data
+        - Save parquets of partitioned data, as hive-partitioned datasets where configured
+    In chunked mode every step above runs once per chunk and the parquets are appended to.
+    With parallel.workers > 1 the steps run on installation shards in a process pool.
+    With backend.name set to duckdb the steps run as DuckDB queries over the csv and parquets.
+    Otherwise: read the preprocessed data, checked against parquet statistics since it was fully validated when built
     """
-    if preprocessed_exists:
-        # Load parquets into dataframes
-        installations_preprocessed = pd.read_parquet(from_root(FILEPATHS['installations_preprocessed']))
-        readings_preprocessed = pd.read_parquet(from_root(FILEPATHS['readings_preprocessed']))
-
-        # Validate partitioned preprocessed data
-        validate_installations_preprocessed(installations_preprocessed)
-        validate_readings_preprocessed(readings_preprocessed)
+    if preprocessed_current:
+        # Check the parquets against their specs from footer statistics, then load them into dataframes
+        validate_parquet_statistics('installations_preprocessed')
+        validate_parquet_statistics('readings_preprocessed')
+        installations_preprocessed = load_table('installations_preprocessed')
+        readings_preprocessed = load_table('readings_preprocessed')
 
-        info(f"\U00002705 Successfully read and validated preprocessed parquets in {FILEPATHS['dir_preprocessing']} directory")
+        info(f"\U00002705 Successfully read cached preprocessed parquets in {FILEPATHS['dir_preprocessing']} directory")
     else:
-        info(f"Missing or invalid preprocessed parquets in {FILEPATHS['dir_preprocessing']} directory \U00002014 generating parquets now...")
+        info(f"Missing or stale preprocessed parquets in {FILEPATHS['dir_preprocessing']} directory \U00002014 generating parquets now...")
         # Clean up target directory for parquets
+        invalidate_stage('preprocessing')
         create_clean_directory(FILEPATHS['dir_preprocessing'])
 
-        # Load csv into dataframe
-        solar_data = pd.read_csv(
-            from_root(FILEPATHS['raw_csv']),
-        )
+        chunk_size = PREPROCESSING.get('chunk_size')
+        workers = worker_count()
+        use_duckdb = BACKEND.get('name', 'pandas') == 'duckdb'
+        if use_duckdb and storage_format() != 'parquet':
+            use_duckdb = False
+            info('The duckdb backend only writes parquet stage outputs \U00002014 preprocessing with pandas')
 
-        # Save unprocessed data into parquet
-        solar_data.to_parquet(
-            from_root(FILEPATHS['raw_parquet']),
-            index=False,
-        )
+        if use_duckdb:
+            # Run the preprocessing stage as DuckDB queries and read back the parquets
+            from core.pipeline.duckdb_backend import preprocess_duckdb
+            preprocess_duckdb()
+            installations_preprocessed = load_table('installations_preprocessed')
+            readings_preprocessed = load_table('readings_preprocessed')
+        elif workers > 1 and all(partition_columns(key) for key in SHARDED_OUTPUTS):
+            # Preprocess installation shards in worker processes and read back the partitioned parquets
+            preprocess_in_shards(read_raw_csv_chunks(chunk_size) if chunk_size else iter([read_raw_csv()]), workers)
+            installations_preprocessed = load_table('installations_preprocessed')
+            readings_preprocessed = load_table('readings_preprocessed')
+        elif chunk_size:
+            # Stream csv through the preprocessing pipeline and read back the partitioned parquets
+            preprocess_in_chunks(chunk_size)
+            installations_preprocessed = load_table('installations_preprocessed')
+            readings_preprocessed = load_table('readings_preprocessed')
+        else:
+            # Load csv into dataframe
+            solar_data = read_raw_csv()
 
-        # Run preprocessing pipeline with parameters loaded from config.json
-        solar_data = drop_unused_columns(solar_data)
-        solar_data = rename_columns(solar_data)
-        solar_data = drop_null_composite_key_combinations(solar_data)
-        solar_data = standardize_column_text(solar_data)
-        solar_data = modify_column_dtypes(solar_data)
-
-        # Save cleaned, unpartitioned data into parquet
-        solar_data.to_parquet(
-            from_root(FILEPATHS['cleaned_unpartitioned']),
-            index=False,
-        )
+            # Save unprocessed data into parquet
+            save_table(solar_data, 'raw_parquet')
 
-        # Validate cleaned, unpartitioned data
-        validate_cleaned_unpartitioned(solar_data)
+            # Run preprocessing pipeline with parameters loaded from config.json
+            solar_data = clean_solar_data(solar_data)
 
-        # Partition data into two separate dataframes
-        installations_preprocessed, readings_preprocessed = partition_solar_data(solar_data)
+            # Save cleaned, unpartitioned data into parquet
+            save_table(solar_data, 'cleaned_unpartitioned')
 
-        # Validate partitioned preprocessed data
-        validate_installations_preprocessed(installations_preprocessed)
-        validate_readings_preprocessed(readings_preprocessed)
+            # Validate cleaned, unpartitioned data
+            validate_cleaned_unpartitioned(solar_data)
 
-        # Save partitioned data into parquets
-        installations_preprocessed.to_parquet(
-            from_root(FILEPATHS['installations_preprocessed']),
-            index=False,
-        )
-        readings_preprocessed.to_parquet(
-            from_root(FILEPATHS['readings_preprocessed']),
-            index=False,
-        )
+            # Partition data into two separate dataframes
+            installations_preprocessed, readings_preprocessed = partition_solar_data(solar_data)
+
+            # Validate partitioned preprocessed data
+            validate_installations_preprocessed(installations_preprocessed)
+            validate_readings_preprocessed(readings_preprocessed)
+
+            # Save partitioned data into parquets, with the running state incremental runs resume from
+            save_table(readings_preprocessed, 'readings_preprocessed')
+            installations_preprocessed = save_installation_state(
+                count_installation_communities(solar_data),
+                latest_reading_timestamps(readings_preprocessed),
+            )
+
+        # Record the fingerprint of the inputs the parquets were built from
+        record_stage('preprocessing', preprocessing_fingerprint(), PREPROCESSED_OUTPUTS, rules=preprocessing_rules_fingerprint())
         info(f"\U00002705 Successfully generated, saved, read, and validated preprocessed parquets in {FILEPATHS['dir_preprocessing']} directory")
 
     return installations_preprocessed, readings_preprocessed
 
-def check_preprocessed_parquets_exist() -> bool:
-    """Return True if all required preprocessed parquet files exist."""
-    filepath_keys = [
-        'raw_parquet',
-        'cleaned_unpartitioned',
-        'installations_preprocessed',
-        'readings_preprocessed'
-    ]
-    return all(os.path.exists(from_root(FILEPATHS[k])) for k in filepath_keys)
+@instrument
+def append_new_readings() -> tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Incrementally preprocess the raw csv:
+        - Read the raw csv in chunks and run each chunk through the preprocessing pipeline
+        - Keep only readings newer than the latest processed reading of their installation
+        - Validate and append the new readings to the existing preprocessed readings datasets
+        - Update the running readings counts per installation and community, the latest reading
+          timestamps and the installations dimension table, without rereading earlier readings
+    The raw parquet is a snapshot of the csv and is only rewritten by full rebuilds.
+    Return the updated installations dimension table and the newly appended readings.
+    """
+    info(f"Appending new readings to preprocessed parquets in {FILEPATHS['dir_preprocessing']} directory...")
+    # Forget the stage record so that a failed append forces a full rebuild
+    invalidate_stage('preprocessing')
+
+    installation_watermarks = load_table('installation_watermarks')
+    installation_communities = [load_table('installation_communities')]
+    new_readings = []
+
+    # Distinct file names keep earlier files of the partitioned datasets in place
+    basename = f"append-{datetime.now():%Y%m%d%H%M%S}"
+    chunk_size = PREPROCESSING.get('chunk_size') or PREPROCESSING_APPEND_CHUNK_SIZE
+
+    with (
+        ParquetAppender('cleaned_unpartitioned', basename=basename) as cleaned_unpartitioned,
+        ParquetAppender('readings_preprocessed', basename=basename) as readings_parquet,
+    ):
+        for solar_data in read_raw_csv_chunks(chunk_size):
+            solar_data = select_new_readings(clean_solar_data(solar_data), installation_watermarks)
+            readings = solar_data[READINGS_COLUMNS]
+            new_readings.append(readings)
+            if solar_data.empty:
+                continue
+
+            validate_cleaned_unpartitioned(solar_data)
+            cleaned_unpartitioned.append(solar_data)
+
+            validate_readings_preprocessed(readings)
+            readings_parquet.append(readings)
+
+            installation_communities.append(count_installation_communities(solar_data))
+
+    new_readings = pd.concat(new_readings, ignore_index=True) if new_readings else pd.DataFrame(columns=READINGS_COLUMNS)
+
+    installations_preprocessed = save_installation_state(
+        merge_installation_communities(*installation_communities),
+        merge_installation_watermarks(installation_watermarks, latest_reading_timestamps(new_readings)),
+    )
+
+    record_stage('preprocessing', preprocessing_fingerprint(), PREPROCESSED_OUTPUTS, rules=preprocessing_rules_fingerprint())
+    info(f"\U00002705 Successfully appended {len(new_readings)} new readings to preprocessed parquets in {FILEPATHS['dir_preprocessing']} directory")
+
+    return installations_preprocessed, new_readings
+
+def preprocessing_fingerprint() -> str:
+    """Return the fingerprint of the raw csv, configuration and code the preprocessed parquets depend on."""
+    return stage_fingerprint(
+        input_files=['raw_csv'],
+        config_sections=PREPROCESSING_CONFIG_SECTIONS,
+        modules=PREPROCESSING_MODULES,
+    )
+
+def preprocessing_rules_fingerprint() -> str:
+    """Return the fingerprint of the configuration and code the preprocessed parquets depend on."""
+    return stage_fingerprint(
+        config_sections=PREPROCESSING_CONFIG_SECTIONS,
+        modules=PREPROCESSING_MODULES,
+    )
+
+def check_preprocessed_parquets_current() -> bool:
+    """Return True if the preprocessed parquets were built from the current raw csv, configuration and code."""
+    return is_stage_current('preprocessing', preprocessing_fingerprint())
+
+def check_preprocessed_parquets_appendable() -> bool:
+    """Return True if new readings can be appended to the preprocessed parquets."""
+    return (
+        is_stage_appendable('preprocessing', preprocessing_rules_fingerprint())
+        and all(partition_columns(key) for key in APPENDED_OUTPUTS)
+    )
 
 if __name__ == '__main__':
-    installations_preprocessed, readings_preprocessed = preprocess(preprocessed_exists=check_preprocessed_parquets_exist())
-    cleaned_unpartitioned = pd.read_parquet(from_root(FILEPATHS['cleaned_unpartitioned']))
-    installations_preprocessed = pd.read_parquet(from_root(FILEPATHS['installations_preprocessed']))
-    readings_preprocessed = pd.read_parquet(from_root(FILEPATHS['readings_preprocessed']))
-
-    print(f'------------------------------------------------')
-    print(f'| cleaned_unpartitioned (count: {len(cleaned_unpartitioned)}) |')
-    print(f'------------------------------------------------')
-    for col in cleaned_unpartitioned.columns:
-        print(f'Column: {col} [{cleaned_unpartitioned[col].dtype}] [num_unique: {cleaned_unpartitioned[col].nunique()}] [num_NA: {cleaned_unpartitioned[col].isna().sum()}]')
-
-    print(f'------------------------------------------------')
-    print(f'| installations_preprocessed (count: {len(installations_preprocessed)}) |')
-    print(f'------------------------------------------------')
-    for col in installations_preprocessed.columns:
-        print(f'Column: {col} [{installations_preprocessed[col].dtype}] [num_unique: {installations_preprocessed[col].nunique()}] [num_NA: {installations_preprocessed[col].isna().sum()}]')
-
-    print(f'-------------------------------------------')
-    print(f'| readings_preprocessed (count: {len(readings_preprocessed)}) |')
-    print(f'-------------------------------------------')
-    for col in readings_preprocessed.columns:
-        print(f'Column: {col} [{readings_preprocessed[col].dtype}] [num_unique: {readings_preprocessed[col].nunique()}] [num_NA: {readings_preprocessed[col].isna().sum()}]')
+    set_pandas_display_options()
+    installations_preprocessed, readings_preprocessed = preprocess(preprocessed_current=check_preprocessed_parquets_current())
+
+    # Summaries are read from the profiles saved with each output, so cleaned_unpartitioned is only loaded if it has none
+    print_profile('cleaned_unpartitioned', table_profile('cleaned_unpartitioned'))
+    print_profile('installations_preprocessed', table_profile('installations_preprocessed', installations_preprocessed))
+    print_profile('readings_preprocessed', table_profile('readings_preprocessed', readings_preprocessed))
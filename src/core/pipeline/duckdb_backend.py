@@ -0,0 +1,284 @@
+"""DuckDB execution backend for the preprocessing and feature engineering stages."""
+from contextlib import contextmanager
+
+import pandas as pd
+
+from core.utils.communities import encode_communities, register_communities
+from core.utils.config import BACKEND, FILEPATHS, PREPROCESSING
+from core.utils.instrumentation import instrument
+from core.utils.logger import info
+from core.utils.paths import from_root
+from core.utils.profiling import merge_profiles
+from core.utils.schema import column_dtype
+from core.utils.storage import (
+    ParquetAppender,
+    load_table,
+    partition_columns,
+    profile_partitions,
+    save_profiles,
+    save_table,
+)
+
+# SQL for the partition columns that storage derives from the timestamp column
+DERIVED_PARTITION_SQL = {
+    'year': 'CAST(year("timestamp") AS INTEGER)',
+    'month': 'CAST(month("timestamp") AS INTEGER)',
+}
+
+# DuckDB types of the pandas dtypes that stage output columns may have
+SQL_TYPES = {
+    'int16': 'SMALLINT',
+    'int32': 'INTEGER',
+    'int64': 'BIGINT',
+    'float32': 'FLOAT',
+    'float64': 'DOUBLE',
+}
+
+# Rows per record batch when validating large stage outputs
+VALIDATION_BATCH_ROWS = 1_000_000
+
+def connect():
+    """Open an in-memory DuckDB connection configured from the backend section of config.json."""
+    try:
+        import duckdb
+    except ImportError as e:
+        raise ImportError("The duckdb backend requires the duckdb package: pip install 'core[duckdb]'") from e
+
+    con = duckdb.connect()
+    if BACKEND.get('memory_limit'):
+        con.execute(f"SET memory_limit = {_literal(BACKEND['memory_limit'])}")
+    if BACKEND.get('temp_directory'):
+        con.execute(f"SET temp_directory = {_literal(str(from_root(BACKEND['temp_directory'])))}")
+    return con
+
+def _literal(value: str) -> str:
+    """Quote value as a SQL string literal."""
+    return "'" + str(value).replace("'", "''") + "'"
+
+def _identifier(name: str) -> str:
+    """Quote name as a SQL identifier."""
+    return '"' + name.replace('"', '""') + '"'
+
+def _sql_type(col: str, dtype: str) -> str:
+    """Return the DuckDB type of column col, which has dtype unless the compact schema is enabled."""
+    return SQL_TYPES[column_dtype(col, dtype)]
+
+def _scan(key: str) -> str:
+    """Return a SQL table expression scanning the parquet stage output FILEPATHS[key]."""
+    path = from_root(FILEPATHS[key])
+    if partition_columns(key):
+        return f"read_parquet({_literal(str(path / '**' / '*.parquet'))}, hive_partitioning = true)"
+    return f'read_parquet({_literal(str(path))})'
+
+def _copy_to_table(con, query: str, key: str, columns: list[str]) -> None:
+    """Write columns of query to the stage output FILEPATHS[key], laid out like storage.save_table."""
+    partition_cols = partition_columns(key)
+    select = [_identifier(col) for col in columns]
+    select += [f'{DERIVED_PARTITION_SQL[col]} AS {col}' for col in partition_cols if col not in columns]
+    order_by = [_identifier(col) for col in ('installation_id', 'timestamp') if col in columns]
+
+    statement = f"SELECT {', '.join(select)} FROM ({query})"
+    if order_by:
+        statement += f" ORDER BY {', '.join(order_by)}"
+
+    options = ['FORMAT parquet']
+    if partition_cols:
+        options += [f"PARTITION_BY ({', '.join(partition_cols)})", 'OVERWRITE_OR_IGNORE']
+
+    con.execute(f"COPY ({statement}) TO {_literal(str(from_root(FILEPATHS[key])))} ({', '.join(options)})")
+
+def _to_pandas(df: pd.DataFrame) -> pd.DataFrame:
+    """Convert DuckDB query results to the dtypes of the pandas pipeline."""
+    if 'community' in df.columns:
+        df['community'] = df['community'].astype('category')
+    return df
+
+def _validate_in_batches(con, key: str, validator) -> None:
+    """Validate and profile the stage output FILEPATHS[key] one record batch at a time."""
+    derived = [col for col in partition_columns(key) if col in DERIVED_PARTITION_SQL]
+    select = f"* EXCLUDE ({', '.join(derived)})" if derived else '*'
+    reader = con.execute(f'SELECT {select} FROM {_scan(key)}').to_arrow_reader(VALIDATION_BATCH_ROWS)
+    profiles = {}
+    for batch in reader:
+        df = _to_pandas(batch.to_pandas())
+        validator(df)
+        profiles = merge_profiles(profiles, profile_partitions(df, key))
+    save_profiles(key, profiles, basename='duckdb')
+
+def _cleaned_sql(usecols: list[str]) -> str:
+    """Return the SQL equivalent of clean_solar_data over the raw parquet."""
+    renamed = {col: PREPROCESSING['rename_columns'].get(col, col) for col in usecols}
+    raw_names = {name: col for col, name in renamed.items()}
+
+    corrections = PREPROCESSING['community_name_corrections']
+    conversions = {
+        'installation_id': f"CAST({{col}} AS {_sql_type('installation_id', 'int64')})",
+        'timestamp': f"CAST(try_strptime(CAST({{col}} AS VARCHAR), {_literal(PREPROCESSING['date_format'])}) AS TIMESTAMP_NS)",
+        'panels_reporting': f"CAST({{col}} AS {_sql_type('panels_reporting', 'int64')})",
+        'avg_power_watts_5min': f"CAST({{col}} AS {_sql_type('avg_power_watts_5min', 'float64')})",
+        'community': (
+            'CASE {col} '
+            + ' '.join(f'WHEN {_literal(old)} THEN {_literal(new)}' for old, new in corrections.items())
+            + ' ELSE CAST({col} AS VARCHAR) END'
+            if corrections else 'CAST({col} AS VARCHAR)'
+        ),
+    }
+
+    select = [
+        f'{conversions.get(name, "{col}").format(col=_identifier(col))} AS {_identifier(name)}'
+        for col, name in renamed.items()
+        if col not in PREPROCESSING['drop_columns']
+    ]
+    not_null = [f'{_identifier(raw_names[name])} IS NOT NULL' for name in PREPROCESSING['composite_key']]
+
+    return f"SELECT {', '.join(select)} FROM {_scan('raw_parquet')} WHERE {' AND '.join(not_null)}"
+
+@instrument
+def preprocess_duckdb() -> None:
+    """Run the preprocessing stage as DuckDB queries over the raw csv."""
+    from core.pipeline.data_preprocessing import READINGS_COLUMNS, raw_csv_schema
+    from core.utils.validation import validate_cleaned_unpartitioned, validate_installations_preprocessed, validate_readings_preprocessed
+
+    con = connect()
+    usecols, dtypes = raw_csv_schema()
+    date_column = next(col for col, name in PREPROCESSING['rename_columns'].items() if name == 'timestamp')
+
+    # Parse the raw csv with the dtypes the pandas readers use, so that both backends write the same raw parquet
+    csv_types = {col: SQL_TYPES.get(dtype, 'VARCHAR') for col, dtype in dtypes.items()}
+    csv_types[date_column] = 'VARCHAR'
+    types = ', '.join(f'{_literal(col)}: {_literal(sql_type)}' for col, sql_type in csv_types.items())
+    raw_csv = f"read_csv({_literal(str(from_root(FILEPATHS['raw_csv'])))}, header = true, types = {{{types}}})"
+    con.execute(f"COPY (SELECT {', '.join(map(_identifier, usecols))} FROM {raw_csv}) TO {_literal(str(from_root(FILEPATHS['raw_parquet'])))} (FORMAT parquet)")
+
+    # The cleaned readings are a view over the raw parquet, so every output below is planned from it without reading
+    # back another output, and the community counts and latest reading timestamps come from a single aggregation
+    con.execute(f'CREATE VIEW cleaned AS {_cleaned_sql(usecols)}')
+    cleaned_columns = [desc[0] for desc in con.execute('DESCRIBE cleaned').fetchall()]
+    _copy_to_table(con, 'SELECT * FROM cleaned', 'cleaned_unpartitioned', cleaned_columns)
+    _copy_to_table(con, 'SELECT * FROM cleaned', 'readings_preprocessed', READINGS_COLUMNS)
+    _validate_in_batches(con, 'cleaned_unpartitioned', validate_cleaned_unpartitioned)
+    _validate_in_batches(con, 'readings_preprocessed', validate_readings_preprocessed)
+
+    installation_state = con.execute("""
+        SELECT installation_id, community, count(*) AS readings_count, max("timestamp") AS last_timestamp
+        FROM cleaned
+        GROUP BY installation_id, community
+        ORDER BY installation_id, community
+    """).df()
+    installation_communities = _to_pandas(installation_state[['installation_id', 'community', 'readings_count']].copy())
+    installation_watermarks = installation_state.groupby('installation_id', as_index=False)['last_timestamp'].max()
+
+    # Ties between communities go to the first in sort order, as in most_frequent_category
+    con.register('installation_communities', installation_communities)
+    installations = _to_pandas(con.execute("""
+        SELECT installation_id, first(community ORDER BY readings_count DESC, community) FILTER (WHERE community IS NOT NULL) AS community
+        FROM installation_communities
+        GROUP BY installation_id
+        ORDER BY installation_id
+    """).df())
+
+    # Encode with the community dtype after the tie-break above, which orders communities by name
+    register_communities(installation_communities['community'].unique())
+    installation_communities['community'] = encode_communities(installation_communities['community'])
+    installations['community'] = encode_communities(installations['community'])
+    validate_installations_preprocessed(installations)
+
+    save_table(installation_communities, 'installation_communities')
+    save_table(installation_watermarks, 'installation_watermarks')
+    save_table(installations, 'installations_preprocessed')
+
+def _save_time_features(con, features: str) -> None:
+    """Save the readings of the features query with their time features, computed in pandas one month at a time."""
+    from core.pipeline.time_features import build_time_features, time_feature_lookback
+    from core.utils.validation import validate_readings_feature_engineered
+
+    lookback = time_feature_lookback()
+    months = con.execute(f"SELECT DISTINCT date_trunc('month', \"timestamp\") AS month FROM ({features}) ORDER BY month").fetchall()
+
+    with ParquetAppender('readings_feature_engineered', basename='duckdb') as appender:
+        for (month,) in months:
+            start, end = pd.Timestamp(month), pd.Timestamp(month) + pd.offsets.MonthBegin()
+            readings = con.execute(
+                f'SELECT * FROM ({features}) WHERE "timestamp" >= ? AND "timestamp" < ? ORDER BY installation_id, "timestamp"',
+                [(start - lookback).to_pydatetime(), end.to_pydatetime()],
+            ).df()
+            readings = pd.concat([readings, build_time_features(readings)], axis=1)
+            readings = readings[readings['timestamp'] >= start].reset_index(drop=True)
+            validate_readings_feature_engineered(readings)
+            appender.append(readings)
+
+@instrument
+def build_readings_features_duckdb() -> pd.DataFrame:
+    """Build, save and validate the readings features in DuckDB, and return the running statistics of each installation."""
+    from core.pipeline.data_preprocessing import READINGS_COLUMNS
+    from core.pipeline.time_features import time_feature_columns
+    from core.utils.validation import validate_readings_feature_engineered
+
+    con = connect()
+    readings = _scan('readings_preprocessed')
+    # Round after each operation, as pandas does in the energy column's dtype
+    energy_type = _sql_type('energy_prod_wh_5min', 'float64')
+    features = (
+        f"SELECT {', '.join(map(_identifier, READINGS_COLUMNS))}, "
+        f'CAST(CAST(avg_power_watts_5min * 300 AS {energy_type}) / 3600 AS {energy_type}) AS energy_prod_wh_5min FROM {readings}'
+    )
+
+    if time_feature_columns():
+        _save_time_features(con, features)
+    else:
+        _copy_to_table(con, features, 'readings_feature_engineered', [*READINGS_COLUMNS, 'energy_prod_wh_5min'])
+        _validate_in_batches(con, 'readings_feature_engineered', validate_readings_feature_engineered)
+
+    return con.execute(f"""
+        WITH panels_max AS (
+            SELECT installation_id, max(panels_reporting) AS panels_reporting_max
+            FROM {readings}
+            GROUP BY installation_id
+        )
+        SELECT
+            installation_id,
+            count(*) AS readings_count,
+            CAST(sum(panels_reporting) AS BIGINT) AS panels_reporting_sum,
+            CAST(any_value(panels_reporting_max) AS BIGINT) AS panels_reporting_max,
+            count(*) FILTER (WHERE panels_reporting = panels_reporting_max) AS panels_reporting_max_count
+        FROM {readings} JOIN panels_max USING (installation_id)
+        GROUP BY installation_id
+        ORDER BY installation_id
+    """).df()
+
+@contextmanager
+def _use_backend(name: str):
+    """Temporarily select the execution backend named name."""
+    previous = BACKEND.get('name')
+    BACKEND['name'] = name
+    try:
+        yield
+    finally:
+        BACKEND['name'] = previous
+
+def _sorted_for_comparison(df: pd.DataFrame) -> pd.DataFrame:
+    """Return df sorted by its keys, with categorical columns compared by value."""
+    df = df.astype({col: 'object' for col in df.columns if isinstance(df[col].dtype, pd.CategoricalDtype)})
+    keys = [col for col in ('installation_id', 'timestamp', 'community') if col in df.columns]
+    return df.sort_values(keys or list(df.columns), kind='stable', ignore_index=True)
+
+def compare_backends(keys: list[str] | None = None) -> None:
+    """Build the stage outputs with the duckdb and then the pandas backend, and raise AssertionError if they differ."""
+    from core.pipeline.data_preprocessing import PREPROCESSED_OUTPUTS, preprocess
+    from core.pipeline.feature_engineering import FEATURE_ENGINEERED_OUTPUTS, build_feature_dataset
+
+    keys = keys or PREPROCESSED_OUTPUTS + FEATURE_ENGINEERED_OUTPUTS
+    outputs = {}
+
+    for backend in ('duckdb', 'pandas'):
+        with _use_backend(backend):
+            installations_preprocessed, readings_preprocessed = preprocess(preprocessed_current=False)
+            build_feature_dataset(installations_preprocessed, readings_preprocessed, feature_engineered_current=False)
+            outputs[backend] = {key: _sorted_for_comparison(load_table(key)) for key in keys}
+
+    for key in keys:
+        pd.testing.assert_frame_equal(outputs['duckdb'][key], outputs['pandas'][key], check_like=True)
+        info(f'\U00002705 {key}: duckdb and pandas backends agree ({len(outputs["pandas"][key])} rows)')
+
+if __name__ == '__main__':
+    compare_backends()
@@ -1,98 +1,97 @@
-from pathlib import Path
-
-import matplotlib.pyplot as plt
 import pandas as pd
 
-from core.utils import pd_config
 from core.utils.config import FILEPATHS
+from core.utils.figures import FigureSpec, render_figures
+from core.utils.instrumentation import instrument
 from core.utils.logger import info
 from core.utils.paths import from_root
+from core.utils.pd_config import set_pandas_display_options
+from core.utils.storage import load_table
 from core.utils.utils import ensure_dataframe
-from core.utils.validation import validate_installations_feature_engineered, validate_readings_feature_engineered
-
-def plot_panels_reporting_over_time(cleaned_unpartitioned: pd.DataFrame, save: bool = False) -> pd.DataFrame:
-    """Plot number of panels reporting over time."""
-    df = cleaned_unpartitioned.copy()
-
-    # Create a date column
-    df['date'] = cleaned_unpartitioned['timestamp'].dt.date
 
-    # Obtain the maximum number of panels reporting for each installation on each date
-    daily_max = (
-        df
-        .groupby(['installation_id', 'date'])['panels_reporting']
-        .max()
-        .reset_index()
+@ensure_dataframe
+def daily_panels_reporting(community_daily: pd.DataFrame) -> pd.DataFrame:
+    """Sum each installation's maximum number of panels reporting on each date across all communities."""
+    return (
+        community_daily
+        .groupby('timestamp')['active_panels']
+        .sum()
+        .rename_axis('date')
+        .reset_index(name='panels_reporting')
     )
 
-    # Obtain the maximum total number of panels reporting for all installations on each date
+@ensure_dataframe
+def daily_energy_production(community_daily: pd.DataFrame) -> pd.DataFrame:
+    """Obtain the total amount of energy produced (in megawatt-hours) on each date across all communities."""
     daily_sum = (
-        daily_max
-        .groupby('date')['panels_reporting']
+        community_daily
+        .groupby('timestamp')['energy_prod_wh']
         .sum()
+        .rename_axis('date')
         .reset_index()
     )
-
-    # Generate scatterplot
-    plt.figure(figsize=(10,5))
-    plt.scatter(daily_sum['date'], daily_sum['panels_reporting'], s=10)
-    plt.title('Number of active panels over time')
-    plt.xlabel('Year')
-    plt.ylabel('Number of active panels')
-    plt.grid(True)
-    plt.tight_layout()
-
-    if save:
-        plt.savefig(from_root(FILEPATHS['panels_reporting']))
-
-    info(f"\U00002705 Successfully generated and saved plot [Number of active panels over time] to {FILEPATHS['panels_reporting']}")
+    daily_sum['energy_prod_mwh'] = daily_sum['energy_prod_wh'] / 1_000_000
 
     return daily_sum
 
-def plot_total_energy_production_over_time(readings_feature_engineered: pd.DataFrame, save: bool = False):
-    """Plot total energy production (in megawatt-hours) over time."""
-    df = readings_feature_engineered.copy()
-
-    # Create a date column
-    df['date'] = readings_feature_engineered['timestamp'].dt.date
+def panels_reporting_figure(community_daily: pd.DataFrame) -> FigureSpec:
+    """Describe the scatterplot of the number of panels reporting over time."""
+    daily_sum = daily_panels_reporting(community_daily)
+    return FigureSpec(
+        from_root(FILEPATHS['panels_reporting']),
+        daily_sum['date'].to_numpy(),
+        daily_sum['panels_reporting'].to_numpy(),
+        title='Number of active panels over time',
+        xlabel='Year',
+        ylabel='Number of active panels',
+    )
 
-    # Obtain the total amount of energy produced on each date
-    daily_sum = (
-        df
-        .groupby(['date'])['energy_prod_wh_5min']
-        .sum()
-        .reset_index()
+def energy_production_figure(community_daily: pd.DataFrame) -> FigureSpec:
+    """Describe the scatterplot of total energy production (in megawatt-hours) over time."""
+    daily_sum = daily_energy_production(community_daily)
+    return FigureSpec(
+        from_root(FILEPATHS['energy_production']),
+        daily_sum['date'].to_numpy(),
+        daily_sum['energy_prod_mwh'].to_numpy(),
+        title='Daily energy production over time',
+        xlabel='Year',
+        ylabel='Daily energy production\n(megawatt-hours)',
     )
 
-    daily_sum['energy_prod_mwh'] = daily_sum['energy_prod_wh_5min'] / 1_000_000
+# Figure of each EDA plot, by the FILEPATHS key it is saved to
+EDA_FIGURES = {
+    'panels_reporting': panels_reporting_figure,
+    'energy_production': energy_production_figure,
+}
 
-    # Generate scatterplot
-    plt.figure(figsize=(10,5))
-    plt.scatter(daily_sum['date'], daily_sum['energy_prod_mwh'], s=10)
-    plt.title('Daily energy production over time')
-    plt.xlabel('Year')
-    plt.ylabel('Daily energy production\n(megawatt-hours)')
-    plt.grid(True)
-    plt.tight_layout()
+@instrument
+def plot_eda_figures(community_daily: pd.DataFrame, keys: list[str] | None = None) -> None:
+    """Render and save the EDA figures named in keys, every figure by default, of the community daily rollup in a process pool."""
+    create_figures_directory()
 
-    if save:
-        plt.savefig(from_root(FILEPATHS['energy_production']))
+    specs = {key: EDA_FIGURES[key](community_daily) for key in keys or EDA_FIGURES}
+    render_figures(list(specs.values()))
 
-    info(f"\U00002705 Successfully generated and saved plot [Daily energy production over time] to {FILEPATHS['energy_production']}")
+    for key, spec in specs.items():
+        info(f"\U00002705 Successfully generated and saved plot [{spec.title}] to {FILEPATHS[key]}")
 
-    return daily_sum
+def plot_panels_reporting_over_time(community_daily: pd.DataFrame, save: bool = False) -> pd.DataFrame:
+    """Plot number of panels reporting over time."""
+    if save:
+        plot_eda_figures(community_daily, ['panels_reporting'])
+    return daily_panels_reporting(community_daily)
+
+def plot_total_energy_production_over_time(community_daily: pd.DataFrame, save: bool = False) -> pd.DataFrame:
+    """Plot total energy production (in megawatt-hours) over time."""
+    if save:
+        plot_eda_figures(community_daily, ['energy_production'])
+    return daily_energy_production(community_daily)
 
 def create_figures_directory():
     """Create empty figures directory."""
-    Path(FILEPATHS['dir_figures']).mkdir(parents=True, exist_ok=True)
+    from_root(FILEPATHS['dir_figures']).mkdir(parents=True, exist_ok=True)
     info(f"\U00002705 Successfully created empty {FILEPATHS['dir_figures']} directory")
 
 if __name__ == '__main__':
-    cleaned_unpartitioned = pd.read_parquet(from_root(FILEPATHS['cleaned_unpartitioned']))
-    installations_feature_engineered = pd.read_parquet(from_root(FILEPATHS['installations_feature_engineered']))
-    readings_feature_engineered = pd.read_parquet(from_root(FILEPATHS['readings_feature_engineered']))
-
-    create_figures_directory()
-
-    plot_panels_reporting_over_time(cleaned_unpartitioned, save=True)
-    plot_total_energy_production_over_time(readings_feature_engineered, save=True)
+    set_pandas_display_options()
+    plot_eda_figures(load_table('community_daily'))
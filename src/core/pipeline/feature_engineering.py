@@ -1,110 +1,302 @@
-import os
+from datetime import datetime
 
+import numpy as np
 import pandas as pd
 
-from core.utils import pd_config
-from core.utils.config import FILEPATHS, FEATURE_ENGINEERING
+from core.pipeline.rollups import ROLLUP_OUTPUTS, build_rollups, refresh_rollups, save_rollups
+from core.pipeline.time_features import build_time_features, load_time_feature_history
+from core.utils.cache import invalidate_stage, is_stage_appendable, is_stage_current, record_stage, stage_fingerprint
+from core.utils.config import BACKEND, FILEPATHS, FEATURE_ENGINEERING
+from core.utils.instrumentation import instrument
 from core.utils.logger import info
-from core.utils.paths import from_root
+from core.utils.parallel import map_shards, shard_count, shard_pool, split_installation_shards, worker_count
+from core.utils.pd_config import set_pandas_display_options
+from core.utils.profiling import print_profile
+from core.utils.schema import column_dtype
+from core.utils.storage import ParquetAppender, load_table, partition_columns, save_table, storage_format, table_profile
 from core.utils.utils import create_clean_directory, ensure_dataframe
-from core.utils.validation import validate_installations_feature_engineered, validate_readings_feature_engineered
+from core.utils.validation import (
+    validate_installations_feature_engineered,
+    validate_parquet_statistics,
+    validate_readings_feature_engineered,
+)
+
+# Stage outputs written by build_feature_dataset
+FEATURE_ENGINEERED_OUTPUTS = [
+    'installations_feature_engineered',
+    'readings_feature_engineered',
+    'installations_running_stats',
+    *ROLLUP_OUTPUTS,
+]
+
+# Configuration and code the feature-engineered parquets depend on
+FEATURE_ENGINEERING_CONFIG_SECTIONS = ['feature_engineering', 'storage', 'schema', 'backend']
+FEATURE_ENGINEERING_MODULES = [
+    'core.pipeline.duckdb_backend',
+    'core.pipeline.feature_engineering',
+    'core.pipeline.rollups',
+    'core.pipeline.time_features',
+    'core.utils.parallel',
+    'core.utils.schema',
+    'core.utils.storage',
+    'core.utils.validation',
+]
 
 @ensure_dataframe
-def build_installations_features(installations_preprocessed: pd.DataFrame) -> pd.DataFrame:
-    """Build additional features onto the installations table after grouping by installation_id."""
-    cat_dtype = installations_preprocessed['community'].dtype
-
-    installations_feature_engineered = (
-        installations_preprocessed
-        .groupby('installation_id', as_index=False)
-        .agg(
-            community=('community', lambda x: x.mode()[0] if not x.mode().empty else None),
-            panels_reporting_max=('panels_reporting', 'max'),
-            panels_reporting_efficiency=('panels_reporting',
-                lambda x: (x == x.max()).sum() / len(x)
-            ),
-            panels_reporting_avg=('panels_reporting', 'mean'),
-        )
+def build_installations_running_stats(readings_preprocessed: pd.DataFrame) -> pd.DataFrame:
+    """Summarize the readings of each installation into running statistics that merge with those of later readings."""
+    # Map each reading to the position of its installation_id among the sorted installation ids
+    group_codes, installation_ids = pd.factorize(readings_preprocessed['installation_id'], sort=True)
+    num_groups = len(installation_ids)
+
+    panels_reporting = readings_preprocessed['panels_reporting'].to_numpy(dtype=np.int64)
+    panels_reporting_max = np.full(num_groups, np.iinfo(np.int64).min, dtype=np.int64)
+    np.maximum.at(panels_reporting_max, group_codes, panels_reporting)
+    reporting_max = panels_reporting == panels_reporting_max[group_codes]
+
+    return pd.DataFrame({
+        'installation_id': installation_ids,
+        'readings_count': np.bincount(group_codes, minlength=num_groups),
+        'panels_reporting_sum': np.bincount(group_codes, weights=panels_reporting, minlength=num_groups).astype(np.int64),
+        'panels_reporting_max': panels_reporting_max,
+        'panels_reporting_max_count': np.bincount(group_codes, weights=reporting_max, minlength=num_groups).astype(np.int64),
+    })
+
+@ensure_dataframe
+def merge_installations_running_stats(running_stats: pd.DataFrame, new_running_stats: pd.DataFrame) -> pd.DataFrame:
+    """Merge the running statistics of earlier and later readings of each installation."""
+    stats = pd.concat([running_stats, new_running_stats], ignore_index=True)
+
+    # Readings reporting a max that was since exceeded no longer count towards the max
+    panels_reporting_max = stats.groupby('installation_id')['panels_reporting_max'].transform('max')
+    stats['panels_reporting_max_count'] = stats['panels_reporting_max_count'].where(stats['panels_reporting_max'] == panels_reporting_max, 0)
+
+    return stats.groupby('installation_id', as_index=False).agg(
+        readings_count=('readings_count', 'sum'),
+        panels_reporting_sum=('panels_reporting_sum', 'sum'),
+        panels_reporting_max=('panels_reporting_max', 'max'),
+        panels_reporting_max_count=('panels_reporting_max_count', 'sum'),
     )
 
-    installations_feature_engineered['community'] = installations_feature_engineered['community'].astype(cat_dtype)
+@ensure_dataframe
+def installations_features_from_running_stats(installations_preprocessed: pd.DataFrame, running_stats: pd.DataFrame) -> pd.DataFrame:
+    """Build the installations features table from the running statistics of each installation."""
+    community = installations_preprocessed.set_index('installation_id')['community']
+    readings_count = running_stats['readings_count'].to_numpy()
 
-    return installations_feature_engineered
+    return pd.DataFrame({
+        'installation_id': running_stats['installation_id'].to_numpy(),
+        'community': community.reindex(running_stats['installation_id']).array,
+        'panels_reporting_max': running_stats['panels_reporting_max'].to_numpy().astype(column_dtype('panels_reporting_max', 'int64')),
+        # Share of readings in which an installation reported its maximum number of panels
+        'panels_reporting_efficiency': running_stats['panels_reporting_max_count'].to_numpy() / readings_count,
+        'panels_reporting_avg': running_stats['panels_reporting_sum'].to_numpy() / readings_count,
+    })
 
+@instrument
+@ensure_dataframe
+def build_installations_features(installations_preprocessed: pd.DataFrame, readings_preprocessed: pd.DataFrame) -> pd.DataFrame:
+    """Build additional features onto the installations table from the readings of each installation."""
+    return installations_features_from_running_stats(
+        installations_preprocessed,
+        build_installations_running_stats(readings_preprocessed),
+    )
+
+@instrument
 @ensure_dataframe
 def build_readings_features(readings_preprocessed: pd.DataFrame) -> pd.DataFrame:
-    """Build additional features onto the readings table."""
+    """Build additional features onto the readings table, including the time features configured in feature_engineering.time_features."""
     readings_feature_engineered = readings_preprocessed.copy()
 
     # Compute watt-hours per 5-minute interval
-    readings_feature_engineered['energy_prod_wh_5min'] = readings_preprocessed['avg_power_watts_5min'] * 300 / 3600
+    energy_prod_wh_5min = readings_preprocessed['avg_power_watts_5min'] * 300 / 3600
+    readings_feature_engineered['energy_prod_wh_5min'] = energy_prod_wh_5min.astype(column_dtype('energy_prod_wh_5min', 'float64'))
+
+    # Compute lags, rolling means, day-to-date totals, gap flags and clear-sky ratios per installation
+    time_features = build_time_features(readings_feature_engineered)
+    for col in time_features.columns:
+        readings_feature_engineered[col] = time_features[col]
 
     return readings_feature_engineered
 
+@instrument
+def build_features_shard(readings_preprocessed: pd.DataFrame, basename: str) -> pd.DataFrame:
+    """Build, validate and append the features of one installation shard, returning its running statistics."""
+    readings_feature_engineered = build_readings_features(readings_preprocessed)
+    validate_readings_feature_engineered(readings_feature_engineered)
+
+    if not readings_feature_engineered.empty:
+        with ParquetAppender('readings_feature_engineered', basename=basename) as readings_parquet:
+            readings_parquet.append(readings_feature_engineered)
+
+    return build_installations_running_stats(readings_preprocessed)
+
+@instrument
+def build_features_in_shards(readings_preprocessed: pd.DataFrame, workers: int) -> pd.DataFrame:
+    """Build readings features on installation shards in a process pool of workers, returning the running statistics."""
+    num_shards = shard_count(workers)
+
+    with shard_pool(workers) as pool:
+        running_stats = map_shards(
+            pool,
+            build_features_shard,
+            split_installation_shards(readings_preprocessed, num_shards),
+            [f'part-shard-{shard}' for shard in range(num_shards)],
+        )
+
+    return pd.concat(running_stats).sort_values('installation_id', ignore_index=True)
+
+@instrument
 def build_feature_dataset(
     installations_preprocessed: pd.DataFrame,
     readings_preprocessed: pd.DataFrame,
-    feature_engineered_exists: bool = False
+    feature_engineered_current: bool = False
 ) -> tuple[pd.DataFrame, pd.DataFrame]:
-    """Build features into installations and readings tables."""
-    if feature_engineered_exists:
-        installations_feature_engineered = pd.read_parquet(from_root(FILEPATHS['installations_feature_engineered']))
-        readings_feature_engineered = pd.read_parquet(from_root(FILEPATHS['readings_feature_engineered']))
-
-        # Validate feature-engineered data
-        validate_installations_feature_engineered(installations_feature_engineered)
-        validate_readings_feature_engineered(readings_feature_engineered)
+    """Build features into installations and readings tables, or read them if the feature-engineered parquets are current."""
+    if feature_engineered_current:
+        # Check the parquets against their specs from footer statistics, then load them into dataframes
+        validate_parquet_statistics('installations_feature_engineered')
+        validate_parquet_statistics('readings_feature_engineered')
+        installations_feature_engineered = load_table('installations_feature_engineered')
+        readings_feature_engineered = load_table('readings_feature_engineered')
 
-        info(f"\U00002705 Successfully read and validated feature-engineered parquets in {FILEPATHS['dir_feature_engineered']} directory")
+        info(f"\U00002705 Successfully read cached feature-engineered parquets in {FILEPATHS['dir_feature_engineered']} directory")
     else:
-        info(f"Missing or invalid feature-engineered parquets in {FILEPATHS['dir_feature_engineered']} directory \U00002014 generating parquets now...")
+        info(f"Missing or stale feature-engineered parquets in {FILEPATHS['dir_feature_engineered']} directory \U00002014 generating parquets now...")
         # Clean up target directory for feature-engineered parquets
+        invalidate_stage('feature_engineering')
         create_clean_directory(FILEPATHS['dir_feature_engineered'])
 
-        # Build engineered features on preprocessed installations table and preprocessed readings table
-        installations_feature_engineered = build_installations_features(installations_preprocessed)
-        readings_feature_engineered = build_readings_features(readings_preprocessed)
+        workers = worker_count()
+        use_duckdb = BACKEND.get('name', 'pandas') == 'duckdb'
+        if use_duckdb and storage_format() != 'parquet':
+            use_duckdb = False
+            info('The duckdb backend only writes parquet stage outputs \U00002014 building readings features with pandas')
 
-        # Validate feature-engineered data
+        if use_duckdb:
+            # Build, validate and save readings features as DuckDB queries over the preprocessed parquets
+            from core.pipeline.duckdb_backend import build_readings_features_duckdb
+            installations_running_stats = build_readings_features_duckdb()
+            readings_feature_engineered = load_table('readings_feature_engineered')
+        elif workers > 1 and partition_columns('readings_feature_engineered'):
+            # Build, validate and save readings features of installation shards in worker processes
+            installations_running_stats = build_features_in_shards(readings_preprocessed, workers)
+            readings_feature_engineered = load_table('readings_feature_engineered')
+        else:
+            # Build, validate and save engineered features on preprocessed readings table
+            installations_running_stats = build_installations_running_stats(readings_preprocessed)
+            readings_feature_engineered = build_readings_features(readings_preprocessed)
+            validate_readings_feature_engineered(readings_feature_engineered)
+            save_table(readings_feature_engineered, 'readings_feature_engineered')
+
+        # Build, validate and save installations features from the running statistics of their readings
+        installations_feature_engineered = installations_features_from_running_stats(installations_preprocessed, installations_running_stats)
         validate_installations_feature_engineered(installations_feature_engineered)
-        validate_readings_feature_engineered(readings_feature_engineered)
+        save_table(installations_feature_engineered, 'installations_feature_engineered')
+        save_table(installations_running_stats, 'installations_running_stats')
 
-        # Save feature-engineered data into parquets
-        installations_feature_engineered.to_parquet(
-            from_root(FILEPATHS['installations_feature_engineered']),
-            index=False,
-        )
-        readings_feature_engineered.to_parquet(
-            from_root(FILEPATHS['readings_feature_engineered']),
-            index=False,
-        )
+        # Materialize daily and hourly rollups of the readings for plots and ad-hoc queries
+        save_rollups(build_rollups(installations_preprocessed, readings_feature_engineered))
+
+        # Record the fingerprint of the inputs the parquets were built from
+        record_stage('feature_engineering', feature_engineering_fingerprint(), FEATURE_ENGINEERED_OUTPUTS, rules=feature_engineering_rules_fingerprint())
         info(f"\U00002705 Successfully generated, saved, read, and validated feature-engineered parquets in {FILEPATHS['dir_feature_engineered']} directory")
 
     return installations_feature_engineered, readings_feature_engineered
 
-def check_feature_engineered_parquets_exist() -> bool:
-    """Return True if all required preprocessed parquet files exist."""
-    filepath_keys = ['installations_feature_engineered', 'readings_feature_engineered']
-    return all(os.path.exists(from_root(FILEPATHS[k])) for k in filepath_keys)
+@instrument
+def append_feature_dataset(installations_preprocessed: pd.DataFrame, new_readings_preprocessed: pd.DataFrame) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Incrementally build features for readings appended to the preprocessed parquets:
+        - Build, validate and append features of the new readings to the existing readings dataset, looking back
+          to earlier readings for their time features
+        - Merge the running statistics of the new readings into the stored running statistics
+        - Rebuild the installations features table from the merged statistics, without rereading earlier readings
+        - Recompute the rollups of the months the new readings fall in
+    Return the updated installations features table and the features of the new readings.
+    """
+    info(f"Appending new readings to feature-engineered parquets in {FILEPATHS['dir_feature_engineered']} directory...")
+    # Forget the stage record so that a failed append forces a full rebuild
+    invalidate_stage('feature_engineering')
+
+    # Build features of the new readings together with the earlier readings their time features look back to
+    history_preprocessed = load_time_feature_history(new_readings_preprocessed)
+    if history_preprocessed.empty:
+        new_readings_feature_engineered = build_readings_features(new_readings_preprocessed)
+    else:
+        new_readings_feature_engineered = (
+            build_readings_features(pd.concat([history_preprocessed, new_readings_preprocessed], ignore_index=True))
+            .iloc[len(history_preprocessed):]
+            .reset_index(drop=True)
+        )
+    if not new_readings_feature_engineered.empty:
+        validate_readings_feature_engineered(new_readings_feature_engineered)
+        with ParquetAppender('readings_feature_engineered', basename=f"append-{datetime.now():%Y%m%d%H%M%S}") as readings_parquet:
+            readings_parquet.append(new_readings_feature_engineered)
+
+    # Communities of the installations before the append, whose rollups are attributed to them
+    previous_communities = load_table('installations_feature_engineered', columns=['installation_id', 'community'])
+
+    installations_running_stats = merge_installations_running_stats(
+        load_table('installations_running_stats'),
+        build_installations_running_stats(new_readings_preprocessed),
+    )
+    installations_feature_engineered = installations_features_from_running_stats(installations_preprocessed, installations_running_stats)
+    validate_installations_feature_engineered(installations_feature_engineered)
+
+    save_table(installations_running_stats, 'installations_running_stats')
+    save_table(installations_feature_engineered, 'installations_feature_engineered')
+
+    # Refresh the rollups of the months that received readings, or every month if an installation changed community
+    communities = previous_communities.merge(installations_feature_engineered[['installation_id', 'community']], on='installation_id')
+    if communities['community_x'].astype(object).equals(communities['community_y'].astype(object)):
+        timestamps = new_readings_feature_engineered['timestamp']
+        refresh_rollups(installations_preprocessed, set(zip(timestamps.dt.year, timestamps.dt.month)))
+    else:
+        refresh_rollups(installations_preprocessed, months=None)
+
+    record_stage('feature_engineering', feature_engineering_fingerprint(), FEATURE_ENGINEERED_OUTPUTS, rules=feature_engineering_rules_fingerprint())
+    info(f"\U00002705 Successfully appended {len(new_readings_feature_engineered)} new readings to feature-engineered parquets in {FILEPATHS['dir_feature_engineered']} directory")
+
+    return installations_feature_engineered, new_readings_feature_engineered
+
+def feature_engineering_fingerprint() -> str:
+    """Return the fingerprint of the preprocessed data, configuration and code the feature-engineered parquets depend on."""
+    return stage_fingerprint(
+        upstream_stages=['preprocessing'],
+        config_sections=FEATURE_ENGINEERING_CONFIG_SECTIONS,
+        modules=FEATURE_ENGINEERING_MODULES,
+    )
+
+def feature_engineering_rules_fingerprint() -> str:
+    """Return the fingerprint of the configuration and code the feature-engineered parquets depend on."""
+    return stage_fingerprint(
+        config_sections=FEATURE_ENGINEERING_CONFIG_SECTIONS,
+        modules=FEATURE_ENGINEERING_MODULES,
+    )
+
+def check_feature_engineered_parquets_current() -> bool:
+    """Return True if the feature-engineered parquets were built from the current preprocessed data, configuration and code."""
+    return is_stage_current('feature_engineering', feature_engineering_fingerprint())
+
+def check_feature_engineered_parquets_appendable() -> bool:
+    """Return True if features of new readings can be appended to the feature-engineered parquets."""
+    return (
+        is_stage_appendable('feature_engineering', feature_engineering_rules_fingerprint())
+        and check_feature_engineered_parquets_current()
+        and bool(partition_columns('readings_feature_engineered'))
+    )
 
 if __name__ == '__main__':
-    installations_preprocessed = pd.read_parquet(from_root(FILEPATHS['installations_preprocessed']))
-    readings_preprocessed = pd.read_parquet(from_root(FILEPATHS['readings_preprocessed']))
+    set_pandas_display_options()
+    installations_preprocessed = load_table('installations_preprocessed')
+    readings_preprocessed = load_table('readings_preprocessed')
 
     installations_feature_engineered, readings_feature_engineered = build_feature_dataset(
         installations_preprocessed=installations_preprocessed,
         readings_preprocessed=readings_preprocessed,
-        feature_engineered_exists=check_feature_engineered_parquets_exist(),
+        feature_engineered_current=check_feature_engineered_parquets_current(),
     )
 
-    print(f'-------------------------------------------------')
-    print(f'| installations_feature_engineered (count: {len(installations_feature_engineered)}) |')
-    print(f'-------------------------------------------------')
-    for col in installations_feature_engineered.columns:
-        print(f'Column: {col} [{installations_feature_engineered[col].dtype}] [num_unique: {installations_feature_engineered[col].nunique()}] [num_NA: {installations_feature_engineered[col].isna().sum()}]')
-
-    print(f'-------------------------------------------------')
-    print(f'| readings_feature_engineered (count: {len(readings_feature_engineered)}) |')
-    print(f'-------------------------------------------------')
-    for col in readings_feature_engineered.columns:
-        print(f'Column: {col} [{readings_feature_engineered[col].dtype}] [num_unique: {readings_feature_engineered[col].nunique()}] [num_NA: {readings_feature_engineered[col].isna().sum()}]')
+    print_profile('installations_feature_engineered', table_profile('installations_feature_engineered', installations_feature_engineered))
+    print_profile('readings_feature_engineered', table_profile('readings_feature_engineered', readings_feature_engineered))
@@ -0,0 +1,273 @@
+"""Index of the reporting history of each installation, stored as run-length intervals over the reading grid."""
+import numpy as np
+import pandas as pd
+
+from core.pipeline.time_features import is_daylight
+from core.utils.cache import invalidate_stage, is_stage_appendable, is_stage_current, record_stage, stage_fingerprint
+from core.utils.config import FILEPATHS, REPORTING_INDEX
+from core.utils.instrumentation import instrument
+from core.utils.logger import info
+from core.utils.pd_config import set_pandas_display_options
+from core.utils.schema import cast_columns
+from core.utils.storage import load_table, save_table
+from core.utils.utils import create_clean_directory, ensure_dataframe
+from core.utils.validation import validate_reporting_intervals
+
+# Stage outputs written by build_reporting_index
+REPORTING_INDEX_OUTPUTS = ['reporting_intervals']
+
+# Configuration and code the reporting index depends on
+REPORTING_INDEX_CONFIG_SECTIONS = ['reporting_index', 'storage', 'schema']
+REPORTING_INDEX_MODULES = [
+    'core.pipeline.reporting_index',
+    'core.utils.schema',
+    'core.utils.storage',
+    'core.utils.validation',
+]
+
+# Readings columns the reporting index is built from
+REPORTING_INDEX_SOURCE_COLUMNS = ['installation_id', 'timestamp', 'panels_reporting']
+
+def _grid_interval() -> pd.Timedelta:
+    """Return the interval between consecutive readings of an installation that reports without gaps."""
+    return pd.Timedelta(REPORTING_INDEX.get('grid_interval', '5min'))
+
+def _merge_runs(runs: pd.DataFrame) -> pd.DataFrame:
+    """Merge touching runs of an installation with the same panels maximum, sorted by installation_id and start."""
+    installation_ids = runs['installation_id'].to_numpy()
+    starts, ends = runs['start'].to_numpy(), runs['end'].to_numpy()
+    panels_reporting_max = runs['panels_reporting_max'].to_numpy()
+
+    same_installation = np.zeros(len(runs), dtype=bool)
+    same_installation[1:] = installation_ids[1:] == installation_ids[:-1]
+    continues = same_installation.copy()
+    continues[1:] &= (starts[1:] == ends[:-1]) & (panels_reporting_max[1:] == panels_reporting_max[:-1])
+
+    run_starts = np.flatnonzero(~continues)
+    run_ends = np.append(run_starts[1:], len(runs)) - 1
+    merged = pd.DataFrame({
+        'installation_id': installation_ids[run_starts],
+        'start': starts[run_starts],
+        'end': ends[run_ends],
+        'readings_count': np.add.reduceat(runs['readings_count'].to_numpy(), run_starts) if len(runs) else np.array([], dtype=np.int64),
+        'panels_reporting_max': panels_reporting_max[run_starts],
+    })
+
+    # Panels reported fewer than in the previous run of the same installation
+    previous_max = np.roll(merged['panels_reporting_max'].to_numpy(), 1)
+    first_run = np.ones(len(merged), dtype=bool)
+    first_run[1:] = merged['installation_id'].to_numpy()[1:] != merged['installation_id'].to_numpy()[:-1]
+    merged['panels_lost'] = np.where(first_run, 0, np.maximum(previous_max - merged['panels_reporting_max'].to_numpy(), 0)).astype(np.int64)
+
+    return cast_columns(merged, {'installation_id': 'int64', 'panels_reporting_max': 'int64'})
+
+@instrument
+@ensure_dataframe
+def build_reporting_intervals(readings_preprocessed: pd.DataFrame) -> pd.DataFrame:
+    """Build the reporting runs of each installation, split at missed grid steps and day boundaries."""
+    installation_ids = readings_preprocessed['installation_id'].to_numpy(dtype=np.int64)
+    timestamps = readings_preprocessed['timestamp'].to_numpy(dtype='datetime64[ns]')
+    order = np.lexsort((timestamps, installation_ids))
+    installation_ids, timestamps = installation_ids[order], timestamps[order]
+    panels_reporting = readings_preprocessed['panels_reporting'].to_numpy(dtype=np.int64)[order]
+
+    grid = _grid_interval().to_timedelta64()
+    new_piece = np.ones(len(timestamps), dtype=bool)
+    new_piece[1:] = (
+        (installation_ids[1:] != installation_ids[:-1])
+        | (timestamps[1:] - timestamps[:-1] > grid)
+        | (timestamps[1:].astype('datetime64[D]') != timestamps[:-1].astype('datetime64[D]'))
+    )
+    piece_starts = np.flatnonzero(new_piece)
+    piece_ends = np.append(piece_starts[1:], len(timestamps)) - 1
+
+    pieces = pd.DataFrame({
+        'installation_id': installation_ids[piece_starts],
+        'start': timestamps[piece_starts],
+        'end': timestamps[piece_ends] + grid,
+        'readings_count': piece_ends - piece_starts + 1,
+        'panels_reporting_max': np.maximum.reduceat(panels_reporting, piece_starts) if len(panels_reporting) else np.array([], dtype=np.int64),
+    })
+
+    return _merge_runs(pieces)
+
+@instrument
+def build_reporting_index(readings_preprocessed: pd.DataFrame, reporting_index_current: bool = False) -> pd.DataFrame:
+    """Build, validate and save the reporting index of the preprocessed readings, or read it if it is current."""
+    if reporting_index_current:
+        reporting_intervals = load_table('reporting_intervals')
+        info(f"\U00002705 Successfully read cached reporting index in {FILEPATHS['dir_reporting_index']} directory")
+    else:
+        info(f"Missing or stale reporting index in {FILEPATHS['dir_reporting_index']} directory \U00002014 generating index now...")
+        invalidate_stage('reporting_index')
+        create_clean_directory(FILEPATHS['dir_reporting_index'])
+
+        reporting_intervals = build_reporting_intervals(readings_preprocessed[REPORTING_INDEX_SOURCE_COLUMNS])
+        validate_reporting_intervals(reporting_intervals)
+        save_table(reporting_intervals, 'reporting_intervals')
+
+        record_stage('reporting_index', reporting_index_fingerprint(), REPORTING_INDEX_OUTPUTS, rules=reporting_index_rules_fingerprint())
+        info(f"\U00002705 Successfully generated, saved, and validated reporting index of {len(reporting_intervals)} runs in {FILEPATHS['dir_reporting_index']} directory")
+
+    return reporting_intervals
+
+@instrument
+@ensure_dataframe
+def append_reporting_index(new_readings_preprocessed: pd.DataFrame) -> pd.DataFrame:
+    """Update the reporting index with readings appended to the preprocessed parquets."""
+    invalidate_stage('reporting_index')
+    reporting_intervals = load_table('reporting_intervals')
+
+    if not new_readings_preprocessed.empty:
+        first_new = new_readings_preprocessed.groupby('installation_id')['timestamp'].min()
+        last_runs = reporting_intervals.groupby('installation_id')[['start', 'end']].max().reindex(first_new.index)
+        cutoffs = first_new.where(~(first_new <= last_runs['end']), last_runs['start'])
+
+        readings = load_table(
+            'readings_preprocessed',
+            columns=REPORTING_INDEX_SOURCE_COLUMNS,
+            start=cutoffs.min(),
+            installation_ids=first_new.index.tolist(),
+        )
+        readings = readings[readings['timestamp'].to_numpy() >= cutoffs.reindex(readings['installation_id']).to_numpy()]
+
+        # Keep the runs before the cutoff of each installation, and every run of installations without new readings
+        run_cutoffs = cutoffs.reindex(reporting_intervals['installation_id']).to_numpy()
+        kept = reporting_intervals[pd.isna(run_cutoffs) | (reporting_intervals['start'].to_numpy() < run_cutoffs)]
+        reporting_intervals = _merge_runs(
+            pd.concat([kept, build_reporting_intervals(readings)], ignore_index=True)
+            .sort_values(['installation_id', 'start'], ignore_index=True)
+        )
+
+    validate_reporting_intervals(reporting_intervals)
+    save_table(reporting_intervals, 'reporting_intervals')
+
+    record_stage('reporting_index', reporting_index_fingerprint(), REPORTING_INDEX_OUTPUTS, rules=reporting_index_rules_fingerprint())
+    info(f"\U00002705 Successfully updated reporting index to {len(reporting_intervals)} runs in {FILEPATHS['dir_reporting_index']} directory")
+
+    return reporting_intervals
+
+def _outages(reporting_intervals: pd.DataFrame) -> pd.DataFrame:
+    """Return the gap after each run: when the installation went dark, and when it reported again (NaT if it has not)."""
+    runs = reporting_intervals.sort_values(['installation_id', 'start'], ignore_index=True)
+    last_run = runs['installation_id'] != runs['installation_id'].shift(-1)
+
+    return pd.DataFrame({
+        'installation_id': runs['installation_id'],
+        'dark_since': runs['end'],
+        'back_at': runs['start'].shift(-1).where(~last_run),
+        'panels_reporting_max': runs['panels_reporting_max'],
+    })
+
+def installations_gone_dark(reporting_intervals: pd.DataFrame, start, end, min_outage=None) -> pd.DataFrame:
+    """Return the installations that went dark for at least min_outage at some time in [start, end)."""
+    min_outage = pd.Timedelta(min_outage or REPORTING_INDEX.get('min_outage', '1D'))
+    index_end = reporting_intervals['end'].max()
+    outages = _outages(reporting_intervals)
+
+    outage_end = outages['back_at'].fillna(index_end)
+    gone_dark = (
+        (outages['dark_since'] >= pd.Timestamp(start))
+        & (outages['dark_since'] < pd.Timestamp(end))
+        & (outage_end - outages['dark_since'] >= min_outage)
+    )
+    return outages[gone_dark].reset_index(drop=True)
+
+def panel_drops(reporting_intervals: pd.DataFrame, start, end, min_panels_lost: int = 1) -> pd.DataFrame:
+    """Return the runs starting in [start, end) in which an installation reported at least min_panels_lost fewer panels than before."""
+    drops = (
+        (reporting_intervals['start'] >= pd.Timestamp(start))
+        & (reporting_intervals['start'] < pd.Timestamp(end))
+        & (reporting_intervals['panels_lost'] >= min_panels_lost)
+    )
+    return reporting_intervals.loc[drops, ['installation_id', 'start', 'panels_reporting_max', 'panels_lost']].reset_index(drop=True)
+
+def _split_by_period(starts: np.ndarray, ends: np.ndarray, boundaries: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """Split the intervals [starts, ends) at period boundaries. Return the interval and period position, start and end of each piece."""
+    first = np.searchsorted(boundaries, starts, side='right') - 1
+    last = np.searchsorted(boundaries, ends - np.timedelta64(1, 'ns'), side='right') - 1
+    pieces = np.maximum(last - first + 1, 0)
+
+    interval = np.repeat(np.arange(len(starts)), pieces)
+    period = first[interval] + np.arange(len(interval)) - np.repeat(np.cumsum(pieces) - pieces, pieces)
+    piece_starts = np.maximum(starts[interval], boundaries[period])
+    piece_ends = np.minimum(ends[interval], boundaries[period + 1])
+
+    return interval, period, piece_starts, piece_ends
+
+def _expected_slots(index_start: pd.Timestamp, index_end: pd.Timestamp) -> tuple[np.ndarray, np.ndarray]:
+    """Return the grid slots of the index and the running count of its daylight slots, or of every slot without a clear-sky location."""
+    grid = _grid_interval()
+    slots = pd.date_range(index_start.floor(grid), index_end, freq=grid, inclusive='left').to_numpy()
+    expected = is_daylight(slots)
+    if expected is None:
+        expected = np.ones(len(slots), dtype=bool)
+    return slots, np.concatenate([[0], np.cumsum(expected)])
+
+def reporting_completeness(reporting_intervals: pd.DataFrame, installations_preprocessed: pd.DataFrame, freq: str = 'MS') -> pd.DataFrame:
+    """Return the share of daylight grid slots each community reported in per period of frequency freq."""
+    index_start, index_end = reporting_intervals['start'].min(), reporting_intervals['end'].max()
+    offset = pd.tseries.frequencies.to_offset(freq)
+    boundaries = pd.date_range(index_start.normalize() - offset, index_end + offset, freq=freq).to_numpy()
+    slots, expected_before = _expected_slots(index_start, index_end)
+
+    community = installations_preprocessed.set_index('installation_id')['community']
+    first_starts = reporting_intervals.groupby('installation_id')['start'].min()
+
+    counts = {}
+    for name, installation_ids, starts, ends in [
+        ('reported_slots', reporting_intervals['installation_id'], reporting_intervals['start'], reporting_intervals['end']),
+        ('expected_slots', first_starts.index, first_starts, np.full(len(first_starts), index_end)),
+    ]:
+        interval, period, piece_starts, piece_ends = _split_by_period(np.asarray(starts, dtype='datetime64[ns]'), np.asarray(ends, dtype='datetime64[ns]'), boundaries)
+        counts[name] = (
+            pd.DataFrame({
+                'community': community.reindex(np.asarray(installation_ids)[interval]).array,
+                'period': boundaries[period],
+                name: expected_before[np.searchsorted(slots, piece_ends)] - expected_before[np.searchsorted(slots, piece_starts)],
+            })
+            .groupby(['community', 'period'], observed=True, dropna=False)[name]
+            .sum()
+        )
+
+    completeness = pd.concat(counts, axis=1).fillna(0).astype('int64').reset_index()
+    completeness['completeness'] = completeness['reported_slots'] / completeness['expected_slots']
+    return completeness
+
+def reporting_index_fingerprint() -> str:
+    """Return the fingerprint of the preprocessed data, configuration and code the reporting index depends on."""
+    return stage_fingerprint(
+        upstream_stages=['preprocessing'],
+        config_sections=REPORTING_INDEX_CONFIG_SECTIONS,
+        modules=REPORTING_INDEX_MODULES,
+    )
+
+def reporting_index_rules_fingerprint() -> str:
+    """Return the fingerprint of the configuration and code the reporting index depends on."""
+    return stage_fingerprint(
+        config_sections=REPORTING_INDEX_CONFIG_SECTIONS,
+        modules=REPORTING_INDEX_MODULES,
+    )
+
+def check_reporting_index_current() -> bool:
+    """Return True if the reporting index was built from the current preprocessed data, configuration and code."""
+    return is_stage_current('reporting_index', reporting_index_fingerprint())
+
+def check_reporting_index_appendable() -> bool:
+    """Return True if the reporting index is current and can be updated with appended readings."""
+    return is_stage_appendable('reporting_index', reporting_index_rules_fingerprint()) and check_reporting_index_current()
+
+if __name__ == '__main__':
+    set_pandas_display_options()
+    reporting_index_current = check_reporting_index_current()
+    readings_preprocessed = (
+        pd.DataFrame(columns=REPORTING_INDEX_SOURCE_COLUMNS) if reporting_index_current
+        else load_table('readings_preprocessed', columns=REPORTING_INDEX_SOURCE_COLUMNS)
+    )
+    reporting_intervals = build_reporting_index(readings_preprocessed, reporting_index_current=reporting_index_current)
+    installations_preprocessed = load_table('installations_preprocessed')
+
+    print(f'-------------------------------------------------')
+    print(f'| reporting_intervals (count: {len(reporting_intervals)}) |')
+    print(f'-------------------------------------------------')
+    print(reporting_completeness(reporting_intervals, installations_preprocessed))
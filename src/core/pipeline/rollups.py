@@ -0,0 +1,113 @@
+"""Daily and hourly rollups of the feature-engineered readings per installation and per community."""
+import pandas as pd
+
+from core.utils.instrumentation import instrument
+from core.utils.logger import info
+from core.utils.schema import column_dtype
+from core.utils.storage import drop_partitions, load_table, partition_columns, save_table
+from core.utils.utils import ensure_dataframe
+from core.utils.validation import validate_community_rollup, validate_installation_daily
+
+# Stage outputs written by save_rollups
+ROLLUP_OUTPUTS = [
+    'installation_daily',
+    'community_daily',
+    'community_hourly',
+]
+
+# Readings columns the rollups are computed from
+ROLLUP_SOURCE_COLUMNS = ['installation_id', 'timestamp', 'panels_reporting', 'energy_prod_wh_5min']
+
+def _installation_periods(readings_feature_engineered: pd.DataFrame, freq: str) -> pd.DataFrame:
+    """Aggregate readings per installation and period of length freq."""
+    return (
+        readings_feature_engineered
+        .assign(
+            timestamp=readings_feature_engineered['timestamp'].dt.floor(freq),
+            # Sum energy in float64 even under the compact schema
+            energy_prod_wh_5min=readings_feature_engineered['energy_prod_wh_5min'].astype('float64'),
+        )
+        .groupby(['installation_id', 'timestamp'], as_index=False)
+        .agg(
+            readings_count=('panels_reporting', 'size'),
+            energy_prod_wh=('energy_prod_wh_5min', 'sum'),
+            panels_reporting_max=('panels_reporting', 'max'),
+        )
+    )
+
+def _coarsen_installation_periods(installation_periods: pd.DataFrame, freq: str) -> pd.DataFrame:
+    """Merge installation rollup periods into longer periods of length freq."""
+    return (
+        installation_periods
+        .assign(timestamp=installation_periods['timestamp'].dt.floor(freq))
+        .groupby(['installation_id', 'timestamp'], as_index=False)
+        .agg(
+            readings_count=('readings_count', 'sum'),
+            energy_prod_wh=('energy_prod_wh', 'sum'),
+            panels_reporting_max=('panels_reporting_max', 'max'),
+        )
+    )
+
+@ensure_dataframe
+def build_community_rollup(installations_preprocessed: pd.DataFrame, installation_periods: pd.DataFrame) -> pd.DataFrame:
+    """Aggregate an installation rollup per community of each installation in the installations dimension table."""
+    community = installations_preprocessed.set_index('installation_id')['community']
+
+    community_periods = (
+        installation_periods
+        .assign(community=community.reindex(installation_periods['installation_id']).array)
+        .groupby(['community', 'timestamp'], observed=True, dropna=False, as_index=False)
+        .agg(
+            readings_count=('readings_count', 'sum'),
+            energy_prod_wh=('energy_prod_wh', 'sum'),
+            active_panels=('panels_reporting_max', 'sum'),
+        )
+    )
+    community_periods['community'] = community_periods['community'].astype('category')
+    community_periods['active_panels'] = community_periods['active_panels'].astype('int64')
+
+    return community_periods
+
+@instrument
+@ensure_dataframe
+def build_rollups(installations_preprocessed: pd.DataFrame, readings_feature_engineered: pd.DataFrame) -> dict[str, pd.DataFrame]:
+    """Build every rollup from the feature-engineered readings, coarsening hourly aggregates into daily ones."""
+    installation_hourly = _installation_periods(readings_feature_engineered[ROLLUP_SOURCE_COLUMNS], 'h')
+    installation_daily = _coarsen_installation_periods(installation_hourly, 'D')
+    installation_daily['panels_reporting_max'] = installation_daily['panels_reporting_max'].astype(column_dtype('panels_reporting_max', 'int64'))
+
+    return {
+        'installation_daily': installation_daily,
+        'community_daily': build_community_rollup(installations_preprocessed, installation_daily),
+        'community_hourly': build_community_rollup(installations_preprocessed, installation_hourly),
+    }
+
+@instrument
+def save_rollups(rollups: dict[str, pd.DataFrame]) -> None:
+    """Validate and save rollups built by build_rollups."""
+    validate_installation_daily(rollups['installation_daily'])
+    validate_community_rollup(rollups['community_daily'])
+    validate_community_rollup(rollups['community_hourly'])
+
+    for key, rollup in rollups.items():
+        save_table(rollup, key)
+
+@instrument
+def refresh_rollups(installations_preprocessed: pd.DataFrame, months: set[tuple[int, int]] | None) -> None:
+    """Recompute the rollup partitions of months, (year, month) pairs, or every rollup if months is None."""
+    if months is None or any(partition_columns(key) != ['year', 'month'] for key in ROLLUP_OUTPUTS):
+        readings = load_table('readings_feature_engineered', columns=ROLLUP_SOURCE_COLUMNS)
+        for key in ROLLUP_OUTPUTS:
+            drop_partitions(key, [()])
+        save_rollups(build_rollups(installations_preprocessed, readings))
+        return
+
+    for year, month in sorted(months):
+        start = pd.Timestamp(year=year, month=month, day=1)
+        readings = load_table('readings_feature_engineered', columns=ROLLUP_SOURCE_COLUMNS, start=start, end=start + pd.offsets.MonthBegin())
+
+        for key in ROLLUP_OUTPUTS:
+            drop_partitions(key, [(year, month)])
+        save_rollups(build_rollups(installations_preprocessed, readings))
+
+        info(f'Refreshed rollups of {year}-{month:02d} ({len(readings)} readings)')
@@ -0,0 +1,206 @@
+"""Per-installation time-series features of the readings, declared in feature_engineering.time_features of config.json."""
+import numpy as np
+import pandas as pd
+
+from core.utils.config import FEATURE_ENGINEERING
+from core.utils.instrumentation import instrument
+from core.utils.schema import column_dtype
+from core.utils.storage import load_table
+from core.utils.utils import ensure_dataframe
+from core.utils.validation import register_columns
+
+# Base dtypes of the readings columns time features can be computed from
+SOURCE_DTYPES = {
+    'panels_reporting': 'int64',
+    'avg_power_watts_5min': 'float64',
+    'energy_prod_wh_5min': 'float64',
+}
+
+def _time_features() -> dict:
+    """Return the feature_engineering.time_features section of config.json."""
+    return FEATURE_ENGINEERING.get('time_features', {})
+
+def time_feature_columns() -> dict[str, tuple[str, str, str | None]]:
+    """Return the (kind, source column, offset) of each time feature in the config in effect, by feature column name."""
+    time_features = _time_features()
+    columns = {}
+    for col, offsets in time_features.get('lags', {}).items():
+        for offset in offsets:
+            columns[f'{col}_lag_{offset}'] = ('lag', col, offset)
+    for col, windows in time_features.get('rolling_means', {}).items():
+        for window in windows:
+            columns[f'{col}_rolling_mean_{window}'] = ('rolling_mean', col, window)
+    for col in time_features.get('day_to_date_totals', []):
+        columns[f'{col}_day_to_date'] = ('day_to_date', col, None)
+    if time_features.get('gap_threshold'):
+        columns['gap_before'] = ('gap', 'timestamp', time_features['gap_threshold'])
+    for col in time_features.get('clear_sky', {}).get('columns', []):
+        columns[f'{col}_clear_sky_ratio'] = ('clear_sky', col, None)
+    return columns
+
+def _feature_dtype(kind: str, source: str) -> str:
+    """Return the dtype of a time feature: bool for gap flags, float in the precision of its source column otherwise."""
+    if kind == 'gap':
+        return 'bool'
+    return column_dtype(source, 'float64') if SOURCE_DTYPES.get(source) == 'float64' else 'float64'
+
+def time_feature_spec() -> dict[str, dict]:
+    """Return the validation spec of the time feature columns; lags and clear-sky ratios are null where they are undefined."""
+    return {
+        name: {'dtype': _feature_dtype(kind, source), 'allow_null': kind in ('lag', 'clear_sky')}
+        for name, (kind, source, _) in time_feature_columns().items()
+    }
+
+# Time feature columns are part of the feature-engineered readings, with dtypes that follow the schema in effect
+register_columns('readings_feature_engineered', time_feature_spec)
+
+def time_feature_lookback() -> pd.Timedelta:
+    """Return how far back before a reading the configured time features look."""
+    lookbacks = [pd.Timedelta(offset) for kind, _, offset in time_feature_columns().values() if offset is not None]
+    if any(kind == 'day_to_date' for kind, _, _ in time_feature_columns().values()):
+        lookbacks.append(pd.Timedelta('1D'))
+    return max(lookbacks, default=pd.Timedelta(0))
+
+def _segment_keys(installation_ids: np.ndarray, timestamps: np.ndarray, offsets: list[int]) -> tuple[np.ndarray, int]:
+    """Return keys of sorted readings that increase across installations by more than any offset, and their time unit in ns."""
+    relative = timestamps - timestamps.min()
+    unit = max(int(np.gcd.reduce(np.concatenate([relative, np.asarray(offsets, dtype=np.int64)]))), 1)
+    span = int(relative.max()) // unit + max(offsets, default=0) // unit + 1
+
+    segments = np.concatenate([[0], np.cumsum(installation_ids[1:] != installation_ids[:-1])])
+    if (int(segments[-1]) + 1) * span >= np.iinfo(np.int64).max:
+        raise OverflowError('Time feature keys overflow int64: timestamps are too fine-grained for their time range')
+
+    return segments * span + relative // unit, unit
+
+def _block_starts(installation_ids: np.ndarray, blocks: np.ndarray) -> np.ndarray:
+    """Return whether each reading sorted by installation and timestamp starts a run of readings of one installation and block."""
+    starts = np.ones(len(installation_ids), dtype=bool)
+    starts[1:] = (installation_ids[1:] != installation_ids[:-1]) | (blocks[1:] != blocks[:-1])
+    return starts
+
+def _block_cumsum(values: np.ndarray, starts: np.ndarray, reverse: bool = False) -> np.ndarray:
+    """Return the running sums of values within each run beginning at starts, from its end if reverse."""
+    # Sums restart at each run rather than subtracting entries of one long cumulative sum, which loses precision
+    runs = np.cumsum(starts)
+    values = pd.Series(values.astype(np.float64, copy=False))
+    if reverse:
+        return values[::-1].groupby(runs[::-1]).cumsum().to_numpy()[::-1]
+    return values.groupby(runs).cumsum().to_numpy()
+
+def _clear_sky_irradiance(timestamps: np.ndarray) -> np.ndarray:
+    """Return the Haurwitz clear-sky irradiance in W/m2 at local timestamps, at the configured location."""
+    clear_sky = _time_features()['clear_sky']
+    latitude, longitude = np.radians(clear_sky['latitude']), clear_sky['longitude']
+
+    codes, unique_timestamps = pd.factorize(timestamps)
+    # Ambiguous wall times at the end of daylight saving time are read as standard time
+    utc = (
+        pd.DatetimeIndex(unique_timestamps)
+        .tz_localize(clear_sky.get('timezone', 'UTC'), ambiguous=np.zeros(len(unique_timestamps), dtype=bool), nonexistent='shift_forward')
+        .tz_convert('UTC')
+    )
+    hour = (utc.hour + utc.minute / 60 + utc.second / 3600).to_numpy()
+    gamma = 2 * np.pi / 365 * (utc.dayofyear.to_numpy() - 1 + (hour - 12) / 24)
+
+    equation_of_time = 229.18 * (
+        0.000075 + 0.001868 * np.cos(gamma) - 0.032077 * np.sin(gamma) - 0.014615 * np.cos(2 * gamma) - 0.040849 * np.sin(2 * gamma)
+    )
+    declination = (
+        0.006918 - 0.399912 * np.cos(gamma) + 0.070257 * np.sin(gamma) - 0.006758 * np.cos(2 * gamma)
+        + 0.000907 * np.sin(2 * gamma) - 0.002697 * np.cos(3 * gamma) + 0.00148 * np.sin(3 * gamma)
+    )
+    hour_angle = np.radians((hour * 60 + equation_of_time + 4 * longitude) / 4 - 180)
+    cos_zenith = np.sin(latitude) * np.sin(declination) + np.cos(latitude) * np.cos(declination) * np.cos(hour_angle)
+
+    with np.errstate(divide='ignore', over='ignore'):
+        irradiance = np.where(cos_zenith > 0, 1098 * cos_zenith * np.exp(-0.059 / cos_zenith), 0.0)
+
+    return irradiance[codes]
+
+def is_daylight(timestamps: np.ndarray) -> np.ndarray | None:
+    """Return whether the clear-sky irradiance at local timestamps reaches clear_sky.min_irradiance, or None if clear_sky has no location."""
+    clear_sky = _time_features().get('clear_sky', {})
+    if 'latitude' not in clear_sky:
+        return None
+    return _clear_sky_irradiance(timestamps) >= clear_sky.get('min_irradiance', 50)
+
+def _compute_features(installation_ids: np.ndarray, timestamps: np.ndarray, sources: dict[str, np.ndarray]) -> dict[str, np.ndarray]:
+    """Compute every configured time feature over readings sorted by installation and timestamp."""
+    offsets = {offset: pd.Timedelta(offset).value for _, _, offset in time_feature_columns().values() if offset is not None}
+    keys, unit = _segment_keys(installation_ids, timestamps, list(offsets.values()))
+    positions = np.arange(len(keys))
+
+    features = {}
+    for name, (kind, source, offset) in time_feature_columns().items():
+        if kind == 'lag':
+            target = keys - offsets[offset] // unit
+            index = np.minimum(np.searchsorted(keys, target), len(keys) - 1)
+            features[name] = np.where(keys[index] == target, sources[source][index], np.nan)
+        elif kind == 'rolling_mean':
+            # Windows span the end of the previous block of window length and the start of the reading's own block
+            window_start = np.searchsorted(keys, keys - offsets[offset] // unit, side='right')
+            starts = _block_starts(installation_ids, timestamps // offsets[offset])
+            block_start = np.maximum.accumulate(np.where(starts, positions, 0))
+            previous_block_sum = np.where(window_start < block_start, _block_cumsum(sources[source], starts, reverse=True)[window_start], 0.0)
+            features[name] = (previous_block_sum + _block_cumsum(sources[source], starts)) / (positions + 1 - window_start)
+        elif kind == 'day_to_date':
+            starts = _block_starts(installation_ids, timestamps // pd.Timedelta('1D').value)
+            features[name] = _block_cumsum(sources[source], starts)
+        elif kind == 'gap':
+            window_start = np.searchsorted(keys, keys - offsets[offset] // unit, side='right')
+            features[name] = window_start == positions
+        elif kind == 'clear_sky':
+            irradiance = _clear_sky_irradiance(timestamps.view('datetime64[ns]'))
+            with np.errstate(divide='ignore', invalid='ignore'):
+                features[name] = np.where(
+                    irradiance >= _time_features()['clear_sky'].get('min_irradiance', 50),
+                    sources[source] / irradiance,
+                    np.nan,
+                )
+
+    return features
+
+@instrument
+@ensure_dataframe
+def build_time_features(readings_feature_engineered: pd.DataFrame) -> pd.DataFrame:
+    """Return the configured time features of readings_feature_engineered, aligned with its rows."""
+    spec = time_feature_spec()
+    if not spec or readings_feature_engineered.empty:
+        return pd.DataFrame(
+            {name: pd.Series(dtype=col_spec['dtype']) for name, col_spec in spec.items()},
+            index=readings_feature_engineered.index,
+        )
+
+    installation_ids = readings_feature_engineered['installation_id'].to_numpy(dtype=np.int64)
+    timestamps = readings_feature_engineered['timestamp'].to_numpy(dtype='datetime64[ns]').view(np.int64)
+    source_columns = {source for _, source, _ in time_feature_columns().values()} - {'timestamp'}
+
+    # Compute over installation-sorted arrays and scatter the features back to the original row order
+    order = np.lexsort((timestamps, installation_ids))
+    sorted_features = _compute_features(
+        installation_ids[order],
+        timestamps[order],
+        {col: readings_feature_engineered[col].to_numpy()[order] for col in source_columns},
+    )
+
+    time_features = {}
+    for name, values in sorted_features.items():
+        unsorted = np.empty_like(values)
+        unsorted[order] = values
+        time_features[name] = unsorted.astype(spec[name]['dtype'])
+
+    return pd.DataFrame(time_features, index=readings_feature_engineered.index)
+
+def load_time_feature_history(new_readings_preprocessed: pd.DataFrame) -> pd.DataFrame:
+    """Load the readings within time_feature_lookback before the new readings, of their installations."""
+    lookback = time_feature_lookback()
+    if not time_feature_columns() or lookback == pd.Timedelta(0) or new_readings_preprocessed.empty:
+        return new_readings_preprocessed.iloc[:0]
+
+    return load_table(
+        'readings_feature_engineered',
+        columns=list(new_readings_preprocessed.columns),
+        start=new_readings_preprocessed['timestamp'].min() - lookback,
+        installation_ids=new_readings_preprocessed['installation_id'].unique().tolist(),
+    )
@@ -0,0 +1,185 @@
+"""Cached queries over the stage outputs. Usage: python3 -m core.query energy --community Halifax --start 2021-01-01 --end 2021-02-01"""
+import argparse
+import inspect
+import json
+import threading
+from collections import OrderedDict
+from collections.abc import Callable
+from functools import wraps
+
+import pandas as pd
+
+from core.utils.cache import output_fingerprint
+from core.utils.config import QUERY
+from core.utils.storage import load_table
+
+# Rollup answering energy production queries at each period frequency
+ENERGY_ROLLUPS = {
+    'h': 'community_hourly',
+    'D': 'community_daily',
+    'MS': 'community_daily',
+}
+
+# Installation metrics that installations can be ranked by, by the stage output they are read from
+INSTALLATION_METRICS = {
+    'energy_prod_wh': 'installation_daily',
+    'panels_reporting_efficiency': 'installations_feature_engineered',
+    'panels_reporting_avg': 'installations_feature_engineered',
+}
+
+# Cached query results, least recently used first, with hit and miss counts
+_results = OrderedDict()
+_results_lock = threading.Lock()
+_cache_stats = {'hits': 0, 'misses': 0}
+
+def cached_query(*keys: str) -> Callable:
+    """Decorator to cache the results of a query of the stage outputs keys until one of them is rewritten."""
+    def decorator(func: Callable) -> Callable:
+        signature = inspect.signature(func)
+
+        @wraps(func)
+        def wrapper(*args, **kwargs) -> pd.DataFrame:
+            arguments = signature.bind(*args, **kwargs)
+            arguments.apply_defaults()
+            fingerprint = output_fingerprint(list(keys))
+            cache_key = (func.__qualname__, json.dumps(arguments.arguments, sort_keys=True, default=str), fingerprint)
+
+            with _results_lock:
+                result = _results.get(cache_key) if fingerprint is not None else None
+                if result is not None:
+                    _results.move_to_end(cache_key)
+                    _cache_stats['hits'] += 1
+                    return result.copy()
+                _cache_stats['misses'] += 1
+
+            # Queries run outside the lock, so that a slow query does not hold up cached answers to others
+            result = func(*args, **kwargs)
+
+            if fingerprint is not None:
+                with _results_lock:
+                    _results[cache_key] = result
+                    _results.move_to_end(cache_key)
+                    while len(_results) > QUERY.get('cache_size', 128):
+                        _results.popitem(last=False)
+
+            return result.copy()
+        return wrapper
+    return decorator
+
+def cache_info() -> dict[str, int]:
+    """Return the number of cached results and the cache hits and misses so far."""
+    with _results_lock:
+        return {'size': len(_results), **_cache_stats}
+
+def clear_cache() -> None:
+    """Drop every cached result and reset the hit and miss counts."""
+    with _results_lock:
+        _results.clear()
+        _cache_stats.update(hits=0, misses=0)
+
+@cached_query('community_daily', 'community_hourly')
+def energy_production(
+    communities: list[str] | None = None,
+    start: str | None = None,
+    end: str | None = None,
+    freq: str = 'D',
+) -> pd.DataFrame:
+    """Return the readings count and energy produced of each community per period of frequency freq."""
+    if freq not in ENERGY_ROLLUPS:
+        raise ValueError(f'Unsupported frequency {freq!r}, expected one of {list(ENERGY_ROLLUPS)}')
+
+    rollup = load_table(
+        ENERGY_ROLLUPS[freq],
+        columns=['community', 'timestamp', 'readings_count', 'energy_prod_wh'],
+        start=start,
+        end=end,
+        communities=communities,
+    )
+
+    return (
+        rollup
+        .groupby(['community', pd.Grouper(key='timestamp', freq=freq)], observed=True)
+        .agg(readings_count=('readings_count', 'sum'), energy_prod_wh=('energy_prod_wh', 'sum'))
+        .reset_index()
+    )
+
+@cached_query('installations_feature_engineered')
+def installation_efficiency(installation_ids: list[int] | None = None, communities: list[str] | None = None) -> pd.DataFrame:
+    """Return the community and panels reporting statistics of installations, of every installation by default."""
+    return (
+        load_table('installations_feature_engineered', installation_ids=installation_ids, communities=communities)
+        .sort_values('installation_id', ignore_index=True)
+    )
+
+@cached_query('installation_daily', 'installations_feature_engineered')
+def top_installations(
+    n: int = 10,
+    by: str = 'energy_prod_wh',
+    start: str | None = None,
+    end: str | None = None,
+    communities: list[str] | None = None,
+) -> pd.DataFrame:
+    """Return the n installations with the highest metric by, with their community and rank."""
+    if by not in INSTALLATION_METRICS:
+        raise ValueError(f'Unsupported metric {by!r}, expected one of {list(INSTALLATION_METRICS)}')
+    if n < 1:
+        raise ValueError(f'n must be positive, got {n}')
+    if by != 'energy_prod_wh' and (start is not None or end is not None):
+        raise ValueError(f'{by} covers every reading and cannot be restricted to a period')
+
+    installations = load_table(
+        'installations_feature_engineered',
+        columns=['installation_id', 'community', *([by] if by != 'energy_prod_wh' else [])],
+        communities=communities,
+    )
+    if by == 'energy_prod_wh':
+        installation_daily = load_table(
+            'installation_daily',
+            columns=['installation_id', 'energy_prod_wh'],
+            start=start,
+            end=end,
+            installation_ids=installations['installation_id'].tolist() if communities is not None else None,
+        )
+        energy = installation_daily.groupby('installation_id', as_index=False)['energy_prod_wh'].sum()
+        installations = installations.merge(energy, on='installation_id')
+
+    top = (
+        installations
+        .sort_values([by, 'installation_id'], ascending=[False, True], ignore_index=True)
+        .head(n)
+    )
+    top.insert(0, 'rank', range(1, len(top) + 1))
+
+    return top
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Query the processed datasets.')
+    subparsers = parser.add_subparsers(dest='query', required=True)
+
+    energy = subparsers.add_parser('energy', help='energy production by community and period')
+    energy.add_argument('--community', dest='communities', action='append')
+    energy.add_argument('--start')
+    energy.add_argument('--end')
+    energy.add_argument('--freq', default='D', choices=list(ENERGY_ROLLUPS))
+
+    efficiency = subparsers.add_parser('efficiency', help='reporting efficiency of installations')
+    efficiency.add_argument('--installation-id', dest='installation_ids', type=int, action='append')
+    efficiency.add_argument('--community', dest='communities', action='append')
+
+    top = subparsers.add_parser('top', help='top installations by a metric')
+    top.add_argument('-n', type=int, default=10)
+    top.add_argument('--by', default='energy_prod_wh', choices=list(INSTALLATION_METRICS))
+    top.add_argument('--start')
+    top.add_argument('--end')
+    top.add_argument('--community', dest='communities', action='append')
+
+    args = vars(parser.parse_args())
+    query = {'energy': energy_production, 'efficiency': installation_efficiency, 'top': top_installations}[args.pop('query')]
+
+    from core.utils.pd_config import set_pandas_display_options
+
+    set_pandas_display_options()
+    try:
+        print(query(**args).to_string(index=False))
+    except ValueError as e:
+        parser.error(str(e))
@@ -0,0 +1,106 @@
+"""Local HTTP service answering the queries of core.query as JSON. Usage: python3 -m core.server [--host HOST] [--port PORT]"""
+import argparse
+import json
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from core.query import cache_info, energy_production, installation_efficiency, top_installations
+from core.utils.config import QUERY
+from core.utils.logger import info
+
+# Query of each path, with the argument, type and whether it repeats of each query string parameter
+ROUTES = {
+    '/energy': (energy_production, {
+        'community': ('communities', str, True),
+        'start': ('start', str, False),
+        'end': ('end', str, False),
+        'freq': ('freq', str, False),
+    }),
+    '/efficiency': (installation_efficiency, {
+        'installation_id': ('installation_ids', int, True),
+        'community': ('communities', str, True),
+    }),
+    '/top': (top_installations, {
+        'n': ('n', int, False),
+        'by': ('by', str, False),
+        'start': ('start', str, False),
+        'end': ('end', str, False),
+        'community': ('communities', str, True),
+    }),
+}
+
+def parse_arguments(query_string: str, parameters: dict[str, tuple[str, type, bool]]) -> dict:
+    """Return the query arguments given by a query string. Raise ValueError for unknown, repeated or mistyped parameters."""
+    arguments = {}
+    for name, values in parse_qs(query_string, strict_parsing=bool(query_string)).items():
+        if name not in parameters:
+            raise ValueError(f'Unknown parameter {name!r}, expected some of {list(parameters)}')
+        argument, converter, repeats = parameters[name]
+        if not repeats and len(values) > 1:
+            raise ValueError(f'Parameter {name!r} can only be given once')
+        try:
+            converted = [converter(value) for value in values]
+        except ValueError:
+            raise ValueError(f'Parameter {name!r} must be of type {converter.__name__}')
+        arguments[argument] = converted if repeats else converted[0]
+    return arguments
+
+class QueryHandler(BaseHTTPRequestHandler):
+    """Answer GET requests for the paths in ROUTES with the records of the query result as JSON."""
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        if url.path == '/cache':
+            self._send(HTTPStatus.OK, json.dumps(cache_info()))
+            return
+        if url.path not in ROUTES:
+            self._send_error(HTTPStatus.NOT_FOUND, f'Unknown path {url.path!r}, expected one of {[*ROUTES, "/cache"]}')
+            return
+
+        query, parameters = ROUTES[url.path]
+        try:
+            result = query(**parse_arguments(url.query, parameters))
+        except ValueError as e:
+            self._send_error(HTTPStatus.BAD_REQUEST, str(e))
+        except FileNotFoundError as e:
+            self._send_error(HTTPStatus.SERVICE_UNAVAILABLE, f'Stage outputs have not been built: {e}')
+        except Exception as e:
+            # Any other failure is a bug in the query: report it to the client instead of dropping the connection
+            info(f'Query {self.path!r} failed: {e!r}', log=True, severity='error')
+            self._send_error(HTTPStatus.INTERNAL_SERVER_ERROR, f'Query failed: {type(e).__name__}')
+        else:
+            self._send(HTTPStatus.OK, result.to_json(orient='records', date_format='iso'))
+
+    def _send(self, status: HTTPStatus, body: str) -> None:
+        encoded = body.encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(encoded)))
+        self.end_headers()
+        self.wfile.write(encoded)
+
+    def _send_error(self, status: HTTPStatus, message: str) -> None:
+        self._send(status, json.dumps({'error': message}))
+
+    def log_request(self, code='-', size='-'):
+        # Polling dashboards would flood the console, so only failed requests are reported
+        if int(code) >= HTTPStatus.BAD_REQUEST:
+            info(f'{self.address_string()} "{self.requestline}" {int(code)}')
+
+def serve(host: str, port: int) -> None:
+    """Serve queries on host:port until interrupted."""
+    with ThreadingHTTPServer((host, port), QueryHandler) as server:
+        info(f'\U00002705 Serving queries on http://{host}:{server.server_address[1]}')
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Serve queries over the processed datasets as JSON.')
+    parser.add_argument('--host', default=QUERY.get('host', '127.0.0.1'))
+    parser.add_argument('--port', type=int, default=QUERY.get('port', 8050))
+    args = parser.parse_args()
+
+    serve(args.host, args.port)
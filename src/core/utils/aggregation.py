@@ -0,0 +1,31 @@
+"""Vectorized group-wise aggregation kernels."""
+import numpy as np
+import pandas as pd
+
+def most_frequent_category(
+    group_codes: np.ndarray,
+    num_groups: int,
+    values: pd.Series,
+    weights: np.ndarray | None = None,
+) -> pd.Categorical:
+    """Return the most frequent non-null category within each group, ties going to the first category in sort order."""
+    values = values.astype('category')
+    category_codes = values.cat.codes.to_numpy()
+    num_categories = len(values.cat.categories)
+    not_null = category_codes >= 0
+
+    if num_categories == 0:
+        return pd.Categorical.from_codes(np.full(num_groups, -1), dtype=values.dtype)
+
+    # Count occurrences of every (group, category) pair in one pass
+    counts = np.bincount(
+        group_codes[not_null] * num_categories + category_codes[not_null],
+        weights=None if weights is None else weights[not_null],
+        minlength=num_groups * num_categories,
+    ).reshape(num_groups, num_categories)
+
+    # Take the first maximum over categories in sort order, then map back to codes
+    by_name = np.argsort(values.cat.categories.to_numpy(), kind='stable')
+    most_frequent = np.where(counts.max(axis=1) > 0, by_name[counts[:, by_name].argmax(axis=1)], -1)
+
+    return pd.Categorical.from_codes(most_frequent, dtype=values.dtype)
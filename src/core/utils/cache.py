@@ -0,0 +1,132 @@
+"""Content-hash based cache of pipeline stage outputs."""
+import hashlib
+import importlib.util
+import json
+import os
+import threading
+import uuid
+from datetime import datetime
+
+from core.utils.config import CONFIG, FILEPATHS
+from core.utils.paths import from_root
+from core.utils.storage import table_path
+
+# Bytes read at a time when hashing input files
+HASH_BLOCK_SIZE = 1 << 20
+
+# Held while the manifest is read, changed and saved, so stages running in threads of one process do not lose each other's updates
+_MANIFEST_LOCK = threading.RLock()
+
+def _load_manifest() -> dict:
+    """Load the stage manifest, or an empty manifest if none has been written yet."""
+    path = from_root(FILEPATHS['stage_manifest'])
+    if not os.path.exists(path):
+        return {'stages': {}, 'files': {}}
+    with open(path, 'r') as f:
+        return json.load(f)
+
+def _save_manifest(manifest: dict) -> None:
+    """Atomically replace the stage manifest."""
+    path = from_root(FILEPATHS['stage_manifest'])
+    os.makedirs(path.parent, exist_ok=True)
+    tmp_path = path.with_name(path.name + '.tmp')
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f, indent=4, sort_keys=True)
+    os.replace(tmp_path, path)
+
+def hash_file(key: str) -> str:
+    """Return the content hash of the input file FILEPATHS[key], remembered by size and modification time."""
+    path = from_root(FILEPATHS[key])
+    stat = os.stat(path)
+
+    cached = _load_manifest()['files'].get(key)
+    if cached and cached['size'] == stat.st_size and cached['mtime_ns'] == stat.st_mtime_ns:
+        return cached['digest']
+
+    digest = hashlib.blake2b()
+    with open(path, 'rb') as f:
+        while block := f.read(HASH_BLOCK_SIZE):
+            digest.update(block)
+
+    with _MANIFEST_LOCK:
+        manifest = _load_manifest()
+        manifest['files'][key] = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'digest': digest.hexdigest()}
+        _save_manifest(manifest)
+
+    return digest.hexdigest()
+
+def _hash_modules(modules: list[str]) -> str:
+    """Return a hash of the source code of the named modules."""
+    digest = hashlib.blake2b()
+    for module in sorted(modules):
+        with open(importlib.util.find_spec(module).origin, 'rb') as f:
+            digest.update(module.encode())
+            digest.update(f.read())
+    return digest.hexdigest()
+
+def stage_fingerprint(
+    input_files: list[str] = (),
+    upstream_stages: list[str] = (),
+    config_sections: list[str] = (),
+    modules: list[str] = (),
+) -> str:
+    """
+    Return a fingerprint of everything a stage output depends on:
+        - input_files: FILEPATHS keys of input files, by content hash
+        - upstream_stages: stages whose outputs are inputs, by their recorded fingerprint
+        - config_sections: sections of config.json that parameterize the stage
+        - modules: modules implementing the stage, by source code
+    """
+    manifest = _load_manifest()
+    dependencies = {
+        'input_files': {key: hash_file(key) for key in input_files},
+        'upstream_stages': {stage: manifest['stages'].get(stage, {}).get('fingerprint') for stage in upstream_stages},
+        'config_sections': {section: CONFIG.get(section) for section in config_sections},
+        'modules': _hash_modules(list(modules)),
+    }
+    return hashlib.blake2b(json.dumps(dependencies, sort_keys=True).encode()).hexdigest()
+
+def is_stage_current(stage: str, fingerprint: str) -> bool:
+    """Return True if stage was last built with fingerprint and all of its outputs still exist."""
+    record = _load_manifest()['stages'].get(stage)
+    if record is None or record['fingerprint'] != fingerprint:
+        return False
+    return all(os.path.exists(table_path(key)) for key in record['outputs'])
+
+def invalidate_stage(stage: str) -> None:
+    """Forget the recorded outputs of stage, so an interrupted rebuild is never mistaken for a current one."""
+    with _MANIFEST_LOCK:
+        manifest = _load_manifest()
+        if manifest['stages'].pop(stage, None) is not None:
+            _save_manifest(manifest)
+
+def is_stage_appendable(stage: str, rules: str) -> bool:
+    """Return True if the outputs of stage exist and were built with the configuration and code fingerprint rules."""
+    record = _load_manifest()['stages'].get(stage)
+    if record is None or record.get('rules') != rules:
+        return False
+    return all(os.path.exists(table_path(key)) for key in record['outputs'])
+
+def record_stage(stage: str, fingerprint: str, outputs: list[str], rules: str | None = None) -> None:
+    """Record that the FILEPATHS keys in outputs were built by stage with fingerprint, under a new build id."""
+    with _MANIFEST_LOCK:
+        manifest = _load_manifest()
+        manifest['stages'][stage] = {
+            'fingerprint': fingerprint,
+            'rules': rules,
+            'outputs': outputs,
+            'build': uuid.uuid4().hex,
+            'built_at': datetime.now().isoformat(timespec='seconds'),
+        }
+        _save_manifest(manifest)
+
+def output_fingerprint(keys: list[str]) -> str | None:
+    """Return a fingerprint of the recorded builds of the stage outputs keys, or None if one has no record."""
+    stages = _load_manifest()['stages']
+    builds = {}
+    for key in keys:
+        record = next((record for record in stages.values() if key in record['outputs']), None)
+        if record is None or 'build' not in record:
+            return None
+        builds[key] = record['build']
+    return hashlib.blake2b(json.dumps(builds, sort_keys=True).encode()).hexdigest()
@@ -0,0 +1,81 @@
+"""Canonical dictionary of community names shared by every stage output."""
+import os
+from collections.abc import Iterable
+
+import numpy as np
+import pandas as pd
+
+from core.utils.config import PREPROCESSING
+from core.utils.storage import load_table, save_table, table_path
+
+# Key of the community code table, with one row per community: its code and its name
+COMMUNITY_CODES_KEY = 'community_codes'
+
+# Community dtype of the code table last read, by the size and modification time of the file it was read from
+_cached_dtype = (None, pd.CategoricalDtype([]))
+
+def correct_community_names(community: pd.Series) -> pd.Series:
+    """Convert community to a categorical with preprocessing.community_name_corrections applied to its categories."""
+    if not isinstance(community.dtype, pd.CategoricalDtype):
+        community = community.astype('category')
+
+    corrected = community.cat.categories.to_series().replace(PREPROCESSING['community_name_corrections'])
+    categories = pd.Index(sorted(corrected.unique()))
+    codes = community.cat.codes.to_numpy()
+    corrected_codes = categories.get_indexer(corrected)[codes]
+
+    return pd.Series(
+        pd.Categorical.from_codes(np.where(codes == -1, -1, corrected_codes), categories=categories),
+        index=community.index,
+        name=community.name,
+    )
+
+def community_dtype() -> pd.CategoricalDtype:
+    """Return the categorical dtype of the community code table, with categories in code order; empty if there is no table."""
+    global _cached_dtype
+
+    path = table_path(COMMUNITY_CODES_KEY)
+    try:
+        stat = os.stat(path)
+        version = (stat.st_size, stat.st_mtime_ns)
+    except FileNotFoundError:
+        return pd.CategoricalDtype([])
+
+    if _cached_dtype[0] != version:
+        codes = load_table(COMMUNITY_CODES_KEY).sort_values('code')
+        _cached_dtype = (version, pd.CategoricalDtype(codes['name'].tolist()))
+
+    return _cached_dtype[1]
+
+def register_communities(names: Iterable[str]) -> pd.CategoricalDtype:
+    """Add the names missing from the community code table and return the community dtype."""
+    dtype = community_dtype()
+    new_names = sorted(set(pd.Series(names, dtype='object').dropna()) - set(dtype.categories))
+    if not new_names:
+        return dtype
+
+    names = [*dtype.categories, *new_names]
+    save_table(pd.DataFrame({'code': np.arange(len(names), dtype=np.int32), 'name': names}), COMMUNITY_CODES_KEY)
+
+    return community_dtype()
+
+def encode_communities(community: pd.Series) -> pd.Series:
+    """Return community encoded with the community dtype. Raise ValueError for names missing from the code table."""
+    dtype = community_dtype()
+    if not isinstance(community.dtype, pd.CategoricalDtype):
+        community = community.astype('category')
+    # Unordered dtypes compare equal whatever the order of their categories, so compare the codes' categories instead
+    if community.cat.categories.equals(dtype.categories):
+        return community.astype(dtype)
+
+    positions = dtype.categories.get_indexer(community.cat.categories)
+    if (positions == -1).any():
+        missing = community.cat.categories[positions == -1].tolist()
+        raise ValueError(f"Communities {missing} are missing from the community code table {table_path(COMMUNITY_CODES_KEY)}")
+
+    codes = community.cat.codes.to_numpy()
+    return pd.Series(
+        pd.Categorical.from_codes(np.where(codes == -1, -1, positions[codes]), dtype=dtype),
+        index=community.index,
+        name=community.name,
+    )
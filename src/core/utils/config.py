@@ -1,5 +1,7 @@
 """Load and expose configuration settings for the project."""
 import json
+from collections.abc import MutableMapping
+from functools import cache
 
 from core.utils.paths import from_root
 
@@ -14,8 +16,64 @@ def load_config(filename: str = 'config.json') -> dict:
     except json.JSONDecodeError as e:
         raise ValueError(f'Invalid JSON in {path}: {e}')
 
-CONFIG = load_config()
+# Configuration given to this process by use_config in place of config.json
+_given_config: dict | None = None
 
-FILEPATHS = CONFIG.get('filepaths', {})
-PREPROCESSING = CONFIG.get('preprocessing', {})
-FEATURE_ENGINEERING = CONFIG.get('feature_engineering', {})
+@cache
+def get_config() -> dict:
+    """Return the project configuration, loading config.json on first call unless a configuration was given with use_config."""
+    return load_config() if _given_config is None else _given_config
+
+def use_config(config: dict) -> None:
+    """Use config as the project configuration of this process, e.g. in a worker process started by a process that changed its own."""
+    global _given_config
+    _given_config = config
+    get_config.cache_clear()
+    get_section.cache_clear()
+
+@cache
+def get_section(name: str) -> dict:
+    """Return a section of the project configuration, or an empty dict if config.json has none."""
+    return get_config().get(name, {})
+
+class LazySection(MutableMapping):
+    """Mapping view of a configuration section, or of the whole configuration if name is None, loaded on first access."""
+
+    def __init__(self, name: str | None = None):
+        self._name = name
+
+    def _data(self) -> dict:
+        return get_config() if self._name is None else get_section(self._name)
+
+    def __getitem__(self, key):
+        return self._data()[key]
+
+    def __setitem__(self, key, value):
+        self._data()[key] = value
+
+    def __delitem__(self, key):
+        del self._data()[key]
+
+    def __iter__(self):
+        return iter(self._data())
+
+    def __len__(self):
+        return len(self._data())
+
+    def __repr__(self):
+        return repr(self._data())
+
+CONFIG = LazySection()
+
+FILEPATHS = LazySection('filepaths')
+PREPROCESSING = LazySection('preprocessing')
+FEATURE_ENGINEERING = LazySection('feature_engineering')
+REPORTING_INDEX = LazySection('reporting_index')
+STORAGE = LazySection('storage')
+SCHEMA = LazySection('schema')
+PARALLEL = LazySection('parallel')
+BACKEND = LazySection('backend')
+VALIDATION = LazySection('validation')
+INSTRUMENTATION = LazySection('instrumentation')
+FIGURES = LazySection('figures')
+QUERY = LazySection('query')
@@ -0,0 +1,65 @@
+"""Off-screen rendering of figures in a process pool."""
+from pathlib import Path
+
+import numpy as np
+
+from core.utils.config import FIGURES
+from core.utils.instrumentation import instrument
+from core.utils.parallel import map_shards, shard_pool, worker_count
+
+class FigureSpec:
+    """A scatter plot of y over x, datetime64 or numeric, saved to path."""
+
+    def __init__(self, path: Path, x: np.ndarray, y: np.ndarray, title: str, xlabel: str, ylabel: str, figsize: tuple[float, float] = (10, 5)):
+        self.path = path
+        self.x = x
+        self.y = y
+        self.title = title
+        self.xlabel = xlabel
+        self.ylabel = ylabel
+        self.figsize = figsize
+
+def downsample(x: np.ndarray, y: np.ndarray, max_points: int) -> tuple[np.ndarray, np.ndarray]:
+    """Return at most max_points of a series sorted by x, keeping the lowest and highest point of each bucket."""
+    if len(x) <= max_points:
+        return x, y
+    buckets = max(max_points // 2, 1)
+    bucket = np.arange(len(x)) * buckets // len(x)
+    # Sort points by y within each bucket, so the first and last point of each bucket are its lowest and highest
+    order = np.lexsort((y, bucket))
+    bounds = np.searchsorted(bucket[order], np.arange(buckets + 1))
+    keep = np.unique(np.concatenate([order[bounds[:-1]], order[bounds[1:] - 1]]))
+    return x[keep], y[keep]
+
+@instrument
+def render_figure(spec: FigureSpec) -> Path:
+    """Draw and save the figure of spec, and return its path."""
+    # Imported here so that only the processes drawing figures load matplotlib
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.dates import date2num
+    from matplotlib.figure import Figure
+
+    x, y = downsample(spec.x, spec.y, FIGURES.get('max_points', 5000))
+    figure = Figure(figsize=spec.figsize)
+    FigureCanvasAgg(figure)
+    ax = figure.subplots()
+    if np.issubdtype(x.dtype, np.datetime64):
+        # Convert dates to day numbers as one array rather than one date object per point
+        ax.xaxis_date()
+        x = date2num(x)
+    ax.scatter(x, y, s=10)
+    ax.set_title(spec.title)
+    ax.set_xlabel(spec.xlabel)
+    ax.set_ylabel(spec.ylabel)
+    ax.grid(True)
+    figure.tight_layout()
+    figure.savefig(spec.path, dpi=FIGURES.get('dpi', 100))
+    figure.clear()
+
+    return spec.path
+
+@instrument
+def render_figures(specs: list[FigureSpec]) -> list[Path]:
+    """Render figures concurrently in a process pool of figures.workers processes, and return their paths in order."""
+    with shard_pool(min(worker_count(FIGURES), len(specs))) as pool:
+        return map_shards(pool, render_figure, specs)
@@ -0,0 +1,166 @@
+"""Timing, memory and I/O instrumentation of pipeline functions. Usage: python3 src/core/utils/instrumentation.py BASELINE.jsonl CANDIDATE.jsonl"""
+import json
+import os
+import resource
+import sys
+import time
+from collections.abc import Callable
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from functools import wraps
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+from core.utils.config import FILEPATHS, INSTRUMENTATION
+from core.utils.paths import from_root
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+# Environment variable that carries the run id to worker processes
+RUN_ID_VARIABLE = 'SOLAR_HRM_RUN_ID'
+
+# Names of the instrumented calls currently open in this context, outermost first. Threads that run in a copy of the
+# caller's context, as the stage runner's do, record their calls as nested in the caller's
+_open_spans: ContextVar[tuple[str, ...]] = ContextVar('open_spans', default=())
+
+def run_id() -> str:
+    """Return the id of the current pipeline run, starting a new run if this process is not part of one."""
+    if RUN_ID_VARIABLE not in os.environ:
+        os.environ[RUN_ID_VARIABLE] = f'{datetime.now():%Y%m%d-%H%M%S}-{os.getpid()}'
+    return os.environ[RUN_ID_VARIABLE]
+
+def report_path(run: str | None = None) -> Path:
+    """Return the path of the report of run, by default the current run."""
+    return from_root(FILEPATHS['dir_log'], 'runs', f'{run or run_id()}.jsonl')
+
+def _peak_rss_bytes() -> int:
+    """Return the peak resident set size of this process in bytes."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+def _io_bytes() -> tuple[int | None, int | None]:
+    """Return the bytes this process has read and written so far, or None where /proc/self/io is unavailable."""
+    try:
+        with open('/proc/self/io', 'r') as f:
+            counters = dict(line.split(': ') for line in f.read().splitlines())
+        return int(counters['rchar']), int(counters['wchar'])
+    except (OSError, KeyError, ValueError):
+        return None, None
+
+def _rows(value) -> int | None:
+    """Return the rows of a dataframe, or the total rows of the dataframes in a tuple, list or dict; None if there are none."""
+    # There are no dataframes to count until pandas is imported, and instrumenting must not import it
+    pd = sys.modules.get('pandas')
+    if pd is None:
+        return None
+    if isinstance(value, pd.DataFrame):
+        return len(value)
+    if isinstance(value, dict):
+        value = list(value.values())
+    if isinstance(value, (tuple, list)):
+        frames = [item for item in value if isinstance(item, pd.DataFrame)]
+        return sum(len(frame) for frame in frames) if frames else None
+    return None
+
+def _delta(end: int | None, start: int | None) -> int | None:
+    """Return end - start, or None if either counter is unavailable."""
+    return None if end is None or start is None else end - start
+
+@contextmanager
+def span(name: str, rows_in: int | None = None):
+    """Record the block as the call name in the run report, with the rows_out it sets on the yielded record."""
+    record = {'rows_in': rows_in, 'rows_out': None}
+    if not INSTRUMENTATION.get('enabled', True):
+        yield record
+        return
+
+    open_spans = _open_spans.get()
+    parent = open_spans[-1] if open_spans else None
+    token = _open_spans.set((*open_spans, name))
+    # Fix the run id before any worker process is started, so that workers report to the same run
+    current_run_id, started_at = run_id(), datetime.now().isoformat(timespec='seconds')
+    wall_start, cpu_start, peak_start = time.perf_counter(), time.process_time(), _peak_rss_bytes()
+    read_start, written_start = _io_bytes()
+    status = 'error'
+
+    try:
+        yield record
+        status = 'ok'
+    finally:
+        _open_spans.reset(token)
+        read_end, written_end = _io_bytes()
+        _write_record({
+            'run_id': current_run_id,
+            'name': name,
+            'parent': parent,
+            'depth': len(open_spans),
+            'pid': os.getpid(),
+            'status': status,
+            'started_at': started_at,
+            'wall_seconds': round(time.perf_counter() - wall_start, 6),
+            'cpu_seconds': round(time.process_time() - cpu_start, 6),
+            'peak_rss_delta_bytes': _peak_rss_bytes() - peak_start,
+            'peak_rss_bytes': _peak_rss_bytes(),
+            'rows_in': record['rows_in'],
+            'rows_out': record['rows_out'],
+            'bytes_read': _delta(read_end, read_start),
+            'bytes_written': _delta(written_end, written_start),
+        })
+
+def _write_record(record: dict) -> None:
+    """Append record to the run report."""
+    path = report_path()
+    os.makedirs(path.parent, exist_ok=True)
+    # A single short append is not interleaved with appends of worker processes
+    with open(path, 'a') as f:
+        f.write(json.dumps(record) + '\n')
+
+def instrument(func: Callable) -> Callable:
+    """Decorator to record each call of func in the run report, with the rows of the dataframes it takes and returns."""
+    name = f'{func.__module__}.{func.__qualname__}'
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        with span(name, rows_in=_rows([*args, *kwargs.values()])) as record:
+            result = func(*args, **kwargs)
+            record['rows_out'] = _rows(result)
+            return result
+    return wrapper
+
+def load_report(path) -> 'pd.DataFrame':
+    """Load a run report into a dataframe with one row per instrumented call."""
+    import pandas as pd
+
+    return pd.read_json(path, lines=True)
+
+def summarize_report(report: 'pd.DataFrame') -> 'pd.DataFrame':
+    """Total the calls of each instrumented function of a run report, slowest first."""
+    return (
+        report
+        .groupby('name')
+        .agg(
+            calls=('name', 'size'),
+            wall_seconds=('wall_seconds', 'sum'),
+            cpu_seconds=('cpu_seconds', 'sum'),
+            peak_rss_delta_bytes=('peak_rss_delta_bytes', 'max'),
+            rows_out=('rows_out', 'sum'),
+            bytes_read=('bytes_read', 'sum'),
+            bytes_written=('bytes_written', 'sum'),
+        )
+        .sort_values('wall_seconds', ascending=False)
+    )
+
+def compare_reports(baseline: 'pd.DataFrame', candidate: 'pd.DataFrame') -> 'pd.DataFrame':
+    """Compare the per-function totals of two run reports, with the candidate's wall time and peak RSS delta relative to the baseline's."""
+    comparison = summarize_report(baseline).join(summarize_report(candidate), how='outer', lsuffix='_baseline', rsuffix='_candidate')
+    comparison['wall_ratio'] = comparison['wall_seconds_candidate'] / comparison['wall_seconds_baseline']
+    comparison['peak_rss_delta_change_bytes'] = comparison['peak_rss_delta_bytes_candidate'] - comparison['peak_rss_delta_bytes_baseline']
+    return comparison.sort_values('wall_seconds_candidate', ascending=False)
+
+if __name__ == '__main__':
+    baseline_path, candidate_path = sys.argv[1], sys.argv[2]
+    comparison = compare_reports(load_report(baseline_path), load_report(candidate_path))
+    print(comparison[['calls_candidate', 'wall_seconds_baseline', 'wall_seconds_candidate', 'wall_ratio', 'peak_rss_delta_change_bytes']].to_string())
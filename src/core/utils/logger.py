@@ -6,12 +6,28 @@ from datetime import datetime
 from core.utils.config import FILEPATHS
 from core.utils.paths import from_root
 
-# Define log directory
-LOG_DIR = from_root(FILEPATHS['dir_log'])
+# Name of the file under dir_log that messages logged with log=True are appended to
+LOG_FILENAME = 'pipeline.log'
+
+def _file_logger() -> logging.Logger:
+    """Return the logger writing to LOG_FILENAME in dir_log, creating the log directory and handler on first use."""
+    logger = logging.getLogger('core.pipeline')
+    if not logger.handlers:
+        log_dir = from_root(FILEPATHS['dir_log'])
+        os.makedirs(log_dir, exist_ok=True)
+        handler = logging.FileHandler(log_dir / LOG_FILENAME)
+        handler.setFormatter(logging.Formatter('[%(asctime)s] [%(levelname)s] [pid %(process)d] %(message)s', '%Y-%m-%d %H:%M:%S'))
+        logger.addHandler(handler)
+        logger.setLevel(logging.DEBUG)
+        logger.propagate = False
+    return logger
 
 def info(msg: str, log=False, severity=None) -> None:
-    """Print and log messages about events in the pipeline."""
+    """
+    Print and log messages about events in the pipeline.
+    If log, also append the message to LOG_FILENAME in dir_log at severity ('debug', 'info', 'warning', 'error' or 'critical', 'info' by default).
+    """
     print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] {msg}")
 
     if log:
-        pass
+        _file_logger().log(logging.getLevelName((severity or 'info').upper()), msg)
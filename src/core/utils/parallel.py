@@ -0,0 +1,62 @@
+"""Process pool execution of stage functions over installation shards."""
+import multiprocessing
+import os
+from collections.abc import Callable, Iterable, Iterator, Mapping
+from concurrent.futures import Executor, ProcessPoolExecutor
+from contextlib import contextmanager
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from core.utils.config import PARALLEL, get_config, use_config
+from core.utils.instrumentation import RUN_ID_VARIABLE, run_id
+from core.utils.paths import ROOT_VARIABLE, project_root
+
+# Start method of worker processes, which never fork the threads of this process
+START_METHOD = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+
+def worker_count(section: Mapping = PARALLEL) -> int:
+    """Return the number of worker processes configured in the workers key of section, or every core if it is null."""
+    workers = section.get('workers', 1)
+    if workers is None:
+        return os.cpu_count() or 1
+    return max(int(workers), 1)
+
+def shard_count(workers: int) -> int:
+    """Return the number of installation shards configured in parallel.shards, or one per worker by default."""
+    return PARALLEL.get('shards') or workers
+
+def split_installation_shards(df: pd.DataFrame, num_shards: int, column: str = 'installation_id') -> list[pd.DataFrame]:
+    """Split df into num_shards frames by installation, keeping the relative order of rows."""
+    shards = (df[column] % num_shards).fillna(0).to_numpy(dtype=np.int64)
+    order = np.argsort(shards, kind='stable')
+    bounds = np.searchsorted(shards[order], np.arange(num_shards + 1))
+    return [df.iloc[order[bounds[i]:bounds[i + 1]]] for i in range(num_shards)]
+
+def _init_worker(config: dict, root: Path, run: str) -> None:
+    """Give a worker process the configuration, project root and run id of the process that started it."""
+    os.environ[ROOT_VARIABLE] = str(root)
+    os.environ[RUN_ID_VARIABLE] = run
+    project_root.cache_clear()
+    use_config(config)
+
+@contextmanager
+def shard_pool(workers: int) -> Iterator[ProcessPoolExecutor | None]:
+    """Provide a process pool with workers processes started by START_METHOD, or None to run shards serially in this process."""
+    if workers <= 1:
+        yield None
+        return
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context(START_METHOD),
+        initializer=_init_worker,
+        initargs=(get_config(), project_root(), run_id()),
+    ) as pool:
+        yield pool
+
+def map_shards(pool: Executor | None, func: Callable, *iterables: Iterable) -> list:
+    """Apply func to every shard, in the processes of pool if one is given, and return the results in shard order."""
+    if pool is None:
+        return list(map(func, *iterables))
+    return list(pool.map(func, *iterables))
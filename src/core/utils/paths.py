@@ -1,11 +1,18 @@
 """Utility for constructing absolute filepaths relative to the project root."""
 
-import sys
-
+import os
+from functools import cache
 from pathlib import Path
 
-def _find_project_root() -> Path:
-    """Find project root by walking up until a known marker is found."""
+# Environment variable that sets the project root, as the process starting a worker process does
+ROOT_VARIABLE = 'SOLAR_HRM_ROOT'
+
+@cache
+def project_root() -> Path:
+    """Return the project root set in ROOT_VARIABLE, or find it by walking up until a known marker is found, on first call."""
+    if os.environ.get(ROOT_VARIABLE):
+        return Path(os.environ[ROOT_VARIABLE])
+
     current = Path(__file__).resolve()
     for parent in current.parents:
         if (parent / "config.json").exists() or (parent / ".git").exists():
@@ -13,8 +20,6 @@ def _find_project_root() -> Path:
 
     raise RuntimeError("Could not find project root.")
 
-PROJECT_ROOT = _find_project_root()
-
 def from_root(*parts) -> Path:
     """Return an absolute path relative to the project root."""
-    return PROJECT_ROOT.joinpath(*parts)
+    return project_root().joinpath(*parts)
@@ -1,3 +1,4 @@
+"""Pandas display options for interactive entry points, applied by calling set_pandas_display_options rather than at import."""
 import pandas as pd
 
 def set_pandas_display_options():
@@ -11,7 +12,3 @@ def set_pandas_display_options():
 
     # Always display all columns
     pd.set_option('display.max_columns', None)
-
-    print('Display options configured')
-
-set_pandas_display_options()
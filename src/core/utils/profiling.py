@@ -0,0 +1,117 @@
+"""Approximate column statistics of stage outputs, computed as they are written."""
+import base64
+import zlib
+
+import numpy as np
+import pandas as pd
+
+# Bits of a value's hash that select its sketch register; distinct counts are within about 1.04 / sqrt(2**PRECISION), 0.8%
+PRECISION = 14
+REGISTERS = 1 << PRECISION
+
+# Bits of the hash left after the register index, whose leading zeros are counted
+RANK_BITS = 64 - PRECISION
+
+class HyperLogLog:
+    """Sketch of the distinct values of a column in 2**PRECISION one-byte registers."""
+
+    def __init__(self, registers: np.ndarray | None = None):
+        self.registers = np.zeros(REGISTERS, dtype=np.uint8) if registers is None else registers
+
+    def add(self, hashes: np.ndarray) -> None:
+        """Add values by their 64-bit hashes."""
+        index = (hashes >> np.uint64(RANK_BITS)).astype(np.intp)
+        # The remaining bits fit a float64 exactly, so frexp returns their bit length
+        _, bit_length = np.frexp((hashes & np.uint64((1 << RANK_BITS) - 1)).astype(np.float64))
+        np.maximum.at(self.registers, index, (RANK_BITS + 1 - bit_length).astype(np.uint8))
+
+    def merge(self, other: 'HyperLogLog') -> 'HyperLogLog':
+        """Return the sketch of the values added to either sketch."""
+        return HyperLogLog(np.maximum(self.registers, other.registers))
+
+    def estimate(self) -> int:
+        """Return the estimated number of distinct values added, by linear counting while few registers are set."""
+        alpha = 0.7213 / (1 + 1.079 / REGISTERS)
+        raw = alpha * REGISTERS**2 / np.ldexp(1.0, -self.registers.astype(np.int64)).sum()
+        empty = np.count_nonzero(self.registers == 0)
+        if raw <= 2.5 * REGISTERS and empty:
+            return round(REGISTERS * np.log(REGISTERS / empty))
+        return round(raw)
+
+    def to_json(self) -> str:
+        return base64.b64encode(zlib.compress(self.registers.tobytes())).decode()
+
+    @classmethod
+    def from_json(cls, encoded: str) -> 'HyperLogLog':
+        return cls(np.frombuffer(zlib.decompress(base64.b64decode(encoded)), dtype=np.uint8).copy())
+
+class TableProfile:
+    """Row count, and dtype, null count and distinct value sketch of each column, of a table or of some of its rows."""
+
+    def __init__(self, rows: int = 0, columns: dict[str, dict] | None = None):
+        self.rows = rows
+        self.columns = columns or {}
+
+    def merge(self, other: 'TableProfile') -> 'TableProfile':
+        """Return the profile of the rows of both profiles, with the columns of either."""
+        columns = dict(self.columns)
+        for col, stats in other.columns.items():
+            if col in columns:
+                stats = {
+                    'dtype': columns[col]['dtype'],
+                    'nulls': columns[col]['nulls'] + stats['nulls'],
+                    'sketch': columns[col]['sketch'].merge(stats['sketch']),
+                }
+            columns[col] = stats
+        return TableProfile(self.rows + other.rows, columns)
+
+    def to_json(self) -> dict:
+        return {
+            'rows': self.rows,
+            'columns': {col: {**stats, 'sketch': stats['sketch'].to_json()} for col, stats in self.columns.items()},
+        }
+
+    @classmethod
+    def from_json(cls, data: dict) -> 'TableProfile':
+        return cls(
+            data['rows'],
+            {col: {**stats, 'sketch': HyperLogLog.from_json(stats['sketch'])} for col, stats in data['columns'].items()},
+        )
+
+def profile_frame(df: pd.DataFrame, by: list[pd.Series] = ()) -> dict[tuple, TableProfile]:
+    """Return the profile of the rows of df with each combination of values of the by series, keyed by those values."""
+    groups = {(): np.arange(len(df))}
+    if by:
+        indices = pd.DataFrame({i: values.to_numpy() for i, values in enumerate(by)}).groupby(list(range(len(by))), observed=True, dropna=False).indices
+        groups = {key if isinstance(key, tuple) else (key,): positions for key, positions in indices.items()}
+
+    profiles = {key: TableProfile(len(positions)) for key, positions in groups.items()}
+    for col in df.columns:
+        # Hash each column once, then sketch the non-null hashes of each group
+        valid = df[col].notna().to_numpy()
+        hashes = pd.util.hash_pandas_object(df[col], index=False).to_numpy()
+        for key, positions in groups.items():
+            sketch = HyperLogLog()
+            sketch.add(hashes[positions[valid[positions]]])
+            profiles[key].columns[col] = {
+                'dtype': str(df[col].dtype),
+                'nulls': int(len(positions) - valid[positions].sum()),
+                'sketch': sketch,
+            }
+    return profiles
+
+def merge_profiles(profiles: dict[tuple, TableProfile], other: dict[tuple, TableProfile]) -> dict[tuple, TableProfile]:
+    """Merge two sets of profiles keyed by partition values, profiles of the same partition into one."""
+    merged = dict(profiles)
+    for key, profile in other.items():
+        merged[key] = merged[key].merge(profile) if key in merged else profile
+    return merged
+
+def print_profile(name: str, profile: TableProfile) -> None:
+    """Print the row count of a table and the dtype, approximate distinct values and nulls of each of its columns."""
+    title = f'| {name} (count: {profile.rows}) |'
+    print('-' * len(title))
+    print(title)
+    print('-' * len(title))
+    for col, stats in profile.columns.items():
+        print(f"Column: {col} [{stats['dtype']}] [num_unique: ~{stats['sketch'].estimate()}] [num_NA: {stats['nulls']}]")
@@ -0,0 +1,14 @@
+"""Column dtypes of the stage outputs, with the opt-in compact schema configured in config.json."""
+import pandas as pd
+
+from core.utils.config import SCHEMA
+
+def column_dtype(col: str, dtype: str) -> str:
+    """Return the dtype of column col: its schema.compact_dtypes entry if schema.compact is enabled, dtype otherwise."""
+    if SCHEMA.get('compact', False):
+        return SCHEMA.get('compact_dtypes', {}).get(col, dtype)
+    return dtype
+
+def cast_columns(df: pd.DataFrame, dtypes: dict[str, str]) -> pd.DataFrame:
+    """Cast the columns of df named in dtypes to their column_dtype."""
+    return df.astype({col: column_dtype(col, dtype) for col, dtype in dtypes.items() if col in df.columns})
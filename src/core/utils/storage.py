@@ -0,0 +1,427 @@
+"""Helpers for reading pipeline inputs and writing and loading pipeline stage outputs."""
+import json
+import os
+import shutil
+from collections.abc import Iterable, Iterator
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+import pyarrow.dataset as ds
+import pyarrow.fs as pa_fs
+import pyarrow.parquet as pq
+
+from core.utils.config import FILEPATHS, STORAGE
+from core.utils.instrumentation import instrument
+from core.utils.paths import from_root
+from core.utils.profiling import TableProfile, merge_profiles, profile_frame
+
+# Partition columns derived from the timestamp column at write time and dropped again at load time
+DERIVED_PARTITION_COLUMNS = {
+    'year': lambda timestamps: timestamps.dt.year,
+    'month': lambda timestamps: timestamps.dt.month,
+}
+
+# Columns that stage outputs are sorted by within each file, so row group statistics can prune reads
+SORT_COLUMNS = ['installation_id', 'timestamp']
+
+# File suffix and pyarrow dataset format of stage outputs in each storage format
+STORAGE_FORMATS = {
+    'parquet': ('.parquet', 'parquet'),
+    'arrow': ('.arrow', 'ipc'),
+}
+
+# Name prefix of the profile sidecars in partition directories, which dataset discovery ignores
+PROFILE_PREFIX = '_profile-'
+
+# Arrow type of categorical columns in stage outputs, whatever index width pandas picks for the categories of a frame
+CATEGORY_TYPE = pa.dictionary(pa.int32(), pa.string())
+
+# Rows per scanned batch of arrow stage outputs, large enough that whole record batches are loaded without slicing
+ARROW_SCAN_BATCH_ROWS = 2**31 - 1
+
+def storage_format() -> str:
+    """Return the configured file format of stage outputs, parquet or arrow."""
+    name = STORAGE.get('format', 'parquet')
+    if name not in STORAGE_FORMATS:
+        raise ValueError(f"storage.format must be one of {list(STORAGE_FORMATS)}, got {name!r}")
+    return name
+
+def table_path(key: str) -> Path:
+    """Return the path of the stage output FILEPATHS[key] in the configured storage format."""
+    return from_root(FILEPATHS[key]).with_suffix(STORAGE_FORMATS[storage_format()][0])
+
+def partition_columns(key: str) -> list[str]:
+    """Return the hive partition columns configured for the stage output FILEPATHS[key]."""
+    return STORAGE.get('partitioning', {}).get(key, [])
+
+def _to_arrow(df: pd.DataFrame, partition_cols: list[str]) -> pa.Table:
+    """Convert df to an arrow table sorted by SORT_COLUMNS, with derived partition columns appended."""
+    table = pa.Table.from_pandas(df, preserve_index=False)
+
+    for i, field in enumerate(table.schema):
+        if pa.types.is_dictionary(field.type) and pa.types.is_string(field.type.value_type) and field.type != CATEGORY_TYPE:
+            table = table.set_column(i, field.name, table.column(i).cast(CATEGORY_TYPE))
+
+    for col in partition_cols:
+        if col in DERIVED_PARTITION_COLUMNS and col not in table.column_names:
+            values = DERIVED_PARTITION_COLUMNS[col](df['timestamp']).to_numpy(dtype=np.int32)
+            table = table.append_column(col, pa.array(values))
+
+    sort_keys = [(col, 'ascending') for col in SORT_COLUMNS if col in table.column_names]
+    return table.sort_by(sort_keys) if sort_keys else table
+
+def _write_partitioned(table: pa.Table, key: str, basename: str) -> list[Path]:
+    """Write table into the hive-partitioned dataset FILEPATHS[key], adding files named after basename, and return their paths."""
+    written = []
+    if storage_format() == 'arrow':
+        # An Arrow IPC file holds a single dictionary per column, shared by the batches of each file
+        ds.write_dataset(
+            table.unify_dictionaries(),
+            table_path(key),
+            format='ipc',
+            partitioning=partition_columns(key),
+            partitioning_flavor='hive',
+            basename_template=f'{basename}-{{i}}.arrow',
+            existing_data_behavior='overwrite_or_ignore',
+            file_visitor=lambda file: written.append(Path(file.path)),
+        )
+        return written
+
+    pq.write_to_dataset(
+        table,
+        table_path(key),
+        partition_cols=partition_columns(key),
+        basename_template=f'{basename}-{{i}}.parquet',
+        existing_data_behavior='overwrite_or_ignore',
+        file_visitor=lambda file: written.append(Path(file.path)),
+    )
+    return written
+
+def _compact_files(paths: list[Path]) -> None:
+    """Merge the files at paths, of one partition, into the first of them, one row group or record batch per file."""
+    target = paths[0]
+    if storage_format() == 'arrow':
+        tables = [pa.ipc.open_file(pa.memory_map(str(path))).read_all() for path in paths]
+        _write_arrow_file(pa.concat_tables(tables).unify_dictionaries().combine_chunks(), target)
+    else:
+        # Named with a leading underscore so that dataset discovery ignores it until it replaces the target
+        tmp_path = target.with_name(f'_{target.name}.tmp')
+        schema = pq.read_schema(target)
+        with pq.ParquetWriter(tmp_path, schema) as writer:
+            for path in paths:
+                writer.write_table(pq.ParquetFile(path).read())
+        os.replace(tmp_path, target)
+
+    for path in paths[1:]:
+        path.unlink()
+
+def _write_arrow_file(table: pa.Table, path: Path) -> None:
+    """Write table to the Arrow IPC file at path, replacing the file rather than overwriting it."""
+    tmp_path = path.with_name(path.name + '.tmp')
+    with pa.ipc.new_file(str(tmp_path), table.schema, options=pa.ipc.IpcWriteOptions(unify_dictionaries=True)) as writer:
+        writer.write_table(table)
+    os.replace(tmp_path, path)
+
+def profile_partitions(df: pd.DataFrame, key: str) -> dict[tuple, TableProfile]:
+    """Return the profile of the rows of df in each partition of the stage output FILEPATHS[key], keyed by partition values."""
+    by = [
+        DERIVED_PARTITION_COLUMNS[col](df['timestamp']) if col in DERIVED_PARTITION_COLUMNS and col not in df.columns else df[col]
+        for col in partition_columns(key)
+    ]
+    return profile_frame(df, by)
+
+def _profile_path(key: str, partition: tuple, basename: str) -> Path:
+    """Return the path of the profile of the rows written under basename to a partition of the stage output FILEPATHS[key]."""
+    path = table_path(key)
+    partition_cols = partition_columns(key)
+    if not partition_cols:
+        return path.with_suffix('.profile.json')
+
+    # Format the partition directory as the dataset writer does, escaping values such as community names
+    values = [value.item() if isinstance(value, np.generic) else value for value in partition]
+    partitioning = ds.HivePartitioning(pa.schema([(col, pa.scalar(value).type) for col, value in zip(partition_cols, values)]))
+    directory, _ = partitioning.format(_combine([ds.field(col) == value for col, value in zip(partition_cols, values)]))
+    return path / directory / f'{PROFILE_PREFIX}{basename}.json'
+
+def save_profiles(key: str, profiles: dict[tuple, TableProfile], basename: str) -> None:
+    """Save the profiles of the rows written under basename to each partition of the stage output FILEPATHS[key]."""
+    for partition, profile in profiles.items():
+        path = _profile_path(key, partition, basename)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(path.name + '.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump(profile.to_json(), f)
+        os.replace(tmp_path, path)
+
+def load_profile(key: str) -> TableProfile | None:
+    """Return the profile of the stage output FILEPATHS[key] merged from its sidecars, or None if they do not cover every row."""
+    path = table_path(key)
+    pieces = sorted(path.glob(f'**/{PROFILE_PREFIX}*.json')) if partition_columns(key) else [path.with_suffix('.profile.json')]
+    if not path.exists() or not all(piece.exists() for piece in pieces):
+        return None
+
+    profile = TableProfile()
+    for piece in pieces:
+        with open(piece, 'r') as f:
+            profile = profile.merge(TableProfile.from_json(json.load(f)))
+
+    # Row counts come from file metadata, without reading column data
+    return profile if profile.rows == open_dataset(key).count_rows() else None
+
+def table_profile(key: str, df: pd.DataFrame | None = None) -> TableProfile:
+    """Return the profile of the stage output FILEPATHS[key] from its sidecars, or else by profiling df or the loaded output."""
+    profile = load_profile(key)
+    if profile is not None:
+        return profile
+    return profile_frame(load_table(key) if df is None else df)[()]
+
+@instrument
+def save_table(df: pd.DataFrame, key: str) -> None:
+    """Save df to FILEPATHS[key], as a hive-partitioned dataset if partitioning is configured for key."""
+    partition_cols = partition_columns(key)
+    table = _to_arrow(df, partition_cols)
+
+    if partition_cols:
+        _write_partitioned(table, key, basename='part-0')
+    elif storage_format() == 'arrow':
+        # A file of a single record batch loads without copying
+        _write_arrow_file(table.combine_chunks(), table_path(key))
+    else:
+        pq.write_table(table, table_path(key))
+
+    save_profiles(key, profile_partitions(df, key), basename='part-0')
+
+def drop_partitions(key: str, partitions: Iterable[tuple]) -> None:
+    """Delete the partitions of the dataset FILEPATHS[key] given by values of its leading partition columns."""
+    partition_cols = partition_columns(key)
+    for values in partitions:
+        path = table_path(key).joinpath(*(f'{col}={value}' for col, value in zip(partition_cols, values)))
+        shutil.rmtree(path, ignore_errors=True)
+
+class ParquetAppender:
+    """Append dataframes to the stage output FILEPATHS[key] one chunk at a time."""
+
+    def __init__(self, key: str, basename: str = 'part'):
+        self.key = key
+        self.basename = basename
+        self.partition_cols = partition_columns(key)
+        self._schema = None
+        self._writer = None
+        self._chunks_written = 0
+        self._partition_files = {}
+        self._profiles = {}
+
+    def append(self, df: pd.DataFrame) -> None:
+        """Append df to the stage output, casting it to the schema of the first chunk written."""
+        table = _to_arrow(df, self.partition_cols)
+
+        if self._schema is None:
+            self._schema = table.schema
+        else:
+            table = table.cast(self._schema)
+
+        if self.partition_cols:
+            for path in _write_partitioned(table, self.key, basename=f'{self.basename}-{self._chunks_written}'):
+                self._partition_files.setdefault(path.parent, []).append(path)
+        else:
+            if self._writer is None:
+                self._writer = self._open_writer()
+            self._writer.write_table(table)
+
+        self._chunks_written += 1
+        self._profiles = merge_profiles(self._profiles, profile_partitions(df, self.key))
+
+    def _spool_path(self) -> Path:
+        return table_path(self.key).with_suffix('.arrows')
+
+    def _open_writer(self):
+        if storage_format() == 'arrow':
+            return pa.ipc.new_stream(str(self._spool_path()), self._schema)
+        return pq.ParquetWriter(table_path(self.key), self._schema)
+
+    def close(self) -> None:
+        """Close the underlying writer, write spooled arrow chunks, merge the files of each partition and save the chunk profiles."""
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+            if storage_format() == 'arrow':
+                spool_path = self._spool_path()
+                with pa.memory_map(str(spool_path)) as source:
+                    _write_arrow_file(pa.ipc.open_stream(source).read_all().unify_dictionaries(), table_path(self.key))
+                spool_path.unlink()
+
+        for paths in self._partition_files.values():
+            if len(paths) > 1:
+                _compact_files(paths)
+        self._partition_files = {}
+
+        save_profiles(self.key, self._profiles, self.basename)
+        self._profiles = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+def _timestamp_scalar(timestamp: pd.Timestamp) -> pa.Scalar:
+    """Return timestamp as an arrow timestamp[ns] scalar for comparisons against timestamp columns."""
+    return pa.scalar(timestamp.as_unit('ns').value, type=pa.timestamp('ns'))
+
+def _period_filter(start, end, prune_partitions: bool) -> ds.Expression | None:
+    """Return a filter keeping rows with start <= timestamp < end, skipping whole partitions if prune_partitions."""
+    year, month, timestamp = ds.field('year'), ds.field('month'), ds.field('timestamp')
+    expressions = []
+
+    if start is not None:
+        start = pd.Timestamp(start)
+        expressions.append(timestamp >= _timestamp_scalar(start))
+        if prune_partitions:
+            expressions.append((year > start.year) | ((year == start.year) & (month >= start.month)))
+
+    if end is not None:
+        end = pd.Timestamp(end)
+        expressions.append(timestamp < _timestamp_scalar(end))
+        if prune_partitions:
+            expressions.append((year < end.year) | ((year == end.year) & (month <= end.month)))
+
+    return _combine(expressions)
+
+def _combine(expressions: list[ds.Expression]) -> ds.Expression | None:
+    """Return the conjunction of expressions, or None if there are none."""
+    combined = None
+    for expression in expressions:
+        combined = expression if combined is None else combined & expression
+    return combined
+
+def _column_order(dataset: ds.Dataset) -> list[str]:
+    """Return the dataframe column order recorded in the pandas metadata of dataset."""
+    metadata = dataset.schema.metadata or {}
+    if b'pandas' not in metadata:
+        return dataset.schema.names
+    names = [col['name'] for col in json.loads(metadata[b'pandas'])['columns'] if col['name'] is not None]
+    return [name for name in names if name in dataset.schema.names]
+
+def open_dataset(key: str) -> ds.Dataset:
+    """Open the stage output FILEPATHS[key] as a dataset in the configured storage format."""
+    _, dataset_format = STORAGE_FORMATS[storage_format()]
+    return ds.dataset(
+        table_path(key),
+        format=dataset_format,
+        filesystem=pa_fs.LocalFileSystem(use_mmap=True) if dataset_format == 'ipc' else None,
+        partitioning=ds.HivePartitioning.discover(infer_dictionary=True) if partition_columns(key) else None,
+    )
+
+@instrument
+def load_table(
+    key: str,
+    columns: list[str] | None = None,
+    start=None,
+    end=None,
+    installation_ids: Iterable[int] | None = None,
+    communities: Iterable[str] | None = None,
+) -> pd.DataFrame:
+    """
+    Load the stage output FILEPATHS[key], pushing column selection and row filters down to the dataset reader.
+        - columns: columns to load, by default every column of the table
+        - start, end: keep rows with start <= timestamp < end
+        - installation_ids: keep rows of these installations
+        - communities: keep rows of installations in these communities
+    Tables without a community column are filtered by the installations of each community
+    in the installations_preprocessed dimension table.
+    Unfiltered numeric and timestamp columns without nulls of single-file arrow tables are read-only views of the file.
+    """
+    partition_cols = partition_columns(key)
+    dataset = open_dataset(key)
+    names = dataset.schema.names
+
+    if columns is None:
+        columns = [col for col in _column_order(dataset) if col not in DERIVED_PARTITION_COLUMNS]
+
+    expressions = []
+    if start is not None or end is not None:
+        expressions.append(_period_filter(start, end, prune_partitions={'year', 'month'} <= set(partition_cols)))
+
+    if communities is not None:
+        if 'community' in names:
+            expressions.append(ds.field('community').isin(list(communities)))
+        else:
+            # Resolve communities to their installations through the installations dimension table
+            community_installations = load_table('installations_preprocessed', columns=['installation_id'], communities=communities)
+            expressions.append(ds.field('installation_id').isin(community_installations['installation_id'].tolist()))
+
+    if installation_ids is not None:
+        expressions.append(ds.field('installation_id').isin(list(installation_ids)))
+
+    if storage_format() == 'arrow':
+        # Keep whole record batches and column blocks, so that columns backed by a single batch are not copied
+        table = dataset.to_table(columns=columns, filter=_combine(expressions), batch_size=ARROW_SCAN_BATCH_ROWS)
+        loaded = table.to_pandas(split_blocks=True)
+    else:
+        table = dataset.to_table(columns=columns, filter=_combine(expressions))
+        loaded = table.to_pandas()
+
+    for col in DERIVED_PARTITION_COLUMNS:
+        if col in loaded.columns:
+            loaded[col] = loaded[col].astype('int32')
+
+    if 'community' in loaded.columns:
+        # Imported here as the community code table is itself a stage output read by this function
+        from core.utils.communities import encode_communities
+        loaded['community'] = encode_communities(loaded['community'])
+
+    return loaded
+
+def _arrow_type(dtype: str) -> pa.DataType:
+    """Return the arrow type used to parse a csv column declared with pandas dtype name dtype."""
+    if dtype == 'category':
+        return CATEGORY_TYPE
+    if dtype in ('str', 'string', 'object'):
+        return pa.string()
+    return pa.from_numpy_dtype(np.dtype(dtype))
+
+def _csv_convert_options(usecols: list[str] | None, dtypes: dict[str, str] | None) -> pa_csv.ConvertOptions:
+    """Return pyarrow csv convert options that read only usecols, parsed as dtypes, with blank cells read as nulls as pandas does."""
+    return pa_csv.ConvertOptions(
+        include_columns=usecols,
+        column_types={col: _arrow_type(dtype) for col, dtype in (dtypes or {}).items()},
+        strings_can_be_null=True,
+        quoted_strings_can_be_null=True,
+    )
+
+def read_csv_pyarrow(
+    filepath,
+    usecols: list[str] | None = None,
+    dtypes: dict[str, str] | None = None,
+) -> pd.DataFrame:
+    """Read a whole csv with the multithreaded pyarrow parser, releasing arrow buffers as they are converted."""
+    table = pa_csv.read_csv(filepath, convert_options=_csv_convert_options(usecols, dtypes))
+    return table.to_pandas(split_blocks=True, self_destruct=True)
+
+def read_csv_chunks_pyarrow(
+    filepath,
+    chunk_size: int,
+    usecols: list[str] | None = None,
+    dtypes: dict[str, str] | None = None,
+) -> Iterator[pd.DataFrame]:
+    """Stream a csv with the multithreaded pyarrow parser, yielding dataframes of at most chunk_size rows."""
+    reader = pa_csv.open_csv(filepath, convert_options=_csv_convert_options(usecols, dtypes))
+
+    pending, pending_rows = [], 0
+    for batch in reader:
+        pending.append(batch)
+        pending_rows += batch.num_rows
+
+        while pending_rows >= chunk_size:
+            table = pa.Table.from_batches(pending, schema=reader.schema)
+            yield table.slice(0, chunk_size).to_pandas()
+
+            remainder = table.slice(chunk_size)
+            pending, pending_rows = remainder.to_batches(), remainder.num_rows
+
+    if pending_rows:
+        yield pa.Table.from_batches(pending, schema=reader.schema).to_pandas()
@@ -0,0 +1,98 @@
+"""Fast parsing of fixed-width timestamp strings."""
+import numpy as np
+import pandas as pd
+
+# Width in characters of each strptime directive supported by the fixed-width parser
+FIELD_WIDTHS = {'%Y': 4, '%m': 2, '%d': 2, '%H': 2, '%M': 2, '%S': 2}
+
+# Years outside this range overflow datetime64[ns] and are left to pandas
+MIN_YEAR, MAX_YEAR = 1678, 2261
+
+def fixed_width_layout(date_format: str) -> tuple[dict[str, tuple[int, int]], dict[int, str], int] | None:
+    """Return the character offsets of each field in date_format and the total width, or None if it is not fixed-width."""
+    fields, literals = {}, {}
+    i, position = 0, 0
+
+    while i < len(date_format):
+        directive = date_format[i:i + 2]
+        if directive in FIELD_WIDTHS:
+            if directive in fields:
+                return None
+            fields[directive] = (position, position + FIELD_WIDTHS[directive])
+            position += FIELD_WIDTHS[directive]
+            i += 2
+        elif date_format[i] == '%':
+            return None
+        else:
+            literals[position] = date_format[i]
+            position += 1
+            i += 1
+
+    if set(fields) != set(FIELD_WIDTHS):
+        return None
+
+    return fields, literals, position
+
+def _parse_fixed_width(values: np.ndarray, layout: tuple) -> tuple[np.ndarray, np.ndarray]:
+    """Parse strings with a fixed-width layout, returning the datetime64[ns] values and a mask of well-formed values."""
+    fields, literals, width = layout
+
+    lengths = np.fromiter((len(v) if isinstance(v, str) else -1 for v in values), dtype=np.int64, count=len(values))
+    ok = lengths == width
+    candidates = np.where(ok, values, '')
+
+    # View each string as a row of UCS4 code points so fields can be sliced at fixed offsets
+    chars = np.asarray(candidates, dtype=f'U{width}').view(np.uint32).reshape(len(values), width)
+
+    for position, literal in literals.items():
+        ok &= chars[:, position] == ord(literal)
+
+    digits = chars.astype(np.int64) - ord('0')
+    parsed = {}
+    for directive, (start, stop) in fields.items():
+        field_digits = digits[:, start:stop]
+        ok &= ((field_digits >= 0) & (field_digits <= 9)).all(axis=1)
+        parsed[directive] = field_digits @ (10 ** np.arange(stop - start - 1, -1, -1))
+
+    year, month, day = parsed['%Y'], parsed['%m'], parsed['%d']
+    hour, minute, second = parsed['%H'], parsed['%M'], parsed['%S']
+
+    ok &= (year >= MIN_YEAR) & (year <= MAX_YEAR) & (month >= 1) & (month <= 12)
+    ok &= (hour <= 23) & (minute <= 59) & (second <= 59)
+
+    # Substitute the epoch for malformed values so the date arithmetic below cannot overflow
+    year, month = np.where(ok, year, 1970), np.where(ok, month, 1)
+    month_start = ((year - 1970) * 12 + (month - 1)).astype('datetime64[M]')
+    days_in_month = ((month_start + 1).astype('datetime64[D]') - month_start.astype('datetime64[D]')).astype(np.int64)
+    ok &= (day >= 1) & (day <= days_in_month)
+
+    seconds = np.where(ok, hour * 3600 + minute * 60 + second, 0).astype('timedelta64[s]')
+    dates = month_start.astype('datetime64[D]') + np.where(ok, day - 1, 0).astype('timedelta64[D]')
+    timestamps = dates.astype('datetime64[ns]') + seconds.astype('timedelta64[ns]')
+
+    return np.where(ok, timestamps, np.datetime64('NaT', 'ns')), ok
+
+def parse_fixed_width_timestamps(timestamps: pd.Series, date_format: str) -> pd.Series:
+    """Convert timestamp strings to datetime64[ns] like pd.to_datetime(format=date_format, errors='coerce'), parsing each distinct string once."""
+    layout = fixed_width_layout(date_format)
+    if layout is None:
+        return pd.to_datetime(timestamps, format=date_format, errors='coerce')
+
+    if isinstance(timestamps.dtype, pd.CategoricalDtype):
+        codes, uniques = timestamps.cat.codes.to_numpy(), timestamps.cat.categories
+    else:
+        codes, uniques = pd.factorize(timestamps)
+
+    values = np.asarray(uniques, dtype=object)
+    parsed, ok = _parse_fixed_width(values, layout)
+
+    if not ok.all():
+        parsed[~ok] = (
+            pd.to_datetime(pd.Series(values[~ok], dtype=object), format=date_format, errors='coerce')
+            .to_numpy(dtype='datetime64[ns]')
+        )
+
+    # Code -1 marks missing values and selects the trailing NaT
+    parsed = np.append(parsed, np.datetime64('NaT', 'ns'))
+
+    return pd.Series(parsed[codes], index=timestamps.index, name=timestamps.name)
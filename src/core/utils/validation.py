@@ -1,71 +1,283 @@
+from collections.abc import Callable
+
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
 
+from core.utils.config import VALIDATION
+from core.utils.schema import column_dtype
+from core.utils.storage import DERIVED_PARTITION_COLUMNS, open_dataset, storage_format
 from core.utils.utils import ensure_dataframe
 
-def validate_dataframe(df: pd.DataFrame, expected_spec: dict) -> None:
+# Rows checked at a time, so that no check allocates a temporary the size of the whole column
+VALIDATION_BLOCK_ROWS = 1 << 16
+
+CLEANED_UNPARTITIONED_SPEC = {
+    'installation_id': {'dtype': 'int64'},
+    'panels_reporting': {'dtype': 'int64', 'min': 0},
+    'community': {'dtype': 'category'},
+    'timestamp': {'dtype': 'datetime64[ns]'},
+    'avg_power_watts_5min': {'dtype': 'float64', 'min': 0},
+}
+
+INSTALLATIONS_PREPROCESSED_SPEC = {
+    'installation_id': {'dtype': 'int64', 'unique': True},
+    'community': {'dtype': 'category'},
+}
+
+READINGS_PREPROCESSED_SPEC = {
+    'installation_id': {'dtype': 'int64'},
+    'timestamp': {'dtype': 'datetime64[ns]'},
+    'panels_reporting': {'dtype': 'int64', 'min': 0},
+    'avg_power_watts_5min': {'dtype': 'float64', 'min': 0},
+}
+
+INSTALLATIONS_FEATURE_ENGINEERED_SPEC = {
+    'installation_id': {'dtype': 'int64', 'unique': True},
+    'community': {'dtype': 'category'},
+    'panels_reporting_max': {'dtype': 'int64', 'min': 0},
+    'panels_reporting_efficiency': {'dtype': 'float64', 'min': 0},
+    'panels_reporting_avg': {'dtype': 'float64', 'min': 0},
+}
+
+READINGS_FEATURE_ENGINEERED_SPEC = {
+    'installation_id': {'dtype': 'int64'},
+    'timestamp': {'dtype': 'datetime64[ns]'},
+    'panels_reporting': {'dtype': 'int64', 'min': 0},
+    'avg_power_watts_5min': {'dtype': 'float64', 'min': 0},
+    'energy_prod_wh_5min': {'dtype': 'float64', 'min': 0},
+}
+
+INSTALLATION_DAILY_SPEC = {
+    'installation_id': {'dtype': 'int64'},
+    'timestamp': {'dtype': 'datetime64[ns]'},
+    'readings_count': {'dtype': 'int64', 'min': 1},
+    'energy_prod_wh': {'dtype': 'float64', 'min': 0},
+    'panels_reporting_max': {'dtype': 'int64', 'min': 0},
+}
+
+COMMUNITY_ROLLUP_SPEC = {
+    'community': {'dtype': 'category', 'allow_null': True},
+    'timestamp': {'dtype': 'datetime64[ns]'},
+    'readings_count': {'dtype': 'int64', 'min': 1},
+    'energy_prod_wh': {'dtype': 'float64', 'min': 0},
+    'active_panels': {'dtype': 'int64', 'min': 0},
+}
+
+REPORTING_INTERVALS_SPEC = {
+    'installation_id': {'dtype': 'int64'},
+    'start': {'dtype': 'datetime64[ns]'},
+    'end': {'dtype': 'datetime64[ns]'},
+    'readings_count': {'dtype': 'int64', 'min': 1},
+    'panels_reporting_max': {'dtype': 'int64', 'min': 0},
+    'panels_lost': {'dtype': 'int64', 'min': 0},
+}
+
+# Expected spec of each validated stage output, by FILEPATHS key
+TABLE_SPECS = {
+    'cleaned_unpartitioned': CLEANED_UNPARTITIONED_SPEC,
+    'installations_preprocessed': INSTALLATIONS_PREPROCESSED_SPEC,
+    'readings_preprocessed': READINGS_PREPROCESSED_SPEC,
+    'installations_feature_engineered': INSTALLATIONS_FEATURE_ENGINEERED_SPEC,
+    'readings_feature_engineered': READINGS_FEATURE_ENGINEERED_SPEC,
+    'installation_daily': INSTALLATION_DAILY_SPEC,
+    'community_daily': COMMUNITY_ROLLUP_SPEC,
+    'community_hourly': COMMUNITY_ROLLUP_SPEC,
+    'reporting_intervals': REPORTING_INTERVALS_SPEC,
+}
+
+# Functions returning the spec of columns that pipeline modules add to a stage output, by FILEPATHS key. They are
+# called on each validation, so that their configuration is read when it is needed rather than at import
+_registered_columns: dict[str, list[Callable[[], dict]]] = {}
+
+def register_columns(key: str, columns_spec: Callable[[], dict]) -> None:
+    """Add the columns of the spec returned by columns_spec to the expected spec of the stage output FILEPATHS[key]."""
+    _registered_columns.setdefault(key, []).append(columns_spec)
+
+def table_spec(key: str) -> dict:
+    """Return the expected spec of the stage output FILEPATHS[key], with the columns registered for it."""
+    spec = dict(TABLE_SPECS[key])
+    for columns_spec in _registered_columns.get(key, []):
+        spec.update(columns_spec())
+    return spec
+
+def _check_columns(columns: set[str], expected_spec: dict) -> None:
+    """Raise if columns are not exactly the columns of expected_spec."""
     expected_columns = set(expected_spec.keys())
-    missing = expected_columns - set(df.columns)
-    extra = set(df.columns) - expected_columns
+    missing = expected_columns - columns
+    extra = columns - expected_columns
     if missing:
         raise KeyError(f'Missing columns: {missing}')
     if extra:
         raise ValueError(f'Unexpected columns: {extra}')
 
+def _column_values(column: pd.Series) -> tuple[np.ndarray, object]:
+    """Return a numpy array of column for the blockwise checks, and the value marking nulls in it."""
+    dtype = column.dtype
+    if isinstance(dtype, pd.CategoricalDtype):
+        return column.cat.codes.to_numpy(), -1
+    values = column.to_numpy()
+    if values.dtype.kind == 'M':
+        return values.view(np.int64), np.iinfo(np.int64).min
+    if values.dtype.kind == 'f':
+        return values, np.nan
+    if values.dtype.kind in 'iub':
+        return values, None
+    return values, pd.NA
+
+def _count_invalid(values: np.ndarray, null_value: object, check_nulls: bool, min_val) -> tuple[int, int]:
+    """Count null values and values below min_val in one pass over values, a block at a time."""
+    if null_value is None:
+        check_nulls = False
+
+    nulls, below = 0, 0
+    for start in range(0, len(values), VALIDATION_BLOCK_ROWS):
+        block = values[start:start + VALIDATION_BLOCK_ROWS]
+        if check_nulls:
+            if null_value is pd.NA:
+                nulls += int(pd.isna(block).sum())
+            elif isinstance(null_value, float):
+                nulls += np.count_nonzero(np.isnan(block))
+            else:
+                nulls += np.count_nonzero(block == null_value)
+        if min_val is not None:
+            # NaN compares False, so nulls are never also counted as below the minimum
+            below += np.count_nonzero(block < min_val)
+
+    return nulls, below
+
+def _sample_positions(num_rows: int) -> np.ndarray | None:
+    """Return the row positions to check in sample mode, or None to check every row."""
+    sample_rows = VALIDATION.get('sample_rows', 100_000)
+    if VALIDATION.get('mode', 'full') != 'sample' or num_rows <= sample_rows:
+        return None
+    # Stage outputs are sorted by installation and timestamp, so evenly spaced rows span every part of the table
+    return np.linspace(0, num_rows - 1, sample_rows, dtype=np.int64)
+
+def validate_dataframe(df: pd.DataFrame, expected_spec: dict) -> None:
+    """Check df against expected_spec, over validation.sample_rows rows in sample mode, raising with the number of offending rows."""
+    _check_columns(set(df.columns), expected_spec)
+    positions = _sample_positions(len(df))
+    checked = 'rows' if positions is None else 'sampled rows'
+
     for col, spec in expected_spec.items():
-        dtype, allow_null, min_val = spec.get('dtype'), spec.get('allow_null', False), spec.get('min', None)
+        dtype, allow_null, min_val = column_dtype(col, spec.get('dtype')), spec.get('allow_null', False), spec.get('min', None)
+        unique = spec.get('unique', False)
         if df[col].dtype != dtype:
             raise TypeError(f'{col} must be {dtype} dtype')
-        if not allow_null and df[col].isnull().any():
-            raise ValueError(f'{col} contains null values')
-        if min_val is not None and (df[col] < min_val).any():
-            raise ValueError(f'{col} must be >= {min_val}')
+
+        values, null_value = _column_values(df[col])
+        if positions is not None:
+            values = values[positions]
+
+        nulls, below = _count_invalid(values, null_value, check_nulls=not allow_null, min_val=min_val)
+        if nulls:
+            raise ValueError(f'{col} contains null values ({nulls} {checked})')
+        if below:
+            raise ValueError(f'{col} must be >= {min_val} ({below} {checked} below)')
+
+        if unique:
+            column = df[col] if positions is None else df[col].iloc[positions]
+            if not column.is_unique:
+                raise ValueError(f'{col} contains duplicate values ({column.duplicated().sum()} {checked})')
+
+def _arrow_type_matches(arrow_type: pa.DataType, dtype: str) -> bool:
+    """Return True if parquet columns of arrow_type load as pandas dtype."""
+    if dtype == 'category':
+        return pa.types.is_dictionary(arrow_type) or pa.types.is_string(arrow_type) or pa.types.is_large_string(arrow_type)
+    return arrow_type == pa.from_numpy_dtype(np.dtype(dtype))
+
+def _scan_statistics(dataset: ds.Dataset, spec: dict) -> tuple[dict[str, int], dict[str, int]]:
+    """Return the nulls and the values below their minimum of each column in spec, counted over its data one batch at a time."""
+    nulls, below = dict.fromkeys(spec, 0), dict.fromkeys(spec, 0)
+    for batch in dataset.to_batches(columns=list(spec)):
+        for col, col_spec in spec.items():
+            column = batch.column(col)
+            if not col_spec.get('allow_null', False):
+                nulls[col] += column.null_count
+            if col_spec.get('min') is not None:
+                below[col] += pc.sum(pc.less(column, col_spec['min'])).as_py() or 0
+    return nulls, below
+
+def _row_group_statistics(dataset: ds.Dataset, spec: dict) -> tuple[dict[str, int], set[str]]:
+    """Return the nulls of each column in spec from row group statistics, and the columns they cannot settle."""
+    nulls, unsettled = dict.fromkeys(spec, 0), set()
+    for fragment in dataset.get_fragments():
+        metadata = fragment.metadata
+        for i in range(metadata.num_row_groups):
+            row_group = metadata.row_group(i)
+            statistics = {row_group.column(j).path_in_schema: row_group.column(j).statistics for j in range(row_group.num_columns)}
+            for col, col_spec in spec.items():
+                stats, check_nulls, min_val = statistics.get(col), not col_spec.get('allow_null', False), col_spec.get('min')
+                if stats is None or (check_nulls and not stats.has_null_count) or (min_val is not None and not stats.has_min_max):
+                    unsettled.add(col)
+                    continue
+                if check_nulls:
+                    nulls[col] += stats.null_count
+                # The minimum of a row group does not tell how many of its rows are below min_val
+                if min_val is not None and stats.min < min_val:
+                    unsettled.add(col)
+    return nulls, unsettled
+
+def validate_parquet_statistics(key: str) -> None:
+    """Check the stage output FILEPATHS[key] against its spec from parquet statistics, reading the columns they cannot settle."""
+    spec = table_spec(key)
+    dataset = open_dataset(key)
+    schema = dataset.schema
+    _check_columns({name for name in schema.names if name not in DERIVED_PARTITION_COLUMNS}, spec)
+
+    for col, col_spec in spec.items():
+        dtype = column_dtype(col, col_spec['dtype'])
+        if not _arrow_type_matches(schema.field(col).type, dtype):
+            raise TypeError(f'{col} must be {dtype} dtype')
+
+    checked = {col: col_spec for col, col_spec in spec.items() if not col_spec.get('allow_null', False) or col_spec.get('min') is not None}
+    if storage_format() == 'arrow':
+        nulls, below = _scan_statistics(dataset, checked)
+    else:
+        nulls, unsettled = _row_group_statistics(dataset, checked)
+        below = dict.fromkeys(checked, 0)
+        if unsettled:
+            scanned_nulls, scanned_below = _scan_statistics(dataset, {col: checked[col] for col in unsettled})
+            nulls.update(scanned_nulls)
+            below.update(scanned_below)
+
+    for col in checked:
+        if nulls[col]:
+            raise ValueError(f'{col} contains null values ({nulls[col]} rows)')
+        if below[col]:
+            raise ValueError(f"{col} must be >= {checked[col]['min']} ({below[col]} rows below)")
 
 @ensure_dataframe
 def validate_cleaned_unpartitioned(cleaned_unpartitioned: pd.DataFrame) -> None:
-    spec = {
-        'installation_id': {'dtype': 'int64'},
-        'panels_reporting': {'dtype': 'int64', 'min': 0},
-        'community': {'dtype': 'category'},
-        'timestamp': {'dtype': 'datetime64[ns]'},
-        'avg_power_watts_5min': {'dtype': 'float64', 'min': 0},
-    }
-    validate_dataframe(cleaned_unpartitioned, spec)
+    validate_dataframe(cleaned_unpartitioned, CLEANED_UNPARTITIONED_SPEC)
 
 @ensure_dataframe
 def validate_installations_preprocessed(installations_preprocessed: pd.DataFrame) -> None:
-    spec = {
-        'installation_id': {'dtype': 'int64'},
-        'panels_reporting': {'dtype': 'int64', 'min': 0},
-        'community': {'dtype': 'category'},
-    }
-    validate_dataframe(installations_preprocessed, spec)
+    validate_dataframe(installations_preprocessed, INSTALLATIONS_PREPROCESSED_SPEC)
 
 @ensure_dataframe
 def validate_readings_preprocessed(readings_preprocessed: pd.DataFrame) -> None:
-    spec = {
-        'installation_id': {'dtype': 'int64'},
-        'timestamp': {'dtype': 'datetime64[ns]'},
-        'avg_power_watts_5min': {'dtype': 'float64', 'min': 0},
-    }
-    validate_dataframe(readings_preprocessed, spec)
+    validate_dataframe(readings_preprocessed, READINGS_PREPROCESSED_SPEC)
 
 @ensure_dataframe
 def validate_installations_feature_engineered(installations_feature_engineered: pd.DataFrame) -> None:
-    spec = {
-        'installation_id': {'dtype': 'int64'},
-        'community': {'dtype': 'category'},
-        'panels_reporting_max': {'dtype': 'int64', 'min': 0},
-        'panels_reporting_efficiency': {'dtype': 'float64', 'min': 0},
-        'panels_reporting_avg': {'dtype': 'float64', 'min': 0},
-    }
-    validate_dataframe(installations_feature_engineered, spec)
+    validate_dataframe(installations_feature_engineered, INSTALLATIONS_FEATURE_ENGINEERED_SPEC)
 
 @ensure_dataframe
 def validate_readings_feature_engineered(readings_feature_engineered: pd.DataFrame) -> None:
-    spec = {
-        'installation_id': {'dtype': 'int64'},
-        'timestamp': {'dtype': 'datetime64[ns]'},
-        'avg_power_watts_5min': {'dtype': 'float64', 'min': 0},
-        'energy_prod_wh_5min': {'dtype': 'float64', 'min': 0},
-    }
-    validate_dataframe(readings_feature_engineered, spec)
+    validate_dataframe(readings_feature_engineered, table_spec('readings_feature_engineered'))
+
+@ensure_dataframe
+def validate_installation_daily(installation_daily: pd.DataFrame) -> None:
+    validate_dataframe(installation_daily, INSTALLATION_DAILY_SPEC)
+
+@ensure_dataframe
+def validate_community_rollup(community_rollup: pd.DataFrame) -> None:
+    validate_dataframe(community_rollup, COMMUNITY_ROLLUP_SPEC)
+
+@ensure_dataframe
+def validate_reporting_intervals(reporting_intervals: pd.DataFrame) -> None:
+    validate_dataframe(reporting_intervals, REPORTING_INTERVALS_SPEC)
@@ -0,0 +1,77 @@
+"""Fixtures running the pipeline in temporary projects, each with its own config.json and synthetic raw csv."""
+import json
+import os
+import sys
+from pathlib import Path
+
+import pandas as pd
+import pytest
+
+from core.utils import communities, config, paths
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(REPO_ROOT / 'benchmarks'))
+
+from synthetic_data import generate_readings, write_readings_csv  # noqa: E402
+
+# Stages run by the tests, leaving out the EDA figures
+DATA_STAGES = ['preprocessing', 'feature_engineering', 'reporting_index']
+
+def use_project(root: Path | None) -> None:
+    """Resolve paths and configuration from the project at root, or from the repository if root is None."""
+    if root is None:
+        os.environ.pop(paths.ROOT_VARIABLE, None)
+    else:
+        os.environ[paths.ROOT_VARIABLE] = str(root)
+    paths.project_root.cache_clear()
+    config.get_config.cache_clear()
+    config.get_section.cache_clear()
+    communities._cached_dtype = (None, pd.CategoricalDtype([]))
+
+    from core.query import clear_cache
+    clear_cache()
+
+def write_raw_csv(readings: pd.DataFrame) -> None:
+    """Write readings, in the layout of generate_readings, as the raw csv of the current project."""
+    path = paths.from_root(config.FILEPATHS['raw_csv'])
+    path.parent.mkdir(parents=True, exist_ok=True)
+    write_readings_csv(readings, str(path))
+
+def run_stages(only: list[str] | None = None) -> None:
+    """Run the stages named in only, by default every stage but the EDA figures, in the current project."""
+    from core.main import main
+
+    main(only=only or DATA_STAGES)
+
+def sorted_for_comparison(df: pd.DataFrame) -> pd.DataFrame:
+    """Return df sorted by its keys, with categorical columns compared by value."""
+    df = df.astype({col: 'object' for col in df.columns if isinstance(df[col].dtype, pd.CategoricalDtype)})
+    keys = [col for col in ('installation_id', 'timestamp', 'community', 'start') if col in df.columns]
+    return df.sort_values(keys or list(df.columns), kind='stable', ignore_index=True)
+
+def load_outputs(keys: list[str]) -> dict[str, pd.DataFrame]:
+    """Return the stage outputs keys of the current project, sorted for comparison."""
+    from core.utils.storage import load_table
+
+    return {key: sorted_for_comparison(load_table(key)) for key in keys}
+
+@pytest.fixture
+def readings() -> pd.DataFrame:
+    """Synthetic raw readings of 6 installations over 6 days."""
+    return generate_readings(installations=6, days=6, start='2021-02-10', seed=1)
+
+@pytest.fixture
+def make_project(tmp_path):
+    """Return a function switching to a new project under tmp_path, its config.json sections patched by overrides."""
+    def make(name: str = 'project', **overrides: dict) -> Path:
+        root = tmp_path / name
+        root.mkdir()
+        project_config = json.loads((REPO_ROOT / 'config.json').read_text())
+        for section, values in overrides.items():
+            project_config[section].update(values)
+        (root / 'config.json').write_text(json.dumps(project_config, indent=4))
+        use_project(root)
+        return root
+
+    yield make
+    use_project(None)
@@ -0,0 +1,27 @@
+"""The duckdb backend builds the same stage outputs as the pandas reference backend."""
+import pytest
+
+from conftest import write_raw_csv
+from core.utils.instrumentation import RUN_ID_VARIABLE, load_report, report_path
+
+pytest.importorskip('duckdb')
+
+@pytest.mark.parametrize('compact, time_features', [
+    (False, None),
+    (True, None),
+    (False, {}),
+])
+def test_duckdb_matches_pandas(make_project, readings, monkeypatch, compact, time_features):
+    from core.pipeline.duckdb_backend import compare_backends
+
+    monkeypatch.setenv(RUN_ID_VARIABLE, 'compare-backends')
+    # Time features of the repository config unless overridden
+    feature_engineering = {} if time_features is None else {'time_features': time_features}
+    make_project(schema={'compact': compact}, feature_engineering=feature_engineering)
+    write_raw_csv(readings)
+
+    # Raises AssertionError naming the first output that differs
+    compare_backends()
+
+    names = set(load_report(report_path()).name)
+    assert {'core.pipeline.duckdb_backend.preprocess_duckdb', 'core.pipeline.duckdb_backend.build_readings_features_duckdb'} <= names
@@ -0,0 +1,52 @@
+"""The pyarrow and c csv parsers preprocess the raw csv to the same outputs."""
+import pandas as pd
+import pytest
+
+from conftest import load_outputs, run_stages, write_raw_csv
+from core.utils.config import FILEPATHS
+from core.utils.paths import from_root
+from core.utils.storage import load_table
+
+# Preprocessed outputs compared between parsers; the raw snapshot keeps the parsers' own dtypes
+PREPROCESSED_KEYS = [
+    'cleaned_unpartitioned',
+    'installations_preprocessed',
+    'readings_preprocessed',
+    'installation_communities',
+    'installation_watermarks',
+    'community_codes',
+]
+
+def blank_cells(column: str, lines: range) -> None:
+    """Empty the cells of column in lines of the raw csv of the current project."""
+    path = from_root(FILEPATHS['raw_csv'])
+    rows = path.read_text().splitlines()
+    position = rows[0].split(',').index(f'"{column}"')
+    for line in lines:
+        cells = rows[line].split(',')
+        cells[position] = ''
+        rows[line] = ','.join(cells)
+    path.write_text('\n'.join(rows) + '\n')
+
+def test_blank_timestamps_are_dropped(make_project, readings):
+    outputs = {}
+    for engine in ('pyarrow', 'c'):
+        make_project(engine, preprocessing={'csv_engine': engine})
+        write_raw_csv(readings)
+        blank_cells('DATE', range(1, 4))
+        run_stages(['preprocessing'])
+        outputs[engine] = load_outputs(PREPROCESSED_KEYS)
+
+    assert len(outputs['pyarrow']['readings_preprocessed']) == len(readings) - 3
+    for key in PREPROCESSED_KEYS:
+        pd.testing.assert_frame_equal(outputs['pyarrow'][key], outputs['c'][key], check_like=True, obj=key)
+
+@pytest.mark.parametrize('engine', ['pyarrow', 'c'])
+def test_blank_communities_are_rejected(make_project, readings, engine):
+    make_project(engine, preprocessing={'csv_engine': engine})
+    write_raw_csv(readings)
+    blank_cells('COMMUNITY_NAME', range(1, 4))
+
+    with pytest.raises(ValueError, match='community contains null values'):
+        run_stages(['preprocessing'])
+    assert not from_root(FILEPATHS['community_codes']).exists() or '' not in load_table('community_codes')['name'].tolist()
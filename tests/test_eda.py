@@ -0,0 +1,26 @@
+"""EDA plots of the community daily rollup."""
+import pandas as pd
+
+from core.pipeline.exploratory_data_analysis import (
+    plot_panels_reporting_over_time,
+    plot_total_energy_production_over_time,
+)
+from core.utils.config import FILEPATHS
+from core.utils.paths import from_root
+
+def test_plots_save_their_figure_and_return_daily_sums(make_project):
+    make_project()
+    community_daily = pd.DataFrame({
+        'community': ['Halifax', 'Bedford', 'Halifax'],
+        'timestamp': pd.to_datetime(['2021-02-10', '2021-02-10', '2021-02-11']),
+        'active_panels': [10, 5, 12],
+        'energy_prod_wh': [2_000_000.0, 1_000_000.0, 4_000_000.0],
+    })
+
+    panels = plot_panels_reporting_over_time(community_daily, save=True)
+    energy = plot_total_energy_production_over_time(community_daily)
+
+    assert panels['panels_reporting'].tolist() == [15, 12]
+    assert energy['energy_prod_mwh'].tolist() == [3.0, 4.0]
+    assert from_root(FILEPATHS['panels_reporting']).exists()
+    assert not from_root(FILEPATHS['energy_production']).exists()
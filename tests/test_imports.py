@@ -0,0 +1,46 @@
+"""Importing the pipeline reads no configuration, and core.utils does not depend on core.pipeline."""
+import subprocess
+import sys
+
+from conftest import REPO_ROOT
+
+MODULES = [
+    'core.main',
+    'core.query',
+    'core.server',
+    'core.pipeline.data_preprocessing',
+    'core.pipeline.feature_engineering',
+    'core.pipeline.reporting_index',
+    'core.pipeline.exploratory_data_analysis',
+    'core.utils.validation',
+]
+
+def run_python(code: str) -> str:
+    """Run code in a fresh interpreter and return its output."""
+    return subprocess.run(
+        [sys.executable, '-c', code],
+        check=True,
+        capture_output=True,
+        text=True,
+        cwd=REPO_ROOT,
+        env={'PYTHONPATH': str(REPO_ROOT / 'src')},
+    ).stdout.strip()
+
+def test_imports_read_no_configuration():
+    loaded = run_python(
+        f'import importlib\n'
+        f'for module in {MODULES!r}:\n'
+        f'    importlib.import_module(module)\n'
+        f'from core.utils.config import get_config\n'
+        f'print(get_config.cache_info().currsize)'
+    )
+    assert loaded == '0'
+
+def test_utils_do_not_import_pipeline():
+    imported = run_python(
+        'import importlib, pkgutil, sys, core.utils\n'
+        'for module in pkgutil.iter_modules(core.utils.__path__):\n'
+        '    importlib.import_module(f"core.utils.{module.name}")\n'
+        'print(sorted(name for name in sys.modules if name.startswith("core.pipeline")))'
+    )
+    assert imported == '[]'
@@ -0,0 +1,50 @@
+"""An incremental run appending new readings builds the same stage outputs as a full build over every reading."""
+import pandas as pd
+import pytest
+
+from conftest import load_outputs, run_stages, write_raw_csv
+
+# Time the first raw csv is cut at, partway through a day and through the last rolling window of the readings before it
+CUT = pd.Timestamp('2021-02-15 13:02')
+
+# Stage outputs compared; community codes are numbered in order of appearance by incremental runs, and the raw
+# parquet is a snapshot of the last full build's csv
+COMPARED_KEYS = [
+    'cleaned_unpartitioned',
+    'installations_preprocessed',
+    'readings_preprocessed',
+    'installation_communities',
+    'installation_watermarks',
+    'installations_feature_engineered',
+    'readings_feature_engineered',
+    'installations_running_stats',
+    'installation_daily',
+    'community_daily',
+    'community_hourly',
+    'reporting_intervals',
+]
+
+@pytest.mark.parametrize('overrides', [
+    {},
+    {'schema': {'compact': True}, 'preprocessing': {'csv_engine': 'c'}},
+    {'backend': {'name': 'duckdb'}},
+], ids=['default', 'compact-c', 'duckdb'])
+def test_incremental_matches_full_build(make_project, readings, overrides):
+    if overrides.get('backend', {}).get('name') == 'duckdb':
+        pytest.importorskip('duckdb')
+    from core.main import update
+
+    make_project('full', **overrides)
+    write_raw_csv(readings)
+    run_stages()
+    full = load_outputs(COMPARED_KEYS)
+
+    make_project('incremental', **overrides)
+    write_raw_csv(readings[readings['timestamp'] < CUT])
+    run_stages()
+    write_raw_csv(readings)
+    update()
+    incremental = load_outputs(COMPARED_KEYS)
+
+    for key in COMPARED_KEYS:
+        pd.testing.assert_frame_equal(incremental[key], full[key], check_like=True, check_exact=True, obj=key)
@@ -0,0 +1,13 @@
+"""Run reports record the stage steps, not every dataframe helper."""
+from conftest import run_stages, write_raw_csv
+from core.utils.instrumentation import RUN_ID_VARIABLE, load_report, report_path
+
+def test_run_report_records_stage_steps(make_project, readings, monkeypatch):
+    monkeypatch.setenv(RUN_ID_VARIABLE, 'test-run')
+    make_project()
+    write_raw_csv(readings)
+    run_stages()
+
+    names = set(load_report(report_path()).name.str.rsplit('.', n=1).str[-1])
+    assert {'main', 'preprocess', 'clean_solar_data', 'build_feature_dataset', 'build_readings_features', 'build_reporting_intervals'} <= names
+    assert not {'drop_unused_columns', 'merge_installation_communities', 'daily_panels_reporting'} & names
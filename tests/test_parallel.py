@@ -0,0 +1,35 @@
+"""Stages sharded over worker processes, started from the threads of the stage runner, build the serial outputs."""
+import pandas as pd
+
+from conftest import load_outputs, run_stages, write_raw_csv
+from core.utils.config import FILEPATHS
+from core.utils.paths import from_root
+
+# Outputs written by the sharded preprocessing and feature engineering paths
+SHARDED_KEYS = [
+    'cleaned_unpartitioned',
+    'installations_preprocessed',
+    'readings_preprocessed',
+    'installations_feature_engineered',
+    'readings_feature_engineered',
+    'installation_daily',
+    'community_daily',
+    'community_hourly',
+    'reporting_intervals',
+]
+
+def test_worker_processes_match_serial_build(make_project, readings):
+    outputs = {}
+    for workers in (1, 2):
+        make_project(f'workers-{workers}', parallel={'workers': workers}, figures={'workers': workers})
+        write_raw_csv(readings)
+        # Every stage, so that figures are rendered in worker processes too
+        run_stages(['preprocessing', 'feature_engineering', 'reporting_index', 'eda'])
+        outputs[workers] = load_outputs(SHARDED_KEYS)
+
+        # Worker processes write into this project rather than the one config.json of the repository points at
+        assert from_root(FILEPATHS['panels_reporting']).exists()
+        assert from_root(FILEPATHS['energy_production']).exists()
+
+    for key in SHARDED_KEYS:
+        pd.testing.assert_frame_equal(outputs[2][key], outputs[1][key], check_like=True, check_exact=True, obj=key)
@@ -0,0 +1,138 @@
+"""Queries over the stage outputs, their result cache, and the HTTP service answering them."""
+import json
+import threading
+import urllib.error
+import urllib.request
+
+import pandas as pd
+import pytest
+
+from conftest import run_stages, write_raw_csv
+from core.query import cache_info, energy_production, installation_efficiency, top_installations
+from core.utils.cache import output_fingerprint, record_stage
+from core.utils.storage import load_table
+
+# Time the raw csv of built_project is cut at, so that tests can append the readings after it
+CUT = pd.Timestamp('2021-02-14')
+
+@pytest.fixture
+def built_project(make_project, readings):
+    """A project built from the readings before CUT, with a result cache of 2 queries."""
+    make_project(query={'cache_size': 2})
+    write_raw_csv(readings[readings['timestamp'] < CUT])
+    run_stages()
+
+def test_energy_production_sums_daily_rollup(built_project):
+    community_daily = load_table('community_daily')
+    halifax = community_daily[community_daily['community'] == 'Halifax']
+
+    monthly = energy_production(communities=['Halifax'], freq='MS')
+
+    assert monthly['community'].astype(str).unique().tolist() == ['Halifax']
+    assert monthly['energy_prod_wh'].sum() == pytest.approx(halifax['energy_prod_wh'].sum())
+    assert monthly['readings_count'].sum() == halifax['readings_count'].sum()
+
+def test_top_installations_are_ranked(built_project):
+    top = top_installations(n=3)
+    efficiency = installation_efficiency()
+
+    assert top['rank'].tolist() == [1, 2, 3]
+    assert top['energy_prod_wh'].is_monotonic_decreasing
+    assert set(top['installation_id']) <= set(efficiency['installation_id'])
+    with pytest.raises(ValueError, match='cannot be restricted to a period'):
+        top_installations(by='panels_reporting_avg', start='2021-02-11')
+
+def test_results_are_cached_until_evicted(built_project):
+    first = energy_production(freq='D')
+    first['energy_prod_wh'] = -1.0
+    assert (energy_production(freq='D')['energy_prod_wh'] >= 0).all()
+    assert cache_info() == {'size': 1, 'hits': 1, 'misses': 1}
+
+    # A cache of 2 results evicts the least recently used
+    energy_production(freq='h')
+    energy_production(freq='MS')
+    energy_production(freq='D')
+    assert cache_info() == {'size': 2, 'hits': 1, 'misses': 4}
+
+def test_results_are_invalidated_by_appends(built_project, readings):
+    from core.main import update
+
+    before = energy_production(freq='D')
+    write_raw_csv(readings)
+    update()
+    after = energy_production(freq='D')
+
+    assert cache_info()['misses'] == 2
+    assert after['timestamp'].max() > before['timestamp'].max()
+
+def test_builds_recorded_within_one_second_change_fingerprint(built_project):
+    fingerprints = []
+    for _ in range(2):
+        record_stage('feature_engineering', 'unchanged inputs', ['community_daily'])
+        fingerprints.append(output_fingerprint(['community_daily']))
+
+    assert None not in fingerprints and fingerprints[0] != fingerprints[1]
+
+@pytest.fixture
+def server():
+    """Serve queries on a free local port and return a function getting a path: its status and decoded JSON body."""
+    from http.server import ThreadingHTTPServer
+
+    from core.server import QueryHandler
+
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), QueryHandler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+
+    def get(path: str) -> tuple[int, object]:
+        try:
+            with urllib.request.urlopen(f'http://127.0.0.1:{httpd.server_address[1]}{path}') as response:
+                return response.status, json.load(response)
+        except urllib.error.HTTPError as e:
+            return e.code, json.load(e)
+
+    yield get
+    httpd.shutdown()
+    httpd.server_close()
+
+def test_server_routes(built_project, server):
+    status, records = server('/energy?community=Halifax&community=Bedford&freq=MS')
+    assert status == 200
+    assert {record['community'] for record in records} <= {'Halifax', 'Bedford'}
+
+    status, records = server('/efficiency?installation_id=1001&installation_id=1002')
+    assert status == 200
+    assert [record['installation_id'] for record in records] == [1001, 1002]
+
+    assert server('/top?n=2')[0] == 200
+    assert server('/cache') == (200, cache_info())
+
+@pytest.mark.parametrize('path, status', [
+    ('/energy?freq=X', 400),
+    ('/top?n=x', 400),
+    ('/top?n=1&n=2', 400),
+    ('/top?foo=1', 400),
+    ('/nope', 404),
+])
+def test_server_rejects_bad_requests(built_project, server, path, status):
+    code, body = server(path)
+    assert code == status
+    assert 'error' in body
+
+def test_server_unavailable_before_build(make_project, server):
+    make_project()
+
+    code, body = server('/top')
+    assert code == 503
+    assert 'not been built' in body['error']
+
+def test_server_reports_query_failures(make_project, server, monkeypatch):
+    import core.server
+
+    make_project()
+    def fail(**arguments):
+        raise KeyError('community')
+    monkeypatch.setitem(core.server.ROUTES, '/top', (fail, core.server.ROUTES['/top'][1]))
+
+    code, body = server('/top')
+    assert code == 500
+    assert body == {'error': 'Query failed: KeyError'}
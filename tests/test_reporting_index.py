@@ -0,0 +1,45 @@
+"""Reporting intervals and the queries over them."""
+import numpy as np
+import pandas as pd
+import pytest
+
+from core.pipeline.reporting_index import build_reporting_intervals, reporting_completeness
+from core.pipeline.time_features import is_daylight
+
+def daylight_readings(installation_id: int, start: str, days: int) -> pd.DataFrame:
+    """Readings of an installation at every daylight 5-minute slot of days days from start."""
+    slots = pd.date_range(start, periods=days * 288, freq='5min').to_numpy()
+    timestamps = slots[is_daylight(slots)]
+    return pd.DataFrame({'installation_id': installation_id, 'timestamp': timestamps, 'panels_reporting': 10})
+
+def test_completeness_counts_daylight_slots(make_project):
+    make_project()
+    complete = daylight_readings(1, '2021-06-01', days=3)
+    # The second installation misses the first hour of daylight on the second day
+    second_day = daylight_readings(2, '2021-06-02', days=1)['timestamp']
+    missed = second_day.iloc[:12].to_numpy()
+    partial = complete.assign(installation_id=2)
+    partial = partial[~np.isin(partial['timestamp'].to_numpy(), missed)]
+
+    intervals = build_reporting_intervals(pd.concat([complete, partial], ignore_index=True))
+    installations = pd.DataFrame({'installation_id': [1, 2], 'community': pd.Categorical(['Halifax', 'Bedford'])})
+    completeness = reporting_completeness(intervals, installations).set_index('community')
+
+    assert completeness.loc['Halifax', 'completeness'] == 1.0
+    assert completeness.loc['Halifax', 'expected_slots'] == len(complete)
+    assert completeness.loc['Bedford', 'completeness'] == pytest.approx((len(complete) - 12) / len(complete))
+
+def test_completeness_runs_around_the_clock_without_location(make_project):
+    make_project(feature_engineering={'time_features': {}})
+    readings = pd.DataFrame({
+        'installation_id': 1,
+        'timestamp': pd.date_range('2021-06-01', '2021-06-03', freq='5min', inclusive='left'),
+        'panels_reporting': 10,
+    })
+    intervals = build_reporting_intervals(readings.drop(index=range(100, 110)))
+    installations = pd.DataFrame({'installation_id': [1], 'community': pd.Categorical(['Halifax'])})
+
+    completeness = reporting_completeness(intervals, installations)
+
+    assert completeness['expected_slots'].tolist() == [576]
+    assert completeness['reported_slots'].tolist() == [566]
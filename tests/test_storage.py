@@ -0,0 +1,46 @@
+"""Appending chunks to stage outputs."""
+import pandas as pd
+import pytest
+
+from conftest import sorted_for_comparison
+from core.utils.communities import register_communities
+from core.utils.storage import ParquetAppender, load_table, table_path
+
+def chunk(communities: list[str], day: str) -> pd.DataFrame:
+    """Readings of one installation per community on day, with community categories of only those communities."""
+    return pd.DataFrame({
+        'installation_id': range(len(communities)),
+        'timestamp': pd.Timestamp(day),
+        'community': pd.Categorical(communities),
+        'panels_reporting': 1,
+    })
+
+@pytest.mark.parametrize('storage_format', ['parquet', 'arrow'])
+def test_appended_chunks_are_merged_per_partition(make_project, storage_format):
+    make_project(storage={'format': storage_format, 'partitioning': {'cleaned_unpartitioned': ['year', 'month']}})
+    # Few categories are indexed by int8 and many by int16, so chunks differ in their arrow dictionary types
+    chunks = [
+        chunk(['Halifax', 'Bedford'], '2021-01-05'),
+        chunk([f'Community {i}' for i in range(300)], '2021-01-06'),
+        chunk(['Halifax'], '2021-02-01'),
+    ]
+    table_path('cleaned_unpartitioned').parent.mkdir(parents=True)
+    for df in chunks:
+        register_communities(df['community'].cat.categories)
+
+    with ParquetAppender('cleaned_unpartitioned') as appender:
+        for df in chunks:
+            appender.append(df)
+
+    data_files = sorted(path.relative_to(table_path('cleaned_unpartitioned')).as_posix()
+                        for path in table_path('cleaned_unpartitioned').rglob('part-*'))
+    suffix = table_path('cleaned_unpartitioned').suffix
+    assert data_files == [f'year=2021/month=1/part-0-0{suffix}', f'year=2021/month=2/part-2-0{suffix}']
+
+    expected = pd.concat(chunks, ignore_index=True)
+    pd.testing.assert_frame_equal(
+        sorted_for_comparison(load_table('cleaned_unpartitioned')),
+        sorted_for_comparison(expected),
+        check_like=True,
+        check_dtype=False,
+    )
@@ -0,0 +1,7 @@
+"""The synthetic raw readings used by the benchmarks and tests are shaped like the raw csv."""
+from synthetic_data import generate_readings
+
+def test_readings_are_unique_by_installation_and_timestamp():
+    readings = generate_readings(installations=20, days=10, seed=2)
+
+    assert not readings.duplicated(['SYSTEM_ID', 'timestamp']).any()
@@ -0,0 +1,12 @@
+"""Time feature columns and their validation spec follow the configuration in effect."""
+from core.pipeline.time_features import time_feature_columns
+from core.utils.validation import table_spec
+
+def test_time_features_follow_config_in_effect(make_project):
+    make_project('lags', feature_engineering={'time_features': {'lags': {'panels_reporting': ['1h']}}})
+    assert list(time_feature_columns()) == ['panels_reporting_lag_1h']
+
+    make_project('gaps', feature_engineering={'time_features': {'gap_threshold': '10min'}})
+    assert list(time_feature_columns()) == ['gap_before']
+    assert 'gap_before' in table_spec('readings_feature_engineered')
+    assert 'panels_reporting_lag_1h' not in table_spec('readings_feature_engineered')
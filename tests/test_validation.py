@@ -0,0 +1,46 @@
+"""Validating stage outputs from parquet statistics."""
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+
+from core.utils.storage import table_path
+from core.utils.validation import validate_parquet_statistics
+
+KEY = 'installations_feature_engineered'
+
+def write_installations(efficiency: list[float], **write_options) -> None:
+    """Write installations with the given panels_reporting_efficiency as the parquet of KEY."""
+    installations = pd.DataFrame({
+        'installation_id': range(len(efficiency)),
+        'community': 'Halifax',
+        'panels_reporting_max': 10,
+        'panels_reporting_efficiency': efficiency,
+        'panels_reporting_avg': 5.0,
+    })
+    path = table_path(KEY)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    pq.write_table(pa.Table.from_pandas(installations, preserve_index=False), path, **write_options)
+
+@pytest.fixture
+def project(make_project):
+    make_project(storage={'format': 'parquet'})
+
+@pytest.mark.parametrize('write_options', [{}, {'write_statistics': False}])
+def test_nulls_are_found_with_or_without_statistics(project, write_options):
+    write_installations([0.5, float('nan'), 0.7], **write_options)
+
+    with pytest.raises(ValueError, match=r'panels_reporting_efficiency contains null values \(1 rows\)'):
+        validate_parquet_statistics(KEY)
+
+def test_values_below_minimum_are_counted_by_row(project):
+    # The first row group holds one value below the minimum, and the second none
+    write_installations([0.5, -0.1, 0.7, 0.8, 0.9, 1.0], row_group_size=3)
+
+    with pytest.raises(ValueError, match=r'panels_reporting_efficiency must be >= 0 \(1 rows below\)'):
+        validate_parquet_statistics(KEY)
+
+def test_valid_output_without_statistics_passes(project):
+    write_installations([0.5, 0.6, 0.7], write_statistics=False)
+
+    validate_parquet_statistics(KEY)